@@ -7,10 +7,13 @@ import questionary
 
 import app.services.output_manager.help_page as dataset_help
 import app.services.output_manager.message_handler as message_handler
+from app.commands.transfer_options import limit_rate_option
 from app.configs.app_config import AppConfig
+from app.services.clients.bandwidth_limiter import BandwidthLimiter
 from app.services.dataset_manager.dataset_detail import SrvDatasetDetailManager
 from app.services.dataset_manager.dataset_download import SrvDatasetDownloadManager
 from app.services.dataset_manager.dataset_list import SrvDatasetListManager
+from app.services.output_manager.progress_renderer import ProgressRenderer
 from app.utils.aggregated import doc
 
 
@@ -117,8 +120,11 @@ def dataset_show_detail(dataset_code, page, page_size, detached):
     help=dataset_help.dataset_help_page(dataset_help.DatasetHELP.DATASET_VERSION),
     show_default=True,
 )
+@limit_rate_option
 @doc(dataset_help.dataset_help_page(dataset_help.DatasetHELP.DATASET_DOWNLOAD))
-def dataset_download(code, output_path, version):
+def dataset_download(code, output_path, version, limit_rate):
+    BandwidthLimiter().configure(limit_rate)
+    ProgressRenderer().configure('Downloading')
     srv_detail = SrvDatasetDetailManager(interactive=False)
     for dataset_code in code:
         dataset_info = srv_detail.dataset_detail(dataset_code, page=0, page_size=500)
@@ -11,9 +11,21 @@ from click.exceptions import Abort
 
 import app.services.output_manager.help_page as file_help
 import app.services.output_manager.message_handler as message_handler
+from app.commands.transfer_options import concurrency_option
+from app.commands.transfer_options import engine_option
+from app.commands.transfer_options import hedge_option
+from app.commands.transfer_options import host_threads_option
+from app.commands.transfer_options import limit_rate_option
+from app.commands.transfer_options import max_inflight_mb_option
+from app.commands.transfer_options import progress_files_option
+from app.commands.transfer_options import schedule_option
 from app.configs.app_config import AppConfig
+from app.configs.user_config import UserConfig
 from app.models.item import ItemStatus
 from app.models.item import ItemType
+from app.services.clients.bandwidth_limiter import BandwidthLimiter
+from app.services.clients.host_coordinator import HostCoordinator
+from app.services.clients.transfer_engine import get_transfer_engine
 from app.services.file_manager.file_download.download_client import SrvFileDownload
 from app.services.file_manager.file_list import SrvFileList
 from app.services.file_manager.file_manifests import SrvFileManifests
@@ -21,13 +33,17 @@ from app.services.file_manager.file_metadata.file_metadata_client import FileMet
 from app.services.file_manager.file_move.file_move_client import FileMoveClient
 from app.services.file_manager.file_trash.file_trash_client import FileTrashClient
 from app.services.file_manager.file_trash.utils import parse_trash_paths
+from app.services.file_manager.file_upload.concurrency_controller import ThreadCountType
 from app.services.file_manager.file_upload.file_upload import assemble_path
+from app.services.file_manager.file_upload.file_upload import resolve_target_folder
 from app.services.file_manager.file_upload.file_upload import resume_upload
 from app.services.file_manager.file_upload.file_upload import simple_upload
+from app.services.file_manager.file_upload.upload_journal import UploadJournal
 from app.services.file_manager.file_upload.upload_validator import UploadEventValidator
 from app.services.output_manager.error_handler import ECustomizedError
 from app.services.output_manager.error_handler import SrvErrorHandler
 from app.services.output_manager.error_handler import customized_error_msg
+from app.services.output_manager.progress_renderer import ProgressRenderer
 from app.services.user_authentication.decorator import require_valid_token
 from app.utils.aggregated import doc
 from app.utils.aggregated import fit_terminal_width
@@ -38,6 +54,7 @@ from app.utils.aggregated import normalize_input_paths
 from app.utils.aggregated import normalize_join
 from app.utils.aggregated import remove_the_output_file
 from app.utils.aggregated import search_item
+from app.utils.stat_cache import StatCache
 
 
 @click.command()
@@ -92,14 +109,23 @@ def cli():
     help=file_help.file_help_page(file_help.FileHELP.FILE_UPLOAD_ZIP),
     show_default=True,
 )
+@hedge_option
+@schedule_option
+@host_threads_option
+@limit_rate_option
+@progress_files_option
 @click.option(
     '--thread',
     '-td',
     default=1,
     required=False,
-    help='The number of threads for uploading a file.',
+    type=ThreadCountType(),
+    help='The number of threads for uploading a file, or auto to adjust it by the throughput and errors.',
     show_default=True,
 )
+@max_inflight_mb_option
+@engine_option
+@concurrency_option
 @click.option(
     '--output-path',
     '-o',
@@ -122,7 +148,11 @@ def file_put(**kwargs):  # noqa: C901
     zipping = kwargs.get('zip')
     attribute_file = kwargs.get('attribute')
     thread = kwargs.get('thread')
+    max_inflight_mb = kwargs.get('max_inflight_mb')
+    engine = kwargs.get('engine')
+    concurrency = kwargs.get('concurrency')
     output_path = kwargs.get('output_path')
+    ProgressRenderer().configure('Uploading', kwargs.get('progress_files'))
 
     # load tag json file to list, and attribute file to dict
     try:
@@ -187,51 +217,90 @@ def file_put(**kwargs):  # noqa: C901
 
     # Unique Paths
     files = set(files)
-    # the loop will read all input path(folder or files)
-    # and process them one by one
-    for f in files:
-        # so this function will always return the furthest folder node as current_folder_node+parent_folder_id
-        current_folder_node, parent_folder, create_folder_flag, target_folder = assemble_path(
-            f,
-            target_folder,
-            project_code,
-            folder_type,
-            zone,
-        )
-
-        upload_event = {
-            'project_code': project_code,
-            'target_folder': target_folder,
-            'file': f.rstrip('/'),  # remove the ending slash
-            'tags': tag if tag else [],
-            'zone': zone,
-            'current_folder_node': current_folder_node,
-            'parent_folder_id': parent_folder.get('id'),
-            'create_folder_flag': create_folder_flag,
-            'compress_zip': zipping,
-            'attribute': attribute,
-        }
-        if source_file:
-            upload_event['source_id'] = src_file_info.get('id', '')
+    # in cloud mode the data is on network filesystem, the metadata is cached
+    # from the check of input paths until the upload is finished
+    StatCache().enabled = UserConfig().is_cloud_mode is True
+    # the coordinator, the async engine, the pool and the manifest are
+    # shared by all the input paths. they are closed also when upload failed
+    host_coordinator = HostCoordinator.from_host_option(kwargs.get('host_threads'))
+    BandwidthLimiter().configure(kwargs.get('limit_rate'), host_coordinator)
+    transfer_engine = get_transfer_engine(engine, concurrency)
+    try:
+        # the target folder is shared by all the input paths, so it is checked
+        # once and the user is asked once if the folders need to be created
+        resolved_target = resolve_target_folder(target_folder, project_code, folder_type, zone)
+        # the loop will read all input path(folder or files) and format the
+        # folder node of each. then they are uploaded together in one pipeline
+        upload_events = []
+        for f in files:
+            # so this function will always return the furthest folder node as current_folder_node+parent_folder_id
+            current_folder_node, parent_folder, create_folder_flag, upload_target_folder = assemble_path(
+                f,
+                target_folder,
+                project_code,
+                folder_type,
+                zone,
+                resolved_target,
+            )
 
-        item_ids = simple_upload(upload_event, num_of_thread=thread, output_path=output_path)
+            upload_event = {
+                'project_code': project_code,
+                'target_folder': upload_target_folder,
+                'file': f.rstrip('/'),  # remove the ending slash
+                'tags': tag if tag else [],
+                'zone': zone,
+                'current_folder_node': current_folder_node,
+                'parent_folder_id': parent_folder.get('id'),
+                'create_folder_flag': create_folder_flag,
+                'compress_zip': zipping,
+                'attribute': attribute,
+            }
+            if source_file:
+                upload_event['source_id'] = src_file_info.get('id', '')
+            upload_events.append(upload_event)
+
+        item_ids = simple_upload(
+            upload_events,
+            num_of_thread=thread,
+            output_path=output_path,
+            max_inflight_mb=max_inflight_mb,
+            engine=transfer_engine,
+            host_coordinator=host_coordinator,
+            schedule=kwargs.get('schedule'),
+            hedge=kwargs.get('hedge'),
+        )
+    finally:
+        StatCache().clear()
+        if transfer_engine:
+            transfer_engine.close()
+        if host_coordinator:
+            host_coordinator.close()
 
-        # since only file upload can attach manifest, take the first file object
-        srv_manifest.attach_manifest(attribute, item_ids[0], zone) if attribute else None
-        message_handler.SrvOutPutHandler.all_file_uploaded()
+    # since only file upload can attach manifest, take the first file object
+    srv_manifest.attach_manifest(attribute, item_ids[0], zone) if attribute else None
+    message_handler.SrvOutPutHandler.all_file_uploaded()
 
-        remove_the_output_file(output_path)
+    remove_the_output_file(output_path)
 
 
 @click.command(name='resume')
+@hedge_option
+@schedule_option
+@host_threads_option
+@limit_rate_option
+@progress_files_option
 @click.option(
     '--thread',
     '-td',
     default=1,
     required=False,
-    help='The number of thread for upload a file',
+    type=ThreadCountType(),
+    help='The number of thread for upload a file, or auto to adjust it by the throughput and errors.',
     show_default=True,
 )
+@max_inflight_mb_option
+@engine_option
+@concurrency_option
 @click.option(
     '--resumable-manifest',
     '-r',
@@ -248,23 +317,54 @@ def file_resume(**kwargs):  # noqa: C901
         normal file upload to make the code more clear.
     Parameters:
         - thread: The number of thread for upload a file
+        - max_inflight_mb: The memory budget in MB of chunks waiting to be uploaded
+        - engine: The engine to transfer the chunks, thread or async
+        - concurrency: The maximum number of requests in flight with async engine
+        - limit_rate: The bandwidth limit or schedule of the upload
+        - progress_files: The number of active files shown under the progress bar
+        - host_threads: The concurrent chunk uploads shared by processes on the host
+        - schedule: The policy to order the files to upload
+        - hedge: Send a duplicate request of the slow chunks
         - resumable_file: The manifest file for resumable upload
     """
 
     thread = kwargs.get('thread')
+    max_inflight_mb = kwargs.get('max_inflight_mb')
+    engine = kwargs.get('engine')
+    concurrency = kwargs.get('concurrency')
     resumable_manifest_file = kwargs.get('resumable_manifest')
+    ProgressRenderer().configure('Uploading', kwargs.get('progress_files'))
 
     # check if manifest file exist then read the manifest file as json
     if not os.path.exists(resumable_manifest_file):
         SrvErrorHandler.customized_handle(ECustomizedError.INVALID_RESUMABLE, True)
 
-    with open(resumable_manifest_file, 'r') as f:
-        resumable_manifest = json.load(f)
-        # use the same validator with upload. because resumable and normal upload
-        # are rather similar with the input
-        validate_upload_event(resumable_manifest)
+    # the progress in journal of interrupted upload is replayed on manifest
+    resumable_manifest = UploadJournal.load(resumable_manifest_file)
+    # use the same validator with upload. because resumable and normal upload
+    # are rather similar with the input
+    validate_upload_event(resumable_manifest)
 
-    resume_upload(resumable_manifest, thread)
+    # the coordinator and the engine are closed also when upload failed
+    host_coordinator = HostCoordinator.from_host_option(kwargs.get('host_threads'))
+    BandwidthLimiter().configure(kwargs.get('limit_rate'), host_coordinator)
+    transfer_engine = get_transfer_engine(engine, concurrency)
+    try:
+        resume_upload(
+            resumable_manifest,
+            thread,
+            max_inflight_mb,
+            transfer_engine,
+            resumable_manifest_file,
+            host_coordinator,
+            kwargs.get('schedule'),
+            kwargs.get('hedge'),
+        )
+    finally:
+        if transfer_engine:
+            transfer_engine.close()
+        if host_coordinator:
+            host_coordinator.close()
 
     # since only file upload can attach manifest, take the first file object
     srv_manifest = SrvFileManifests()
@@ -397,6 +497,10 @@ def file_list(paths, zone, page, page_size, detached):
     help=file_help.file_help_page(file_help.FileHELP.FILE_SYNC_I),
     show_default=True,
 )
+@engine_option
+@concurrency_option
+@limit_rate_option
+@progress_files_option
 @require_valid_token()
 @doc(file_help.file_help_page(file_help.FileHELP.FILE_SYNC))
 def file_download(**kwargs):
@@ -405,6 +509,10 @@ def file_download(**kwargs):
     zone = kwargs.get('zone')
     zipping = kwargs.get('zip')
     geid = kwargs.get('geid')
+    engine = kwargs.get('engine')
+    concurrency = kwargs.get('concurrency')
+    BandwidthLimiter().configure(kwargs.get('limit_rate'))
+    ProgressRenderer().configure('Downloading', kwargs.get('progress_files'))
     zone = get_zone(zone) if zone else AppConfig.Env.green_zone
     interactive = False if len(paths) > 1 else True
     # void_validate_zone('download', zone)
@@ -439,9 +547,25 @@ def file_download(**kwargs):
         srv_download = SrvFileDownload(zone, interactive)
         srv_download.batch_download_file(output_path, item_res)
     else:
-        for item in item_res:
-            srv_download = SrvFileDownload(zone, interactive)
-            srv_download.simple_download_file(output_path, [item])
+        # with async engine the files are streamed at same time,
+        # each download is checked after all of them finished
+        transfer_engine = get_transfer_engine(engine, concurrency)
+        try:
+            pending_downloads = []
+            for item in item_res:
+                srv_download = SrvFileDownload(zone, interactive, transfer_engine)
+                result = srv_download.simple_download_file(output_path, [item])
+                if result:
+                    pending_downloads.append((srv_download, result))
+
+            # the results are printed after the progress of all files
+            saved_downloads = [(srv_download, result.get()) for srv_download, result in pending_downloads]
+            ProgressRenderer().close()
+            for srv_download, saved_filename in saved_downloads:
+                srv_download.finish_download(saved_filename)
+        finally:
+            if transfer_engine:
+                transfer_engine.close()
 
 
 @click.command(name='metadata')
@@ -0,0 +1,85 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import click
+
+import app.services.output_manager.help_page as transfer_help
+from app.configs.app_config import AppConfig
+from app.services.clients.bandwidth_limiter import RateScheduleType
+from app.services.clients.transfer_engine import TransferEngine
+from app.services.file_manager.file_upload.upload_scheduler import SchedulePolicy
+
+# the options of data transfer shared by the upload and download commands
+
+hedge_option = click.option(
+    '--hedge',
+    default=False,
+    required=False,
+    is_flag=True,
+    help=transfer_help.transfer_help_page(transfer_help.TransferHELP.TRANSFER_HEDGE),
+    show_default=True,
+)
+
+schedule_option = click.option(
+    '--schedule',
+    default=SchedulePolicy.WALK.value,
+    required=False,
+    type=click.Choice([policy.value for policy in SchedulePolicy]),
+    help=transfer_help.transfer_help_page(transfer_help.TransferHELP.TRANSFER_SCHEDULE),
+    show_default=True,
+)
+
+host_threads_option = click.option(
+    '--host-threads',
+    default=None,
+    required=False,
+    type=click.IntRange(min=1),
+    help=transfer_help.transfer_help_page(transfer_help.TransferHELP.TRANSFER_HOST_THREADS),
+    show_default=True,
+)
+
+limit_rate_option = click.option(
+    '--limit-rate',
+    default=None,
+    required=False,
+    type=RateScheduleType(),
+    help=transfer_help.transfer_help_page(transfer_help.TransferHELP.TRANSFER_LIMIT_RATE),
+    show_default=True,
+)
+
+progress_files_option = click.option(
+    '--progress-files',
+    default=0,
+    required=False,
+    type=click.IntRange(min=0),
+    help=transfer_help.transfer_help_page(transfer_help.TransferHELP.TRANSFER_PROGRESS_FILES),
+    show_default=True,
+)
+
+max_inflight_mb_option = click.option(
+    '--max-inflight-mb',
+    default=AppConfig.Env.max_inflight_mb,
+    required=False,
+    type=click.IntRange(min=1),
+    help=transfer_help.transfer_help_page(transfer_help.TransferHELP.TRANSFER_MAX_INFLIGHT_MB),
+    show_default=True,
+)
+
+engine_option = click.option(
+    '--engine',
+    default=TransferEngine.THREAD.value,
+    required=False,
+    type=click.Choice([engine.value for engine in TransferEngine]),
+    help=transfer_help.transfer_help_page(transfer_help.TransferHELP.TRANSFER_ENGINE),
+    show_default=True,
+)
+
+concurrency_option = click.option(
+    '--concurrency',
+    default=AppConfig.Env.async_max_requests,
+    required=False,
+    type=click.IntRange(min=1),
+    help=transfer_help.transfer_help_page(transfer_help.TransferHELP.TRANSFER_CONCURRENCY),
+    show_default=True,
+)
@@ -2,18 +2,101 @@
 #
 # Contact Indoc Systems for any questions regarding the use of this source code.
 
+import os
+
 from app.configs.config import ConfigClass
 
 
 class AppConfig:
     class Env:
         token_warn_need_refresh = 120  # refresh token if token is about to expire
-        token_refresh_interval = 90  # auto refresh token every 40 seconds
+        # refresh token every interval if its expiry cannot be read, and
+        # wait at least the min delay between refreshes
+        token_refresh_interval = 90  # seconds
+        token_refresh_min_delay = 5  # seconds
 
-        # NOTE: there is a limitation on minio that
-        # the multipart number is 10000. so we set
-        # the chunk_size as 20MB -> total 200GB
+        # the default chunk size. the chunk size of each file is planned
+        # within the multipart limits of minio: at most 10000 parts of
+        # 5MB to 5GB, except the last part which can be smaller
         chunk_size = 1024 * 1024 * 20  # MB
+        min_chunk_size = 1024 * 1024 * 5
+        max_chunk_size = 1024 * 1024 * 1024 * 5
+        max_chunk_number = 10000
+        # once throughput is observed, the chunk size is planned to take
+        # this time to upload. the smoothing is the weight of new samples
+        chunk_target_seconds = 10
+        throughput_smoothing = 0.2
+        # the memory budget of chunks that are read but not uploaded yet
+        max_inflight_mb = 200
+        # the attempts of each chunk upload. the chunk failed with transient
+        # error is retried after a jittered exponential backoff. the 403 of
+        # object storage is only retried when the presigned url is expired
+        chunk_max_attempts = 5
+        chunk_retry_backoff = 1  # seconds
+        chunk_retry_max_backoff = 60  # seconds
+        chunk_retry_code = [408, 429, 500, 502, 503, 504]
+        # the limits of concurrent chunk uploads with --thread auto. it starts
+        # from the min and grows while the throughput of each round does not
+        # drop over the tolerance and the latency per byte stays within the
+        # tolerance times of the best. the congestion errors halve it
+        auto_thread_min = 2
+        auto_thread_max = 32
+        auto_thread_throughput_tolerance = 0.05
+        auto_thread_latency_tolerance = 1.5
+        auto_thread_congestion_code = [429, 502, 503, 504]
+        # with --hedge, a duplicate request of chunk is sent when it takes
+        # longer than the percentile of latency per byte of recent chunks.
+        # it starts once there are enough samples, and waits at least the delay
+        chunk_hedge_percentile = 95
+        chunk_hedge_window = 200
+        chunk_hedge_min_samples = 20
+        chunk_hedge_min_delay = 1  # seconds
+        # the hedged requests send the chunk in blocks, the one that loses
+        # stops at the next block and its connection is closed
+        chunk_hedge_block_size = 256 * 1024
+        # the bandwidth of --limit-rate is shared by all transfers. the bytes
+        # are sent in blocks and the idle time can be used for a burst of
+        # up to the seconds of rate
+        limit_rate_burst_seconds = 1
+        limit_rate_block_size = 256 * 1024
+        # the lock directory of the processes sharing --host-threads. the
+        # number of running processes is checked at most once per interval
+        host_coordinator_path = os.path.join(ConfigClass.config_path, 'coordinator')
+        host_coordinator_refresh_interval = 1  # seconds
+        host_coordinator_poll_interval = 0.05  # seconds
+        # the progress is redrawn at most once per interval on terminal, and
+        # printed as a summary line once per summary interval otherwise. the
+        # throughput is the average of rate window
+        progress_refresh_interval = 0.2  # seconds
+        progress_summary_interval = 30  # seconds
+        progress_rate_window = 5  # seconds
+        # the number of concurrent requests to prefetch chunk presigned urls
+        presign_prefetch_workers = 4
+        # the maximum concurrent requests to finalise uploaded files. the
+        # files are finalised while the chunks of other files are uploaded
+        finalise_workers = 8
+        # the number of threads to calculate the md5 of chunks
+        hash_workers = os.cpu_count() or 1
+        # the on-disk cache of chunk md5, so resume can skip the uploaded
+        # chunks without reading them again
+        chunk_hash_cache = True
+        chunk_hash_cache_path = os.path.join(ConfigClass.config_path, 'chunk_hash.db')
+        chunk_hash_cache_expiry = 3600 * 24 * 30  # seconds
+        chunk_hash_commit_interval = 1  # seconds
+        # drop the page cache of chunks once they are uploaded
+        release_page_cache = True
+        # the expiry used when presigned url does not carry one, and the margin
+        # before the expiry that url will be requested again
+        presigned_url_expiry = 600  # seconds
+        presigned_url_expiry_margin = 30  # seconds
+        # the connection limits of shared http pool for each host
+        http_max_connections_per_host = 64
+        http_max_keepalive_per_host = 32
+        http_keepalive_expiry = 30  # seconds
+        # the maximum requests in flight when async transfer engine is used
+        async_max_requests = 128
+        # the size of each read when streaming a download with async engine
+        download_chunk_size = 1024 * 64
         resilient_retry = 3
         resilient_backoff = 1
         resilient_retry_interval = 1  # seconds
@@ -22,6 +105,20 @@ class AppConfig:
         default_upload_message = f'{ConfigClass.project}cli straight uploaded'
         session_duration = 3600.0
         upload_batch_size = 100
+        # the maximum batches of upload that are checked or registered at
+        # same time, ahead of the batches that are uploading the chunks
+        upload_pipeline_batches = 4
+        # the registered files are ordered by --schedule in each batch, and
+        # interleave policy streams the chunks of a few files in turn. the
+        # files up to the size are uploaded by the lane of small files
+        upload_interleave_files = 4
+        small_file_lane_size = chunk_size
+        # the minimum records in upload journal before it is compacted into
+        # the manifest. it is at least the number of files in manifest
+        journal_compact_records = 10000
+        # the number of concurrent folder readers to scan the upload folder
+        # on network filesystem in cloud mode
+        scan_workers = 32
         core_zone = 'core'
         green_zone = 'greenroom'
         core_bucket_prefix = 'core'
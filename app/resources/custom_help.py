@@ -64,6 +64,32 @@ class HelpPage:
             'FILE_TRASH': 'Move files/folders to trash bin.',
             'FILE_TRASH_P': 'Permanent delete files/folders directly.',
         },
+        'transfer': {
+            'TRANSFER_HEDGE': (
+                'Send a duplicate request of the chunks slower than the recent ones and take whichever finishes first.'
+            ),
+            'TRANSFER_SCHEDULE': (
+                'The order to upload the files. walk uploads them in the order they are found, largest-first starts '
+                'the big files first, interleave also sends the chunks of a few big files in turn, and both upload '
+                'the small files in a lane of their own.'
+            ),
+            'TRANSFER_HOST_THREADS': (
+                'Share this number of concurrent chunk uploads, and --limit-rate, fairly with the other '
+                'pilotcli processes on this host started with the option. Only used by the thread engine for chunks.'
+            ),
+            'TRANSFER_LIMIT_RATE': (
+                'The maximum bandwidth like 200M shared by all transfers, or a schedule of local time '
+                'like 08:00-18:00=50M,200M where the rate without window is used outside the windows.'
+            ),
+            'TRANSFER_PROGRESS_FILES': (
+                'The number of active files with the most bytes left shown under the progress bar.'
+            ),
+            'TRANSFER_MAX_INFLIGHT_MB': (
+                'The maximum size in MB of file chunks held in memory while waiting to be uploaded.'
+            ),
+            'TRANSFER_ENGINE': 'The engine to transfer data. async keeps many requests in flight on a single thread.',
+            'TRANSFER_CONCURRENCY': 'The maximum number of requests in flight with async engine.',
+        },
         'config': {
             'SET_CONFIG': 'Chose config file and set for cli.',
             'CONFIG_DESTINATION': 'The destination the config file goes to, default will be current cli directory.',
@@ -0,0 +1,227 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import asyncio
+import re
+import threading
+import time
+from datetime import datetime
+from typing import AsyncIterator
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+import click
+
+from app.configs.app_config import AppConfig
+from app.models.singleton import Singleton
+from app.services.clients.host_coordinator import HostCoordinator
+
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3}
+
+
+class RateWindow(NamedTuple):
+    # the minutes of day, the window can cross midnight
+    start: int
+    end: int
+    rate: Optional[float]
+
+
+def parse_rate(value: str) -> Optional[float]:
+    """
+    Summary:
+        Parse the rate like 500K, 200M or 1G in bytes per second. The
+        `0` or `unlimited` means no limit.
+    Parameter:
+        - value(str): the rate.
+    return:
+        - float: the bytes per second or None for no limit.
+    """
+    value = value.strip().upper()
+    if value in ('0', 'UNLIMITED'):
+        return None
+
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)B?', value)
+    if not match:
+        raise ValueError(f'invalid rate {value!r}')
+    return float(match.group(1)) * RATE_UNITS[match.group(2)]
+
+
+def parse_minutes(value: str) -> int:
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', value.strip())
+    if not match or int(match.group(2)) >= 60 or int(match.group(1)) * 60 + int(match.group(2)) > 24 * 60:
+        raise ValueError(f'invalid time {value!r}')
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def parse_rate_schedule(value: str) -> List[RateWindow]:
+    """
+    Summary:
+        Parse the --limit-rate option. It is a rate for all the day, or a
+        comma separated schedule like `08:00-18:00=50M,200M` where the first
+        matching window of local time wins and the rate without window is
+        the default when no window matches.
+    Parameter:
+        - value(str): the option value.
+    return:
+        - list of RateWindow: the rate windows.
+    """
+    schedule = []
+    for entry in value.split(','):
+        window, _, rate = entry.rpartition('=')
+        if window:
+            start, _, end = window.partition('-')
+            schedule.append(RateWindow(parse_minutes(start), parse_minutes(end), parse_rate(rate)))
+        else:
+            schedule.append(RateWindow(0, 24 * 60, parse_rate(rate)))
+
+    # the default rate of all the day is checked after the windows
+    return sorted(schedule, key=lambda window: (window.start, window.end) == (0, 24 * 60))
+
+
+class RateScheduleType(click.ParamType):
+    """The click type of --limit-rate option."""
+
+    name = 'rate'
+
+    def convert(self, value, param, ctx) -> List[RateWindow]:
+        if isinstance(value, list):
+            return value
+        try:
+            return parse_rate_schedule(value)
+        except ValueError as e:
+            self.fail(f'{e}, expect a rate like 200M or a schedule like 08:00-18:00=50M,200M.', param, ctx)
+
+
+class BandwidthLimiter(metaclass=Singleton):
+    """
+    Summary:
+        The token bucket shared by all the transfers of the process. Each
+        transfer takes the tokens of the bytes it sends or receives, and
+        sleeps when the bucket is in debt, so all the threads and the async
+        engine together stay under the rate. The rate can follow a schedule
+        of local time. Without a rate, nothing is limited. With a host
+        coordinator, the rate is for the host and split between processes.
+    """
+
+    def __init__(self) -> None:
+        self.schedule: List[RateWindow] = []
+        self.coordinator: Optional[HostCoordinator] = None
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+
+    def configure(self, schedule: Optional[List[RateWindow]], coordinator: HostCoordinator = None) -> None:
+        """
+        Summary:
+            Set the rate schedule from --limit-rate option.
+        Parameter:
+            - schedule(list of RateWindow): the rate windows, None for no limit.
+            - coordinator(HostCoordinator): the coordinator of --host-threads.
+        """
+        with self._lock:
+            self.schedule = schedule or []
+            self.coordinator = coordinator
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+    def get_rate(self, now: datetime = None) -> Optional[float]:
+        """
+        Summary:
+            The rate of current local time.
+        return:
+            - float: the bytes per second or None for no limit.
+        """
+        if not self.schedule:
+            return None
+
+        now = now or datetime.now()
+        minutes = now.hour * 60 + now.minute
+        for window in self.schedule:
+            if window.start <= window.end and window.start <= minutes < window.end:
+                return window.rate
+            elif window.start > window.end and (minutes >= window.start or minutes < window.end):
+                return window.rate
+        return None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.schedule)
+
+    def reserve(self, size: int) -> float:
+        """
+        Summary:
+            Take the tokens of bytes, the bucket can go into debt.
+        Parameter:
+            - size(int): the number of bytes.
+        return:
+            - float: the seconds to wait before the bytes are transferred.
+        """
+        rate = self.get_rate()
+        if rate is None:
+            return 0
+        if self.coordinator is not None:
+            rate = self.coordinator.share_rate(rate)
+
+        with self._lock:
+            now = time.monotonic()
+            capacity = rate * AppConfig.Env.limit_rate_burst_seconds
+            self._tokens = min(self._tokens + (now - self._updated) * rate, capacity)
+            self._updated = now
+            self._tokens -= size
+            return -self._tokens / rate if self._tokens < 0 else 0
+
+    def consume(self, size: int) -> None:
+        """
+        Summary:
+            Wait until the bytes can be transferred under the rate.
+        Parameter:
+            - size(int): the number of bytes.
+        """
+        delay = self.reserve(size)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def consume_async(self, size: int) -> None:
+        """
+        Summary:
+            The async version of consume, it does not block the event loop.
+        Parameter:
+            - size(int): the number of bytes.
+        """
+        delay = self.reserve(size)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def stream(self, data: bytes) -> Iterator[memoryview]:
+        """
+        Summary:
+            Send the data in blocks under the rate. The blocks are views of
+            data, so it is not copied.
+        Parameter:
+            - data(bytes): the data to send.
+        return:
+            - Iterator[memoryview]: the blocks of data.
+        """
+        view = memoryview(data)
+        for offset in range(0, len(view), AppConfig.Env.limit_rate_block_size):
+            block = view[offset : offset + AppConfig.Env.limit_rate_block_size]
+            self.consume(len(block))
+            yield block
+
+    async def stream_async(self, data: bytes) -> AsyncIterator[memoryview]:
+        """
+        Summary:
+            The async version of stream.
+        Parameter:
+            - data(bytes): the data to send.
+        return:
+            - AsyncIterator[memoryview]: the blocks of data.
+        """
+        view = memoryview(data)
+        for offset in range(0, len(view), AppConfig.Env.limit_rate_block_size):
+            block = view[offset : offset + AppConfig.Env.limit_rate_block_size]
+            await self.consume_async(len(block))
+            yield block
@@ -12,6 +12,7 @@ from app.configs.config import ConfigClass
 from app.configs.user_config import UserConfig
 from app.services.clients.base_client import BaseClient
 from app.services.user_authentication.token_manager import SrvTokenManager
+from app.services.user_authentication.token_refresh_scheduler import TokenRefreshScheduler
 
 
 class BaseAuthClient(BaseClient):
@@ -28,6 +29,8 @@ class BaseAuthClient(BaseClient):
             'VM-Info': ConfigClass.vm_info,
             'Session-ID': self.user.session_id,
         }
+        # the refreshed token is published into the headers
+        TokenRefreshScheduler().register(self)
 
     def _request(
         self,
@@ -47,7 +50,7 @@ class BaseAuthClient(BaseClient):
 
             if response.status_code == 401:
                 self.token_manager.refresh(ConfigClass.keycloak_device_client_id)
-                self.headers['Authorization'] = 'Bearer ' + self.user.access_token
+                TokenRefreshScheduler().publish(self.user.access_token)
 
         response.raise_for_status()
         return None
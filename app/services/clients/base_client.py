@@ -8,11 +8,12 @@ from typing import Any
 from typing import Mapping
 from typing import Optional
 
-from httpx import Client
 from httpx import RequestError
 from httpx import Response
 
 from app.configs.config import ConfigClass
+from app.services.clients.exception import REQUEST_NOT_SENT
+from app.services.clients.http_pool import get_http_client
 
 logger = logging.getLogger('pilot.cli.base_client')
 
@@ -22,7 +23,7 @@ class BaseClient:
 
     def __init__(self, endpoint: str, timeout: int = 30) -> None:
         self.endpoint = endpoint
-        self.client = Client(timeout=timeout)
+        self.timeout = timeout
         self.headers = {'VM-Info': ConfigClass.vm_info}
         self.retry_status = [401, 503]
         self.retry_count = 3
@@ -63,14 +64,17 @@ class BaseClient:
         """Send request."""
         try:
             url = f'{self.endpoint}/{url}'
-            if headers:
-                self.headers.update(headers)
+            # merge the headers per request, the client can be shared by threads
+            headers = {**self.headers, **headers} if headers else self.headers
 
-            response = self.client.request(method, url, json=json, params=params, headers=self.headers, data=data)
+            client = get_http_client(url)
+            response = client.request(
+                method, url, json=json, params=params, headers=headers, data=data, timeout=self.timeout
+            )
         except RequestError:
             message = f'Unable to query data with url "{method} {url}".'
             logger.exception(message)
-            raise Exception(message)
+            raise REQUEST_NOT_SENT(message)
 
         return response
 
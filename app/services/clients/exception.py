@@ -0,0 +1,8 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+
+class REQUEST_NOT_SENT(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
@@ -0,0 +1,203 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import math
+import os
+import threading
+import time
+import uuid
+from logging import getLogger
+from typing import IO
+from typing import List
+from typing import Optional
+
+from app.configs.app_config import AppConfig
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = getLogger(__name__)
+
+MEMBER_PREFIX = 'member-'
+SLOT_PREFIX = 'slot-'
+
+
+def try_lock(file: IO, shared: bool = False) -> bool:
+    """
+    Summary:
+        Take the lock of file without waiting.
+    Parameter:
+        - file(IO): the opened lock file.
+        - shared(bool): take a shared lock instead of exclusive one.
+    return:
+        - bool: if the lock is taken.
+    """
+    try:
+        fcntl.flock(file.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+class HostCoordinator:
+    """
+    Summary:
+        The opt-in coordinator of the pilotcli processes on the same host.
+        The processes share a lock directory under the config folder:
+        - each process holds the lock of its own member file while it runs,
+          so the others can count the running processes;
+        - each chunk upload holds the lock of one of the slot files, so the
+          processes together never run more than `max_slots` uploads.
+        A process takes at most its fair share of the slots, and the rate of
+        --limit-rate is split between the processes in the same way. The
+        locks are released by the system when a process exits or crashes,
+        so there is no broker to run and nothing is left locked.
+    """
+
+    supported = fcntl is not None
+
+    def __init__(self, lock_path: str, max_slots: int) -> None:
+        self.lock_path = lock_path
+        self.max_slots = max(max_slots, 1)
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._held: List[int] = []
+        self._members = 1
+        self._members_checked = 0.0
+
+        os.makedirs(lock_path, exist_ok=True)
+        # the member file is locked before it is visible to the others,
+        # otherwise it could be taken as left by a crashed process
+        name = f'{os.getpid()}-{uuid.uuid4().hex}.lock'
+        self.member_path = os.path.join(lock_path, MEMBER_PREFIX + name)
+        self._member_file = open(os.path.join(lock_path, name), 'w')
+        try_lock(self._member_file)
+        os.rename(self._member_file.name, self.member_path)
+        self._slot_files = [open(os.path.join(lock_path, f'{SLOT_PREFIX}{i}.lock'), 'a') for i in range(self.max_slots)]
+
+    def count_members(self) -> int:
+        """
+        Summary:
+            Count the running processes, the member files left by crashed
+            processes are removed. The count is refreshed at most once per
+            host_coordinator_refresh_interval.
+        return:
+            - int: the number of processes sharing the slots.
+        """
+        now = time.monotonic()
+        if now - self._members_checked < AppConfig.Env.host_coordinator_refresh_interval:
+            return self._members
+
+        members = 1
+        for name in os.listdir(self.lock_path):
+            path = os.path.join(self.lock_path, name)
+            if not name.startswith(MEMBER_PREFIX) or path == self.member_path:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    if not try_lock(f, shared=True):
+                        members += 1
+                        continue
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        self._members, self._members_checked = members, now
+        return members
+
+    def fair_share(self) -> int:
+        """
+        Summary:
+            The number of slots this process can hold.
+        return:
+            - int: the slots of this process.
+        """
+        return max(math.ceil(self.max_slots / self.count_members()), 1)
+
+    def share_rate(self, rate: float) -> float:
+        """
+        Summary:
+            Split the host-wide rate between the running processes.
+        Parameter:
+            - rate(float): the bytes per second of the host.
+        return:
+            - float: the bytes per second of this process.
+        """
+        return rate / self.count_members()
+
+    def _try_acquire(self) -> Optional[int]:
+        with self._lock:
+            # the upload is interrupted, the waiting workers are not blocked
+            if self._closed:
+                raise RuntimeError('The host coordinator is closed')
+            if len(self._held) >= self.fair_share():
+                return None
+            for slot, file in enumerate(self._slot_files):
+                if slot not in self._held and try_lock(file):
+                    self._held.append(slot)
+                    return slot
+        return None
+
+    def acquire(self) -> int:
+        """
+        Summary:
+            Block until a slot of the host is taken.
+        return:
+            - int: the slot to release after the upload.
+        """
+        while True:
+            slot = self._try_acquire()
+            if slot is not None:
+                return slot
+            time.sleep(AppConfig.Env.host_coordinator_poll_interval)
+
+    def release(self, slot: int) -> None:
+        """
+        Summary:
+            Give the slot back to the host. The slots are released already
+            if the coordinator is closed before the upload of slot ends.
+        Parameter:
+            - slot(int): the slot taken by acquire.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            fcntl.flock(self._slot_files[slot].fileno(), fcntl.LOCK_UN)
+            self._held.remove(slot)
+
+    def close(self) -> None:
+        """
+        Summary:
+            Leave the host, the slots and member file are released.
+        """
+        with self._lock:
+            self._closed = True
+            for file in self._slot_files:
+                file.close()
+            self._slot_files, self._held = [], []
+            self._member_file.close()
+        try:
+            os.remove(self.member_path)
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def from_host_option(cls, max_slots: Optional[int]) -> Optional['HostCoordinator']:
+        """
+        Summary:
+            Create the coordinator from --host-threads option.
+        Parameter:
+            - max_slots(int): the option value, None to run alone.
+        return:
+            - HostCoordinator: the coordinator or None.
+        """
+        if not max_slots:
+            return None
+        if not cls.supported:
+            logger.warning('Host coordination is not supported on this platform, the option is ignored')
+            return None
+        return cls(AppConfig.Env.host_coordinator_path, max_slots)
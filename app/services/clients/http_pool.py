@@ -0,0 +1,75 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+from typing import Dict
+from typing import Tuple
+
+from httpx import URL
+from httpx import Client
+from httpx import Limits
+
+from app.configs.app_config import AppConfig
+from app.models.singleton import Singleton
+
+
+class HttpConnectionPool(metaclass=Singleton):
+    """
+    Summary:
+        The process wide pool of http connections. It keeps one httpx client
+        for each host, so the connections are kept alive and reused by all
+        the service clients and the chunk uploads to object storage instead
+        of doing a new TCP and TLS handshake for each request. The client is
+        thread safe and the number of connections per host is limited.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, str, int], Client] = {}
+
+    def get_client(self, url: str) -> Client:
+        """
+        Summary:
+            Return the shared client for the host of url.
+        Parameter:
+            - url(str): the full url that will be requested.
+        return:
+            - Client: the httpx client bound to the connection pool of host.
+        """
+        url = URL(url)
+        key = (url.scheme, url.host, url.port)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                limits = Limits(
+                    max_connections=AppConfig.Env.http_max_connections_per_host,
+                    max_keepalive_connections=AppConfig.Env.http_max_keepalive_per_host,
+                    keepalive_expiry=AppConfig.Env.http_keepalive_expiry,
+                )
+                client = Client(limits=limits, timeout=None)
+                self._clients[key] = client
+
+        return client
+
+    def close(self) -> None:
+        """
+        Summary:
+            Close all the connections in the pool.
+        """
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            client.close()
+
+
+def get_http_client(url: str) -> Client:
+    """
+    Summary:
+        Shortcut to get the shared client for the host of url.
+    Parameter:
+        - url(str): the full url that will be requested.
+    return:
+        - Client: the httpx client bound to the connection pool of host.
+    """
+    return HttpConnectionPool().get_client(url)
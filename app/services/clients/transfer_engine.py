@@ -0,0 +1,124 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import asyncio
+import threading
+from concurrent.futures import CancelledError
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError
+from enum import Enum
+from typing import Any
+from typing import Callable
+from typing import Coroutine
+from typing import Optional
+
+from httpx import AsyncClient
+from httpx import Limits
+
+from app.configs.app_config import AppConfig
+
+
+class TransferEngine(str, Enum):
+    """Available engines to move the file data."""
+
+    THREAD = 'thread'
+    ASYNC = 'async'
+
+
+class AsyncApplyResult:
+    """
+    Summary:
+        The result of a coroutine submitted to the async engine. It has the
+        same interface as multiprocessing ApplyResult, so the upload pipeline
+        can wait for the chunks no matter which engine uploaded them.
+    """
+
+    def __init__(self, future: Future) -> None:
+        self.future = future
+
+    def ready(self) -> bool:
+        return self.future.done()
+
+    def successful(self) -> bool:
+        if not self.ready():
+            raise ValueError(f'{self!r} not ready')
+        return self.future.exception() is None
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        try:
+            self.future.exception(timeout)
+        except TimeoutError:
+            pass
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        return self.future.result(timeout)
+
+    def error(self) -> Optional[BaseException]:
+        if self.future.cancelled():
+            return CancelledError()
+        return self.future.exception()
+
+    def add_done_callback(self, fn: Callable[['AsyncApplyResult'], Any]) -> None:
+        self.future.add_done_callback(lambda _: fn(self))
+
+
+class AsyncTransferEngine:
+    """
+    Summary:
+        The engine runs an asyncio event loop in one background thread with
+        a pooled httpx AsyncClient. It can keep hundreds of chunk or file
+        requests in flight without a thread for each of them. The number of
+        concurrent requests is limited by the connection pool of client.
+    """
+
+    def __init__(self, max_requests: int = AppConfig.Env.async_max_requests) -> None:
+        self.max_requests = max_requests
+        self.client = AsyncClient(
+            limits=Limits(max_connections=max_requests, max_keepalive_connections=max_requests),
+            timeout=None,
+        )
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='async-transfer', daemon=True)
+        self._thread.start()
+
+    def submit(self, coro: Coroutine) -> AsyncApplyResult:
+        """
+        Summary:
+            Schedule the coroutine on the event loop of engine.
+        Parameter:
+            - coro(Coroutine): the transfer job.
+        return:
+            - AsyncApplyResult: the handle to wait for the job.
+        """
+        return AsyncApplyResult(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def close(self) -> None:
+        """
+        Summary:
+            Close the client and stop the event loop after all jobs finished.
+        """
+        if self._loop.is_closed():
+            return
+
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def get_transfer_engine(engine: TransferEngine, max_requests: int) -> Optional[AsyncTransferEngine]:
+    """
+    Summary:
+        Create the async engine if it is selected. The thread engine is
+        the ThreadPool created by each operation, so nothing is returned.
+    Parameter:
+        - engine(TransferEngine): the selected engine.
+        - max_requests(int): the maximum requests in flight for async engine.
+    return:
+        - AsyncTransferEngine: the started engine or None.
+    """
+    if TransferEngine(engine) == TransferEngine.ASYNC:
+        return AsyncTransferEngine(max_requests)
+    return None
@@ -10,17 +10,19 @@ from typing import Dict
 
 import httpx
 from httpx import HTTPStatusError
-from tqdm import tqdm
 
 import app.services.logger_services.log_functions as logger
 from app.configs.app_config import AppConfig
 from app.configs.user_config import UserConfig
 from app.models.service_meta_class import MetaService
+from app.services.clients.bandwidth_limiter import BandwidthLimiter
 from app.services.clients.base_auth_client import BaseAuthClient
 from app.services.dataset_manager.model import EFileStatus
 from app.services.output_manager.error_handler import ECustomizedError
 from app.services.output_manager.error_handler import SrvErrorHandler
 from app.services.output_manager.message_handler import SrvOutPutHandler
+from app.services.output_manager.progress_renderer import ProgressRenderer
+from app.services.user_authentication.token_refresh_scheduler import TokenRefreshScheduler
 
 from ..user_authentication.decorator import require_valid_token
 
@@ -90,28 +92,32 @@ class SrvDatasetDownloadManager(BaseAuthClient, metaclass=MetaService):
     @require_valid_token()
     def send_download_request(self) -> str:
         logger.info('start downloading...')
-
-        with httpx.stream('GET', self.download_url, follow_redirects=True) as r:
-            r.raise_for_status()
-            # Since version zip file was created by our system, thus no need to consider filename contain '?'
-            if not self.default_filename:
-                filename = f'{self.dataset_code}_{self.version}_{str(datetime.datetime.now())}.zip'
-            else:
-                filename = self.default_filename
-
-            output_path = self.avoid_duplicate_file_name(self.output.rstrip('/') + '/' + filename)
-            self.total_size = int(r.headers.get('Content-length'))
-            with open(output_path, 'wb') as file, tqdm(
-                desc='Downloading {}'.format(filename),
-                unit='iB',
-                unit_scale=True,
-                total=self.total_size,
-                unit_divisor=1024,
-                bar_format='{desc} |{bar:30} {percentage:3.0f}% {remaining}',
-            ) as bar:
-                for data in r.iter_bytes(chunk_size=1024):
-                    size = file.write(data)
-                    bar.update(size)
+        limiter = BandwidthLimiter()
+        # the token is kept valid for the api calls after a long download
+        token_refresher = TokenRefreshScheduler()
+        token_refresher.subscribe()
+        try:
+            with httpx.stream('GET', self.download_url, follow_redirects=True) as r:
+                r.raise_for_status()
+                # Since version zip file was created by our system, thus no need to consider filename contain '?'
+                if not self.default_filename:
+                    filename = f'{self.dataset_code}_{self.version}_{str(datetime.datetime.now())}.zip'
+                else:
+                    filename = self.default_filename
+
+                output_path = self.avoid_duplicate_file_name(self.output.rstrip('/') + '/' + filename)
+                self.total_size = int(r.headers.get('Content-length'))
+                progress = ProgressRenderer()
+                progress.add_total(1, self.total_size)
+                with open(output_path, 'wb') as file:
+                    for data in r.iter_bytes(chunk_size=1024):
+                        limiter.consume(len(data))
+                        size = file.write(data)
+                        progress.update(output_path, size, filename, self.total_size)
+                progress.finish_file(output_path)
+                progress.close()
+        finally:
+            token_refresher.unsubscribe()
         return output_path
 
     def avoid_duplicate_file_name(self, filename) -> str:
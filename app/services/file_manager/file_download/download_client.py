@@ -5,11 +5,11 @@
 import concurrent.futures
 import os
 import time
+from typing import Optional
 
 import click
 import httpx
 import jwt
-from tqdm import tqdm
 
 import app.services.logger_services.log_functions as logger
 import app.services.output_manager.message_handler as mhandler
@@ -17,16 +17,20 @@ from app.configs.app_config import AppConfig
 from app.configs.user_config import UserConfig
 from app.models.item import ItemZone
 from app.models.service_meta_class import MetaService
+from app.services.clients.bandwidth_limiter import BandwidthLimiter
 from app.services.clients.base_auth_client import BaseAuthClient
+from app.services.clients.transfer_engine import AsyncTransferEngine
 from app.services.output_manager.error_handler import ECustomizedError
 from app.services.output_manager.error_handler import SrvErrorHandler
+from app.services.output_manager.progress_renderer import ProgressRenderer
 from app.services.user_authentication.decorator import require_valid_token
+from app.services.user_authentication.token_refresh_scheduler import TokenRefreshScheduler
 
 from .model import EFileStatus
 
 
 class SrvFileDownload(BaseAuthClient, metaclass=MetaService):
-    def __init__(self, zone: str, interactive=True):
+    def __init__(self, zone: str, interactive=True, engine: AsyncTransferEngine = None):
         super().__init__(AppConfig.Connections.url_download_greenroom)
 
         self.appconfig = AppConfig()
@@ -41,6 +45,7 @@ class SrvFileDownload(BaseAuthClient, metaclass=MetaService):
         self.core = self.appconfig.Env.core_zone
         self.green = self.appconfig.Env.green_zone
         self.zone = zone
+        self.engine = engine
         self.url = {
             ItemZone.GREENROOM.value: self.appconfig.Connections.url_download_greenroom,
             ItemZone.CORE.value: self.appconfig.Connections.url_download_core,
@@ -173,6 +178,10 @@ class SrvFileDownload(BaseAuthClient, metaclass=MetaService):
     def download_file(self, url, local_filename, download_mode='single'):
         logger.info('start downloading...')
         filename = local_filename.split('/')[-1]
+        limiter = BandwidthLimiter()
+        # the token is kept valid for the api calls after a long download
+        token_refresher = TokenRefreshScheduler()
+        token_refresher.subscribe()
         try:
             with httpx.stream('GET', url) as r:
                 r.raise_for_status()
@@ -181,18 +190,18 @@ class SrvFileDownload(BaseAuthClient, metaclass=MetaService):
                     self.total_size = int(size) if size else self.total_size
                 if self.total_size:
                     downloaded_size = 0
-                    with open(local_filename, 'wb') as file, tqdm(
-                        desc='Downloading {}'.format(filename),
-                        total=self.total_size,
-                        unit='iB',
-                        unit_scale=True,
-                        unit_divisor=1024,
-                        bar_format='{desc} |{bar:30} {percentage:3.0f}% {remaining}',
-                    ) as bar:
+                    progress = ProgressRenderer()
+                    progress.add_total(1, self.total_size)
+                    with open(local_filename, 'wb') as file:
                         for data in r.iter_bytes(chunk_size=1024):
+                            limiter.consume(len(data))
                             size = file.write(data)
-                            bar.update(size)
+                            progress.update(local_filename, size, filename, self.total_size)
                             downloaded_size += len(data)
+                    # the files are downloaded one by one, the bar is ended
+                    # before the result of file is printed
+                    progress.finish_file(local_filename)
+                    progress.close()
 
                     # integrity check for downloaded file
                     if downloaded_size != self.total_size:
@@ -205,6 +214,7 @@ class SrvFileDownload(BaseAuthClient, metaclass=MetaService):
                     with open(local_filename, 'wb') as file:
                         part = 0
                         for data in r.iter_bytes(chunk_size=1024):
+                            limiter.consume(len(data))
                             size = file.write(data)
                             progress = '.' * part
                             click.echo(f'Downloading{progress}\r', nl=False)
@@ -215,6 +225,59 @@ class SrvFileDownload(BaseAuthClient, metaclass=MetaService):
                         logger.info('Download complete')
         except Exception as e:
             logger.error(f'Error downloading: {e}')
+        finally:
+            token_refresher.unsubscribe()
+        return local_filename
+
+    async def download_file_async(self, url: str, local_filename: str) -> Optional[str]:
+        """
+        Summary:
+            The async engine version of download_file. The errors are only
+            reported, so one failed file does not stop other downloads. The
+            partial file of a failed download is removed.
+        Parameter:
+            - url(str): the url to download the file.
+            - local_filename(str): the local path to save the file.
+        return:
+            - str: the local path of file, None if the download failed.
+        """
+        filename = local_filename.split('/')[-1]
+        placeholder = local_filename
+        limiter = BandwidthLimiter()
+        token_refresher = TokenRefreshScheduler()
+        token_refresher.subscribe()
+        try:
+            async with self.engine.client.stream('GET', url) as r:
+                r.raise_for_status()
+                if r.headers.get('Content-Type') == 'application/zip':
+                    size = r.headers.get('Content-length')
+                    self.total_size = int(size) if size else self.total_size
+
+                downloaded_size = 0
+                progress = ProgressRenderer()
+                progress.add_total(1, self.total_size or 0)
+                with open(local_filename, 'wb') as file:
+                    async for data in r.aiter_bytes(chunk_size=AppConfig.Env.download_chunk_size):
+                        await limiter.consume_async(len(data))
+                        size = file.write(data)
+                        progress.update(local_filename, size, filename, self.total_size or None)
+                        downloaded_size += size
+                progress.finish_file(local_filename)
+
+            # integrity check for downloaded file
+            if self.total_size and downloaded_size != self.total_size:
+                SrvErrorHandler.customized_handle(
+                    ECustomizedError.DOWNLOAD_SIZE_MISMATCH, value=(self.total_size, downloaded_size)
+                )
+                local_filename = None
+        except Exception as e:
+            logger.error(f'Error downloading: {e}')
+            local_filename = None
+        finally:
+            token_refresher.unsubscribe()
+
+        if local_filename is None and os.path.isfile(placeholder):
+            os.remove(placeholder)
         return local_filename
 
     @require_valid_token()
@@ -297,9 +360,20 @@ class SrvFileDownload(BaseAuthClient, metaclass=MetaService):
 
         output_filename = output_path.rstrip('/') + '/' + filename
         local_filename = self.avoid_duplicate_file_name(output_filename)
+
+        # with async engine the file is streamed in background, the caller
+        # will use finish_download to check it when the result is ready.
+        # create the file first so other downloads will not take the name
+        if self.engine:
+            open(local_filename, 'wb').close()
+            return self.engine.submit(self.download_file_async(download_url, local_filename))
+
         saved_filename = self.download_file(download_url, local_filename)
+        self.finish_download(saved_filename)
 
-        if os.path.isfile(saved_filename):
+    def finish_download(self, saved_filename: Optional[str]) -> None:
+        # the failed async download returns None, and its file is removed
+        if saved_filename and os.path.isfile(saved_filename):
             mhandler.SrvOutPutHandler.download_success(saved_filename)
         else:
             SrvErrorHandler.customized_handle(ECustomizedError.DOWNLOAD_FAIL, self.interactive)
@@ -0,0 +1,148 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import os
+import sqlite3
+import threading
+import time
+from logging import getLogger
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from app.configs.app_config import AppConfig
+from app.utils.stat_cache import StatCache
+
+logger = getLogger(__name__)
+
+# (device, inode, size, mtime_ns, chunk_size)
+FileKey = Tuple[int, int, int, int, int]
+
+
+class ChunkHashCache:
+    """
+    Summary:
+        The on-disk cache of the chunk md5 of local files. The md5 of each
+        chunk is recorded when it is calculated for upload, keyed by the
+        identity of file content: device, inode, size, mtime and the chunk
+        size. When an upload is resumed, the chunks that server already has
+        are compared with the cached md5 instead of reading the file again.
+        Once the file is modified its mtime changes, so the cache is missed
+        and the chunks are read and verified as before. The cache is best
+        effort and any database error only disables it.
+    """
+
+    def __init__(self, db_path: str, enabled: bool = True) -> None:
+        self.db_path = db_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._last_commit = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            # the config folder is on network filesystem in cloud mode, where the
+            # shared memory of WAL is not safe. the rollback journal is used,
+            # also for the cache created in WAL mode before
+            connection.execute('PRAGMA journal_mode=DELETE')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS chunk_hash ('
+                'device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, chunk_size INTEGER, '
+                'chunk_number INTEGER, etag TEXT, updated_at REAL, '
+                'PRIMARY KEY (device, inode, size, mtime_ns, chunk_size, chunk_number))'
+            )
+            # the files uploaded long ago are unlikely to be resumed
+            expired_at = time.time() - AppConfig.Env.chunk_hash_cache_expiry
+            connection.execute('DELETE FROM chunk_hash WHERE updated_at < ?', (expired_at,))
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _disable(self, error: Exception) -> None:
+        logger.warning(f'Chunk hash cache is disabled: {error}')
+        self.enabled = False
+
+    @staticmethod
+    def file_key(local_path: str, chunk_size: int) -> Optional[FileKey]:
+        """
+        Summary:
+            Get the key of file content for the chunk size.
+        Parameter:
+            - local_path(str): the local path of file.
+            - chunk_size(int): the chunk size of upload.
+        return:
+            - tuple: the key or None if the file cannot be stat.
+        """
+        result = StatCache().stat(local_path)
+        if result is None:
+            return None
+        return result.st_dev, result.st_ino, result.st_size, result.st_mtime_ns, chunk_size
+
+    def get(self, key: Optional[FileKey]) -> Dict[int, str]:
+        """
+        Summary:
+            Get the cached md5 of the chunks of file.
+        Parameter:
+            - key(tuple): the key of file content.
+        return:
+            - dict: the md5 of chunk by chunk number.
+        """
+        if not self.enabled or key is None:
+            return {}
+
+        with self._lock:
+            try:
+                rows = self._connect().execute(
+                    'SELECT chunk_number, etag FROM chunk_hash '
+                    'WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ? AND chunk_size = ?',
+                    key,
+                )
+                return dict(rows.fetchall())
+            except sqlite3.Error as e:
+                self._disable(e)
+                return {}
+
+    def put(self, key: Optional[FileKey], chunk_number: int, etag: str) -> None:
+        """
+        Summary:
+            Record the md5 of a chunk. The records are committed at most once
+            per chunk_hash_commit_interval, and when the cache is closed.
+        Parameter:
+            - key(tuple): the key of file content.
+            - chunk_number(int): the number of chunk.
+            - etag(str): the md5 of chunk data.
+        """
+        if not self.enabled or key is None:
+            return
+
+        with self._lock:
+            try:
+                connection = self._connect()
+                connection.execute(
+                    'INSERT OR REPLACE INTO chunk_hash VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (*key, chunk_number, etag, time.time()),
+                )
+                if time.monotonic() - self._last_commit >= AppConfig.Env.chunk_hash_commit_interval:
+                    connection.commit()
+                    self._last_commit = time.monotonic()
+            except sqlite3.Error as e:
+                self._disable(e)
+
+    def close(self) -> None:
+        """
+        Summary:
+            Commit the records and close the database.
+        """
+        with self._lock:
+            connection, self._connection = self._connection, None
+            if connection is None:
+                return
+            try:
+                connection.commit()
+            except sqlite3.Error as e:
+                self._disable(e)
+            finally:
+                connection.close()
@@ -0,0 +1,59 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import base64
+import hashlib
+import threading
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+
+
+def calculate_etag(chunk: bytes) -> str:
+    """
+    Summary:
+        The function is to calculate the Content-MD5 of a chunk.
+    Parameter:
+        - chunk(bytes): the chunk data.
+    return:
+        - str: the base64 encoded md5 of chunk.
+    """
+    return base64.b64encode(hashlib.md5(chunk).digest()).decode('utf-8')
+
+
+class ChunkHasher:
+    """
+    Summary:
+        The class calculates the md5 of chunks in a pool of threads, so the
+        reader only reads the file and the hashing scales with the cores.
+        hashlib releases the GIL for large buffers so threads are enough.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, chunk: bytes) -> Future:
+        """
+        Summary:
+            Start to calculate the md5 of chunk in background.
+        Parameter:
+            - chunk(bytes): the chunk data.
+        return:
+            - Future: the future of base64 encoded md5.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='hasher')
+            return self._executor.submit(calculate_etag, chunk)
+
+    def shutdown(self) -> None:
+        """
+        Summary:
+            Stop the background workers after all the chunks are hashed.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -0,0 +1,233 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+
+from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.exception import CHUNK_REQUEST_CANCELLED
+
+logger = getLogger(__name__)
+
+# the result of duplicate request that is not sent
+NOT_SENT = object()
+
+
+def stream_until_cancelled(data: bytes, cancelled: threading.Event, blocks: Iterable[bytes] = None) -> Iterator[bytes]:
+    """
+    Summary:
+        Send the data in blocks until the request is cancelled, so the
+        hedged request that loses stops at the next block.
+    Parameter:
+        - data(bytes): the data to send.
+        - cancelled(Event): it is set when the request is cancelled.
+        - blocks(Iterable): the blocks of data, eg. under the bandwidth
+            limit. By default the data is split without copy.
+    return:
+        - Iterator[bytes]: the blocks of data.
+    """
+    if blocks is None:
+        view = memoryview(data)
+        block_size = AppConfig.Env.chunk_hedge_block_size
+        blocks = (view[offset : offset + block_size] for offset in range(0, len(view), block_size))
+
+    for block in blocks:
+        if cancelled.is_set():
+            raise CHUNK_REQUEST_CANCELLED()
+        yield block
+
+
+class LatencyTracker:
+    """
+    Summary:
+        The latency per byte of recent chunk uploads. The hedge delay of a
+        chunk is the percentile of them times the size of chunk, so the
+        chunks of different sizes are compared fairly.
+    """
+
+    def __init__(
+        self,
+        percentile: float = AppConfig.Env.chunk_hedge_percentile,
+        window: int = AppConfig.Env.chunk_hedge_window,
+        min_samples: int = AppConfig.Env.chunk_hedge_min_samples,
+    ) -> None:
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def observe(self, size: int, seconds: float) -> None:
+        """
+        Summary:
+            Record the time of a chunk uploaded.
+        Parameter:
+            - size(int): the size of chunk.
+            - seconds(float): the time spent to upload the chunk.
+        """
+        with self._lock:
+            self._samples.append(seconds / max(size, 1))
+
+    def hedge_delay(self, size: int) -> Optional[float]:
+        """
+        Summary:
+            Get the time to wait before the duplicate request of chunk.
+        Parameter:
+            - size(int): the size of chunk.
+        return:
+            - float: the seconds, or None if there are not enough samples.
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+
+        index = min(math.ceil(len(samples) * self.percentile / 100) - 1, len(samples) - 1)
+        return max(samples[max(index, 0)] * size, AppConfig.Env.chunk_hedge_min_delay)
+
+
+class ChunkHedger:
+    """
+    Summary:
+        Send a duplicate request of chunk when the first one is slower than
+        the recent chunks, and take whichever finishes first. The upload of a
+        part number replaces the previous one in multipart upload, and both
+        requests send the same content, so the duplicate is safe. The request
+        that loses is cancelled, so it does not keep the chunk data and the
+        connection. With thread engine, the first request is sent by the
+        calling thread and the duplicate by a worker of hedger.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.tracker = LatencyTracker()
+        # the number of duplicate requests sent
+        self.hedged = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix='chunk-hedger')
+
+    def _timed(self, request: Callable[[threading.Event], Any], size: int, cancelled: threading.Event) -> Any:
+        start_time = time.monotonic()
+        result = request(cancelled)
+        self.tracker.observe(size, time.monotonic() - start_time)
+        return result
+
+    def _hedge(
+        self,
+        request: Callable[[threading.Event], Any],
+        size: int,
+        delay: float,
+        first_done: threading.Event,
+        first_cancelled: threading.Event,
+        cancelled: threading.Event,
+    ) -> Any:
+        if first_done.wait(delay):
+            return NOT_SENT
+
+        self._count_hedged(delay)
+        result = self._timed(request, size, cancelled)
+        first_cancelled.set()
+        return result
+
+    def _count_hedged(self, delay: float) -> None:
+        with self._lock:
+            self.hedged += 1
+        logger.info(f'Send duplicate chunk request after {delay:.2f}s')
+
+    def call(self, request: Callable[[], Any], size: int) -> Any:
+        """
+        Summary:
+            Run the request on the calling thread and hedge it if it is slow.
+        Parameter:
+            - request(Callable): the function to send the chunk. It takes the
+                event set when the request is cancelled, and it must raise
+                if the upload failed or is cancelled.
+            - size(int): the size of chunk.
+        return:
+            - Any: the result of the request that finished first.
+        """
+        cancelled = threading.Event()
+        delay = self.tracker.hedge_delay(size)
+        if delay is None:
+            return self._timed(request, size, cancelled)
+
+        done, hedge_cancelled = threading.Event(), threading.Event()
+        hedge = self._executor.submit(self._hedge, request, size, delay, done, cancelled, hedge_cancelled)
+        try:
+            result = self._timed(request, size, cancelled)
+        except Exception as e:
+            error = e
+        else:
+            # the duplicate lost, it stops at the next block
+            hedge_cancelled.set()
+            return result
+        finally:
+            done.set()
+
+        # the request failed or it is cancelled by the duplicate that finished
+        # first. it fails only when both requests failed
+        try:
+            result = hedge.result()
+        except Exception:
+            result = NOT_SENT
+        if result is NOT_SENT:
+            raise error
+        return result
+
+    async def call_async(self, request: Callable[[], Awaitable[Any]], size: int) -> Any:
+        """
+        Summary:
+            The async version of call.
+        Parameter:
+            - request(Callable): the coroutine function to send the chunk.
+            - size(int): the size of chunk.
+        return:
+            - Any: the result of the request that finished first.
+        """
+
+        async def timed() -> Any:
+            start_time = time.monotonic()
+            result = await request()
+            self.tracker.observe(size, time.monotonic() - start_time)
+            return result
+
+        delay = self.tracker.hedge_delay(size)
+        if delay is None:
+            return await timed()
+
+        pending = {asyncio.ensure_future(timed())}
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            self._count_hedged(delay)
+            pending.add(asyncio.ensure_future(timed()))
+
+        error = None
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def shutdown(self) -> None:
+        """
+        Summary:
+            Stop the workers once the requests in background finished.
+        """
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,106 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import os
+import threading
+
+from app.configs.app_config import AppConfig
+
+
+def _advise(fd: int, offset: int, size: int, advice_name: str) -> None:
+    # posix_fadvise is not available on windows and macos
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, size, advice)
+    except OSError:
+        pass
+
+
+def release_page_cache(local_path: str, offset: int, size: int) -> None:
+    """
+    Summary:
+        The function is to tell the kernel that the pages of an uploaded chunk
+        will not be used again, so a large upload does not evict the page
+        cache of other processes on the same node. The page cache belongs to
+        the file, so a new descriptor can be used after the reader is closed.
+    Parameter:
+        - local_path(str): the path of local file.
+        - offset(int): the offset of chunk in file.
+        - size(int): the size of chunk.
+    """
+    if not AppConfig.Env.release_page_cache:
+        return
+    try:
+        fd = os.open(local_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        _advise(fd, offset, size, 'POSIX_FADV_DONTNEED')
+    finally:
+        os.close(fd)
+
+
+class ChunkReader:
+    """
+    Summary:
+        The class reads chunks of a file by offset with os.pread. The data is
+        read straight into the bytes object which is hashed and sent as the
+        request body, without the buffer of file object or a shared file
+        position. On the platforms without pread, seek and read are used.
+    """
+
+    def __init__(self, local_path: str) -> None:
+        self.local_path = local_path
+        self.fd = os.open(local_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self._lock = threading.Lock()
+        _advise(self.fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+
+    def read(self, offset: int, size: int) -> bytes:
+        """
+        Summary:
+            Read a chunk of file.
+        Parameter:
+            - offset(int): the offset of chunk in file.
+            - size(int): the maximum size of chunk.
+        return:
+            - bytes: the chunk data. it is shorter than size at the end of
+                file and empty after the end of file.
+        """
+        if not hasattr(os, 'pread'):
+            with self._lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                return self._read_full(size, lambda n, _: os.read(self.fd, n), offset)
+
+        return self._read_full(size, lambda n, pos: os.pread(self.fd, n, pos), offset)
+
+    def _read_full(self, size: int, read, offset: int) -> bytes:
+        # one read call can return less than asked for large chunks
+        data = read(size, offset)
+        if len(data) == size or not data:
+            return data
+
+        parts = [data]
+        received = len(data)
+        while received < size:
+            data = read(size - received, offset + received)
+            if not data:
+                break
+            parts.append(data)
+            received += len(data)
+        return b''.join(parts)
+
+    def close(self) -> None:
+        """
+        Summary:
+            Close the file descriptor.
+        """
+        os.close(self.fd)
+
+    def __enter__(self) -> 'ChunkReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
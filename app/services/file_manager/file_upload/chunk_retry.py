@@ -0,0 +1,122 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from logging import getLogger
+from typing import Callable
+from typing import List
+from typing import Tuple
+
+from httpx import HTTPStatusError
+from httpx import TransportError
+
+from app.configs.app_config import AppConfig
+from app.services.clients.exception import REQUEST_NOT_SENT
+
+logger = getLogger(__name__)
+
+
+def is_expired_presigned_url(error: HTTPStatusError) -> bool:
+    """
+    Summary:
+        Check if the object storage rejected the chunk since its presigned
+        url is expired. The other 403 means the permission is denied.
+    Parameter:
+        - error(HTTPStatusError): the error of chunk upload.
+    return:
+        - bool: if the presigned url is expired.
+    """
+    response = error.response
+    return response.status_code == 403 and error.request.method == 'PUT' and 'expired' in response.text.lower()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Summary:
+        Check if the chunk upload failed with a transient error. The local
+        errors like reading the file are not retried.
+    Parameter:
+        - error(BaseException): the error of chunk upload.
+    return:
+        - bool: if the chunk should be retried.
+    """
+    if isinstance(error, HTTPStatusError):
+        return error.response.status_code in AppConfig.Env.chunk_retry_code or is_expired_presigned_url(error)
+    return isinstance(error, (TransportError, REQUEST_NOT_SENT, ConnectionError, TimeoutError))
+
+
+def get_retry_delay(attempt: int) -> float:
+    """
+    Summary:
+        The exponential backoff with jitter before the next attempt, so the
+        chunks failed at same time are not retried at same time.
+    Parameter:
+        - attempt(int): the number of failed attempts.
+    return:
+        - float: the delay in seconds.
+    """
+    backoff = min(AppConfig.Env.chunk_retry_backoff * 2 ** (attempt - 1), AppConfig.Env.chunk_retry_max_backoff)
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class RetryScheduler:
+    """
+    Summary:
+        The class runs the retries of failed chunks once their backoff delay
+        is over. A single timer thread keeps the retries in a heap, so the
+        upload workers never sleep for the backoff and keep uploading the
+        other chunks in the meantime.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        # (due time, sequence, retry function)
+        self._queue: List[Tuple[float, int, Callable[[], None]]] = []
+        self._sequence = itertools.count()
+        self._thread = None
+        self._closed = False
+
+    def schedule(self, delay: float, retry: Callable[[], None]) -> None:
+        """
+        Summary:
+            Run the retry function after the delay.
+        Parameter:
+            - delay(float): the delay in seconds.
+            - retry(Callable): the function to retry the chunk.
+        """
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._sequence), retry))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='retry', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+                _, _, retry = heapq.heappop(self._queue)
+
+            try:
+                retry()
+            except Exception:
+                logger.exception('Failed to retry the chunk upload')
+
+    def shutdown(self) -> None:
+        """
+        Summary:
+            Stop the timer thread, the retries not started are dropped.
+        """
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._condition.notify()
@@ -0,0 +1,192 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+import time
+from typing import Union
+
+import click
+from httpx import HTTPStatusError
+from httpx import TransportError
+
+from app.configs.app_config import AppConfig
+from app.services.clients.host_coordinator import HostCoordinator
+
+THREAD_AUTO = 'auto'
+
+
+def is_congestion(error: BaseException) -> bool:
+    """
+    Summary:
+        Check if the error means the services or network are overloaded.
+    Parameter:
+        - error(BaseException): the error of chunk upload.
+    return:
+        - bool: if the concurrency should be cut back.
+    """
+    if isinstance(error, HTTPStatusError):
+        return error.response.status_code in AppConfig.Env.auto_thread_congestion_code
+    return isinstance(error, TransportError)
+
+
+class ThreadCountType(click.ParamType):
+    """The click type of --thread option, a positive number or `auto`."""
+
+    name = 'integer|auto'
+
+    def convert(self, value, param, ctx) -> Union[int, str]:
+        if value == THREAD_AUTO:
+            return value
+        try:
+            num_of_thread = int(value)
+        except (TypeError, ValueError):
+            self.fail(f'{value!r} is not a valid integer or {THREAD_AUTO!r}.', param, ctx)
+        if num_of_thread < 1:
+            self.fail(f'{value!r} is not a positive integer.', param, ctx)
+        return num_of_thread
+
+
+class ConcurrencyController:
+    """
+    Summary:
+        The limit of concurrent chunk uploads. With a fixed thread count the
+        limit never changes. In adaptive mode it follows additive increase
+        and multiplicative decrease (AIMD): the chunks are measured in rounds
+        of `limit` chunks, and after each round the limit grows by one if the
+        throughput did not drop and the latency per byte stays close to the
+        best one seen. A throttling or network error cuts the limit in half,
+        at most once per round, so a burst of errors counts as one signal.
+        With a host coordinator, each upload also takes a slot shared by the
+        processes on the host.
+    """
+
+    def __init__(self, min_limit: int, max_limit: int = None, coordinator: HostCoordinator = None) -> None:
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit or min_limit, self.min_limit)
+        self.adaptive = self.max_limit > self.min_limit
+        self.limit = self.min_limit
+        self.active = 0
+        # the throughput in bytes per second of the last round
+        self.throughput = 0.0
+        self.coordinator = coordinator
+
+        self._slots = threading.local()
+        self._condition = threading.Condition()
+        self._base_latency = None
+        self._decreased = False
+        self._start_round(time.monotonic())
+
+    @classmethod
+    def from_thread_option(
+        cls, num_of_thread: Union[int, str], coordinator: HostCoordinator = None
+    ) -> 'ConcurrencyController':
+        """
+        Summary:
+            Create the controller from --thread option, which is the number
+            of threads or `auto`.
+        Parameter:
+            - num_of_thread(int|str): the option value.
+            - coordinator(HostCoordinator): the coordinator of --host-threads.
+        return:
+            - ConcurrencyController: the controller.
+        """
+        if num_of_thread == THREAD_AUTO:
+            return cls(AppConfig.Env.auto_thread_min, AppConfig.Env.auto_thread_max, coordinator)
+        return cls(int(num_of_thread), coordinator=coordinator)
+
+    def _start_round(self, now: float) -> None:
+        self._round_start = now
+        self._round_bytes = 0
+        self._round_count = 0
+        self._round_seconds = 0.0
+
+    def acquire(self) -> None:
+        """
+        Summary:
+            Block until another chunk upload can start.
+        """
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+
+        if self.coordinator is not None:
+            # the slot is kept by the thread until release
+            try:
+                self._slots.slot = self.coordinator.acquire()
+            except BaseException:
+                with self._condition:
+                    self.active -= 1
+                    self._condition.notify_all()
+                raise
+
+    def release(self) -> None:
+        """
+        Summary:
+            Mark a chunk upload as finished.
+        """
+        if self.coordinator is not None:
+            self.coordinator.release(self._slots.slot)
+
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def on_success(self, size: int, seconds: float) -> None:
+        """
+        Summary:
+            Record a chunk uploaded and adjust the limit after each round.
+        Parameter:
+            - size(int): the size of chunk.
+            - seconds(float): the time spent to upload the chunk.
+        """
+        now = time.monotonic()
+        with self._condition:
+            self._round_bytes += size
+            self._round_count += 1
+            self._round_seconds += seconds
+            if self._round_count < self.limit:
+                return
+
+            elapsed = now - self._round_start
+            throughput = self._round_bytes / elapsed if elapsed > 0 else self.throughput
+            latency = self._round_seconds / max(self._round_bytes, 1)
+            if self._base_latency is None or latency < self._base_latency:
+                self._base_latency = latency
+
+            latency_stable = latency <= self._base_latency * AppConfig.Env.auto_thread_latency_tolerance
+            throughput_kept = throughput >= self.throughput * (1 - AppConfig.Env.auto_thread_throughput_tolerance)
+            if self.adaptive and latency_stable and throughput_kept:
+                self.limit = min(self.limit + 1, self.max_limit)
+                self._condition.notify_all()
+
+            self.throughput = throughput
+            self._decreased = False
+            self._start_round(now)
+
+    def on_error(self, error: BaseException) -> None:
+        """
+        Summary:
+            Cut the limit in half if the chunk failed with congestion.
+        Parameter:
+            - error(BaseException): the error of chunk upload.
+        """
+        if not self.adaptive or not is_congestion(error):
+            return
+
+        with self._condition:
+            if self._decreased:
+                return
+            self.limit = max(self.limit // 2, self.min_limit)
+            self._decreased = True
+            self._start_round(time.monotonic())
+
+    def describe(self) -> str:
+        """
+        Summary:
+            The status of controller for progress display.
+        return:
+            - str: the concurrency and throughput.
+        """
+        return f'{self.limit} threads {self.throughput / 1024 / 1024:.1f}MB/s'
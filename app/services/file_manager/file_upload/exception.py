@@ -8,3 +8,18 @@ class INVALID_CHUNK_ETAG(Exception):
 
     def __init__(self, chunk_number: int) -> None:
         self.chunk_number = chunk_number
+
+
+class CHUNK_UPLOAD_FAILED(Exception):
+    chunk_number: int
+    attempts: int
+
+    def __init__(self, chunk_number: int, attempts: int, error: BaseException) -> None:
+        self.chunk_number = chunk_number
+        self.attempts = attempts
+        super().__init__(f'chunk {chunk_number} failed after {attempts} attempts: {error}')
+
+
+class CHUNK_REQUEST_CANCELLED(Exception):
+    def __init__(self) -> None:
+        super().__init__('the chunk request is cancelled since its duplicate finished first')
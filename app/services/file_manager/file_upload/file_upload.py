@@ -3,14 +3,22 @@
 # Contact Indoc Systems for any questions regarding the use of this source code.
 
 import os
+import threading
 import time
 import zipfile
+from functools import partial
+from itertools import chain
 from multiprocessing.pool import ThreadPool
 from sys import exit
 from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import NamedTuple
 from typing import Tuple
+from typing import Union
 
 import click
 from click.exceptions import Abort
@@ -19,18 +27,32 @@ import app.services.logger_services.log_functions as logger
 import app.services.output_manager.message_handler as mhandler
 from app.configs.app_config import AppConfig
 from app.models.item import ItemType
+from app.services.clients.host_coordinator import HostCoordinator
+from app.services.clients.transfer_engine import AsyncTransferEngine
+from app.services.file_manager.file_upload.concurrency_controller import ConcurrencyController
 from app.services.file_manager.file_upload.models import FileObject
 from app.services.file_manager.file_upload.models import ItemStatus
+from app.services.file_manager.file_upload.models import UploadTarget
 from app.services.file_manager.file_upload.models import UploadType
+from app.services.file_manager.file_upload.part_planner import PartPlanner
 from app.services.file_manager.file_upload.upload_client import UploadClient
+from app.services.file_manager.file_upload.upload_journal import UploadJournal
+from app.services.file_manager.file_upload.upload_scheduler import SchedulePolicy
+from app.services.file_manager.file_upload.upload_scheduler import UploadScheduler
 from app.services.output_manager.error_handler import ECustomizedError
 from app.services.output_manager.error_handler import SrvErrorHandler
 from app.services.output_manager.error_handler import customized_error_msg
+from app.services.output_manager.progress_renderer import ProgressRenderer
+from app.services.user_authentication.token_refresh_scheduler import TokenRefreshScheduler
 from app.utils.aggregated import batch_generator
-from app.utils.aggregated import get_file_in_folder
+from app.utils.aggregated import check_item_duplication
 from app.utils.aggregated import get_file_info_by_geid
+from app.utils.aggregated import iter_file_in_folder
 from app.utils.aggregated import normalize_join
+from app.utils.aggregated import pipelined_map
 from app.utils.aggregated import search_item
+from app.utils.stat_cache import isdir
+from app.utils.stat_cache import isfile
 
 
 def compress_folder_to_zip(path):
@@ -44,15 +66,82 @@ def compress_folder_to_zip(path):
     zipf.close()
 
 
+def resolve_target_folder(
+    target_folder: str, project_code: str, folder_type: ItemType, zone: str
+) -> Tuple[Dict, str, str]:
+    """
+    Summary:
+        Find the longest parent folder of target folder that exists in the
+        backend. Since cli will allow user to specify the folder that is not
+        exist yet, the user is asked once to create the missing folders. By
+        default, the parent folder will be name folder. The folders under
+        name folder are checked in one request, and only the deepest existing
+        folder is searched for its detail. The result is shared by all the
+        input paths of upload.
+    Parameters:
+        - target_folder(str): the folder on the platform
+        - project_code(str): the unique identifier of project
+        - folder_type(ItemType): the type of root folder
+        - zone(str): the zone label eg.greenroom/core
+    Return:
+        - parent_folder: the item information of longest parent folder
+        - new_folder_node: the first folder to create, empty if all exist
+        - target_folder: the target folder with the prefix of root folder
+    """
+    target_folder = folder_type.get_prefix_by_type() + target_folder
+
+    # the name folder is the first parent folder, the folders under it are
+    # checked in batch. the cli will not create any name folder
+    sub_path = target_folder.split('/')
+    folder_paths = ['/'.join(sub_path[0 : 2 + index]) for index in range(len(sub_path) - 1)]
+    # the path is case insensitive like the check of file duplication,
+    # the existing folder is searched with the path from backend
+    exist_paths = {}
+    if len(folder_paths) > 1:
+        zone_code = {AppConfig.Env.green_zone: 0, AppConfig.Env.core_zone: 1}.get(str(zone).lower(), zone)
+        exist_paths = {x.lower(): x for x in check_item_duplication(folder_paths[1:], zone_code, project_code)}
+
+    # find the longest existing folder as parent folder
+    parent_path, new_folder_node = folder_paths[0], ''
+    for folder_path in folder_paths[1:]:
+        if folder_path.lower() in exist_paths:
+            parent_path = exist_paths[folder_path.lower()]
+            continue
+
+        # if user input a path that need to create some folders
+        try:
+            click.confirm(customized_error_msg(ECustomizedError.CREATE_FOLDER_IF_NOT_EXIST), abort=True)
+        except Abort:
+            mhandler.SrvOutPutHandler.cancel_upload()
+            exit(1)
+
+        # stop scaning and use the current folder as parent folder
+        new_folder_node = folder_path
+        break
+    parent_folder = search_item(project_code, zone, parent_path).get('result', {})
+
+    # error check if the user dont have permission to see the folder
+    # because the name folder will always be there if user has correct permission
+    if not parent_folder:
+        SrvErrorHandler.customized_handle(ECustomizedError.PERMISSION_DENIED, True)
+
+    return parent_folder, new_folder_node, target_folder
+
+
 def assemble_path(
-    f: str, target_folder: str, project_code: str, folder_type: ItemType, zone: str
+    f: str,
+    target_folder: str,
+    project_code: str,
+    folder_type: ItemType,
+    zone: str,
+    resolved_target: Tuple[Dict, str, str] = None,
 ) -> Tuple[str, Dict, bool, str]:
     '''
     Summary:
         the function is to find the longest parent folder that exists
-        in the backend. Since cli will allow user to specify the folder
-        that is not exist yet. and let upload process to create them.
-        By default, the parent folder will be name folder.
+        in the backend with resolve_target_folder. Since cli will allow
+        user to specify the folder that is not exist yet. and let upload
+        process to create them.
 
         also the function will format the local path with the target path.
         eg. path is folder1/file1(local) and target folder is admin/target1(on platform)
@@ -63,6 +152,8 @@ def assemble_path(
          - target_folder(str): the folder on the platform
          - project_code(str): the unique identifier of project
          - zone(str): the zone label eg.greenroom/core
+         - resolved_target(tuple): the result of resolve_target_folder, so
+           the inputs of same target folder are resolved once
     Return:
          - current_file_path: the format file path on platform
          - parent_folder: the item information of longest parent folder
@@ -70,129 +161,234 @@ def assemble_path(
          - target_folder: result object path on platform
 
     '''
-    current_file_path = target_folder + '/' + f.rstrip('/').split('/')[-1]
-    # set name folder as first parent folder
-    root_folder = folder_type.get_prefix_by_type() + target_folder.split('/')[0]
-    parent_folder = search_item(project_code, zone, root_folder).get('result', {})
+    if resolved_target is None:
+        resolved_target = resolve_target_folder(target_folder, project_code, folder_type, zone)
+    parent_folder, new_folder_node, prefixed_target_folder = resolved_target
 
+    current_file_path = target_folder + '/' + f.rstrip('/').split('/')[-1]
     # if f input is a file then current_folder_node is target_folder
     # otherwise it is target_folder + f input name
-    current_folder_node = target_folder if os.path.isfile(f) else current_file_path
-    create_folder_flag = False
+    current_folder_node = target_folder if isfile(f) else current_file_path
     # add prefix to folder
     current_folder_node = folder_type.get_prefix_by_type() + current_folder_node
-    target_folder = folder_type.get_prefix_by_type() + target_folder
 
-    if len(current_file_path.split('/')) > 2:
-        sub_path = target_folder.split('/')
-        for index in range(len(sub_path) - 1):
-            folder_path = '/'.join(sub_path[0 : 2 + index])
-            res = search_item(project_code, zone, folder_path)
-
-            # find the longest existing folder as parent folder
-            # if user input a path that need to create some folders
-            if not res.get('result'):
-                try:
-                    click.confirm(customized_error_msg(ECustomizedError.CREATE_FOLDER_IF_NOT_EXIST), abort=True)
-                except Abort:
-                    mhandler.SrvOutPutHandler.cancel_upload()
-                    exit(1)
-
-                # stop scaning and use the current folder as parent folder
-                current_folder_node = folder_path
-                create_folder_flag = True
-                break
-            else:
-                parent_folder = res.get('result')
+    # the new folders are created from the first missing one
+    if new_folder_node:
+        return new_folder_node, parent_folder, True, prefixed_target_folder
+    return current_folder_node, parent_folder, False, prefixed_target_folder
 
-    # error check if the user dont have permission to see the folder
-    # because the name folder will always be there if user has correct permission
-    if not parent_folder:
-        SrvErrorHandler.customized_handle(ECustomizedError.PERMISSION_DENIED, True)
 
-    return current_folder_node, parent_folder, create_folder_flag, target_folder
+def generate_file_objects(
+    upload_file_path: Iterable[str],
+    input_path: str,
+    target_folder: str,
+    part_planner: PartPlanner,
+    warn_empty: bool = True,
+) -> Iterator[FileObject]:
+    """
+    Summary:
+        Generate the file object of each local file lazily.
+    Parameters:
+        - upload_file_path: the local path of files
+        - input_path: the local folder that is removed from the object path
+        - target_folder: the folder on the platform
+        - part_planner: the planner to pick the chunk size of files
+        - warn_empty: if warn the skipped files with 0 size
+    """
+    for file in upload_file_path:
+        # first remove the input path from the file path
+        file_path_sub = file.replace(input_path + '/', '') if input_path else file
+        object_path = normalize_join(target_folder, file_path_sub)
 
+        # generate a placeholder for each file
+        file_object = FileObject(object_path, file, part_planner=part_planner)
+        # skip the file with 0 size
+        if file_object.total_size == 0:
+            if warn_empty:
+                logger.warning(f'Skip the file with 0 size: {file_object.file_name}')
+        else:
+            yield file_object
 
-def simple_upload(  # noqa: C901
-    upload_event,
-    num_of_thread: int = 1,
-    output_path: str = None,
-) -> List[str]:
-    upload_start_time = time.time()
+
+def check_file_duplication(
+    upload_client: UploadClient, file_objects: Iterable[FileObject]
+) -> Iterator[Tuple[List[FileObject], List[str]]]:
+    """
+    Summary:
+        Check the duplication of files by batch. The batches are checked
+        concurrently and the files are consumed lazily.
+    Parameters:
+        - upload_client: the upload client
+        - file_objects: the files to be uploaded
+    """
+    file_batchs = batch_generator(file_objects, batch_size=AppConfig.Env.upload_batch_size)
+    for results in pipelined_map(
+        upload_client.check_upload_duplication, file_batchs, AppConfig.Env.upload_pipeline_batches
+    ):
+        yield from results
+
+
+def report_upload_failures(upload_client: UploadClient) -> None:
+    """
+    Summary:
+        Report the files failed to upload or finalise, and exit with the
+        upload failure if there is any.
+    Parameters:
+        - upload_client: the upload client
+    """
+    finaliser = upload_client.finaliser
+    if not finaliser.failures:
+        return
+
+    for failure in finaliser.failures.values():
+        mhandler.SrvOutPutHandler.upload_failed(failure.file_name, failure.error)
+    SrvErrorHandler.customized_handle(ECustomizedError.UPLOAD_FAIL, True)
+
+
+class UploadInput(NamedTuple):
+    """An input path of upload, the files are scanned lazily."""
+
+    target: UploadTarget
+    scan_file_path: Callable[[], Iterator[str]]
+    # the local folder that is removed from the object path
+    input_folder: str
+    target_folder: str
+    check_duplication: bool
+
+
+def scan_upload_input(upload_event: Dict[str, Any]) -> UploadInput:
+    """
+    Summary:
+        Find the files of an input path and the folder on the platform that
+        they go into. The folder is compressed first if zip is requested.
+    Parameters:
+        - upload_event: the upload event of the input path
+    """
     input_path = upload_event.get('file')
-    project_code = upload_event.get('project_code')
-    tags = upload_event.get('tags')
-    zone = upload_event.get('zone')
-    current_folder_node = upload_event.get('current_folder_node', '')
-    parent_folder_id = upload_event.get('parent_folder_id', '')
     create_folder_flag = upload_event.get('create_folder_flag', False)
-    compress_zip = upload_event.get('compress_zip', False)
-    regular_file = upload_event.get('regular_file', True)
-    source_id = upload_event.get('source_id', '')
-    attribute = upload_event.get('attribute')
 
     mhandler.SrvOutPutHandler.start_uploading(input_path)
     # if the input request zip folder then process the path as single file
     # otherwise read throught the folder to get path underneath
-    if os.path.isdir(input_path):
-        job_type = UploadType.AS_FILE if compress_zip else UploadType.AS_FOLDER
+    if isdir(input_path):
+        job_type = UploadType.AS_FILE if upload_event.get('compress_zip', False) else UploadType.AS_FOLDER
         if job_type == UploadType.AS_FILE:
             upload_file_path = [input_path.rstrip('/').lstrip() + '.zip']
             compress_folder_to_zip(input_path)
-        elif tags or attribute or source_id:
+            scan_file_path = partial(iter, upload_file_path)
+        elif upload_event.get('tags') or upload_event.get('attribute') or upload_event.get('source_id', ''):
             SrvErrorHandler.customized_handle(ECustomizedError.UNSUPPORT_TAG_MANIFEST, True)
         else:
-            upload_file_path = get_file_in_folder(input_path)
+            scan_file_path = partial(iter_file_in_folder, input_path)
     else:
         upload_file_path = [input_path]
 
+        scan_file_path = partial(iter, upload_file_path)
+
         if create_folder_flag:
             job_type = UploadType.AS_FOLDER
         else:
             job_type = UploadType.AS_FILE
 
+    target = UploadTarget(
+        job_type, upload_event.get('current_folder_node', ''), upload_event.get('parent_folder_id', '')
+    )
+    # make the file duplication check to allow folder merging
+    return UploadInput(
+        target,
+        scan_file_path,
+        os.path.dirname(input_path),
+        upload_event.get('target_folder', ''),
+        create_folder_flag is not True,
+    )
+
+
+def simple_upload(  # noqa: C901
+    upload_event: Union[Dict[str, Any], List[Dict[str, Any]]],
+    num_of_thread: Union[int, str] = 1,
+    output_path: str = None,
+    max_inflight_mb: int = AppConfig.Env.max_inflight_mb,
+    engine: AsyncTransferEngine = None,
+    host_coordinator: HostCoordinator = None,
+    schedule: SchedulePolicy = SchedulePolicy.WALK,
+    hedge: bool = False,
+) -> List[str]:
+    """
+    Summary:
+        Upload the input paths of one command. All the input paths share the
+        duplication check, the pipeline of registration, the pool of chunk
+        upload and the manifest, so the inputs overlap with each other.
+    Parameters:
+        - upload_event: the upload event, or the list of them for each input
+          path. the project, zone, tags and attributes are taken from the first
+        - num_of_thread: the number of thread to upload the file, or `auto`
+        - output_path: the path of manifest for resumable upload
+        - max_inflight_mb: the memory budget in MB of chunks waiting to be uploaded
+        - engine: the async engine to upload chunks, the ThreadPool is used if None
+        - host_coordinator: the coordinator to share the chunk uploads with
+          other processes on the host
+        - schedule: the policy to order the files to upload
+        - hedge: send a duplicate request of the slow chunks
+    return:
+        - list of str: the item ids of registered files
+    """
+    upload_start_time = time.time()
+    upload_events = [upload_event] if isinstance(upload_event, dict) else upload_event
+    upload_event = upload_events[0]
+    project_code = upload_event.get('project_code')
+    tags = upload_event.get('tags')
+    zone = upload_event.get('zone')
+    regular_file = upload_event.get('regular_file', True)
+    source_id = upload_event.get('source_id', '')
+    attribute = upload_event.get('attribute')
+
+    # in cloud mode the folder is scanned in parallel, the metadata is cached
+    # by the command until the upload is finished
+    upload_inputs = [scan_upload_input(event) for event in upload_events]
+
+    # the pool has a thread for each concurrent chunk upload at most
+    concurrency = ConcurrencyController.from_thread_option(num_of_thread, host_coordinator)
     upload_client = UploadClient(
         project_code=project_code,
         zone=zone,
-        job_type=job_type,
-        current_folder_node=current_folder_node,
-        parent_folder_id=parent_folder_id,
+        job_type=upload_inputs[0].target.job_type,
+        current_folder_node=upload_inputs[0].target.current_folder_node,
+        parent_folder_id=upload_inputs[0].target.parent_folder_id,
         regular_file=regular_file,
         tags=tags,
         source_id=source_id,
         attributes=attribute,
+        max_inflight_size=max_inflight_mb * 1024 * 1024,
+        engine=engine,
+        num_of_thread=concurrency.max_limit,
+        concurrency=concurrency,
+        hedge=hedge,
     )
 
     # format the local path into object storage path for preupload
-    file_objects = []
-    target_folder = upload_event.get('target_folder', '')
-    input_path = os.path.dirname(input_path)
-    for file in upload_file_path:
-        # first remove the input path from the file path
-        file_path_sub = file.replace(input_path + '/', '') if input_path else file
-        object_path = normalize_join(target_folder, file_path_sub)
-
-        # generate a placeholder for each file
-        file_object = FileObject(object_path, file)
-        # skip the file with 0 size
-        if file_object.total_size == 0:
-            logger.warning(f'Skip the file with 0 size: {file_object.file_name}')
-        else:
-            file_objects.append(file_object)
+    # the folder is scanned lazily, so only the batches in progress are kept
+    def scan_file_objects(upload_input: UploadInput, warn_empty: bool = True) -> Iterator[FileObject]:
+        return generate_file_objects(
+            upload_input.scan_file_path(),
+            upload_input.input_folder,
+            upload_input.target_folder,
+            upload_client.part_planner,
+            warn_empty,
+        )
 
-    # make the file duplication check to allow folde merging
-    non_duplicate_file_objects = []
-    if create_folder_flag is True:
-        non_duplicate_file_objects = file_objects
-    else:
+    # the duplication of all the inputs is checked together, the files only
+    # need the project and zone of client. the batches are checked concurrently
+    checked_inputs = [upload_input for upload_input in upload_inputs if upload_input.check_duplication]
+    duplicated_file = []
+    if checked_inputs:
         mhandler.SrvOutPutHandler.file_duplication_check()
-        duplicated_file = []
-        for file_batchs in batch_generator(file_objects, batch_size=AppConfig.Env.upload_batch_size):
-            non_duplicates, duplicate_path = upload_client.check_upload_duplication(file_batchs)
-            non_duplicate_file_objects.extend(non_duplicates)
+        num_of_new_files = 0
+        file_objects = chain.from_iterable(scan_file_objects(upload_input) for upload_input in checked_inputs)
+        for non_duplicates, duplicate_path in check_file_duplication(upload_client, file_objects):
+            num_of_new_files += len(non_duplicates)
             duplicated_file.extend(duplicate_path)
 
-        if len(non_duplicate_file_objects) == 0:
+        if num_of_new_files == 0 and len(checked_inputs) == len(upload_inputs):
             mhandler.SrvOutPutHandler.file_duplication_check_warning_with_all_same()
             SrvErrorHandler.customized_handle(ECustomizedError.UPLOAD_CANCEL, if_exit=True)
         elif len(duplicated_file) > 0:
@@ -207,71 +403,131 @@ def simple_upload(  # noqa: C901
                 mhandler.SrvOutPutHandler.cancel_upload()
                 exit(1)
 
-    # here is list of pre upload result. We decided to call pre upload api by batch
-    pre_upload_infos = []
-    for file_batchs in batch_generator(non_duplicate_file_objects, batch_size=AppConfig.Env.upload_batch_size):
-        # sending the pre upload request to generate
-        # the placeholder in object storage
-        pre_upload_infos.extend(upload_client.pre_upload(file_batchs, output_path))
-
-    # then output manifest file to the output path
-    upload_client.output_manifest(pre_upload_infos, output_path)
-
-    # now loop over each file under the folder and start
-    # the chunk upload
-
-    # thread number +1 reserve one thread to refresh token
-    # and remove the token decorator in functions
-
-    pool = ThreadPool(num_of_thread + 1)
-    pool.apply_async(upload_client.upload_token_refresh)
-    on_success_res = []
-
-    file_object: FileObject
-    for file_object in pre_upload_infos:
-        chunk_res = upload_client.stream_upload(file_object, pool)
-        # the on_success api will be called after all chunk uploaded
-        res = pool.apply_async(
-            upload_client.on_succeed,
-            args=(file_object, tags, chunk_res),
-        )
-        on_success_res.append(res)
-
-    # finish the upload once all on success api return
-    # otherwise wait for 1 second and check again
-    [res.wait() for res in on_success_res]
-    upload_client.set_finish_upload()
-
-    pool.close()
+    # the path is case insensitive in the check of duplication
+    duplicated_paths = {path.lower() for path in duplicated_file}
+
+    def iter_new_file_batches(upload_input: UploadInput) -> Iterator[Tuple[UploadTarget, List[FileObject]]]:
+        # the non duplicated files are not kept in memory. the folder is
+        # scanned again and the duplicated files found above are skipped
+        file_objects = scan_file_objects(upload_input, not upload_input.check_duplication)
+        if duplicated_paths:
+            file_objects = (x for x in file_objects if x.object_path.lower() not in duplicated_paths)
+        for file_batch in batch_generator(file_objects, batch_size=AppConfig.Env.upload_batch_size):
+            yield upload_input.target, file_batch
+
+    # the folder of upload as folder is created by pre upload. the first
+    # batch of each folder is registered alone, so the batches registered
+    # at same time do not create the same folder
+    create_folder_lock, created_folders = threading.Lock(), set()
+
+    def pre_upload(target_batch: Tuple[UploadTarget, List[FileObject]]) -> List[FileObject]:
+        target, file_batch = target_batch
+        if target.job_type != UploadType.AS_FOLDER or target.current_folder_node in created_folders:
+            return upload_client.pre_upload(file_batch, output_path=output_path, target=target)
+
+        with create_folder_lock:
+            registered_file_objects = upload_client.pre_upload(file_batch, output_path=output_path, target=target)
+            created_folders.add(target.current_folder_node)
+        return registered_file_objects
+
+    pool = ThreadPool(concurrency.max_limit)
+
+    # We decided to call pre upload api by batch. the batches are registered
+    # in background, a few batches ahead of the chunk upload. so the upload
+    # starts once the first batch is registered. the batches of each input
+    # only have the files of same target folder. only the ids and the last
+    # file are kept, the other file objects are released once uploaded
+    item_ids, last_file_object = [], None
+    file_batchs = chain.from_iterable(iter_new_file_batches(upload_input) for upload_input in upload_inputs)
+
+    # the on_success api will be called by finaliser after all chunk uploaded
+    scheduler = UploadScheduler(upload_client, pool, schedule)
+    progress = ProgressRenderer()
+    token_refresher = TokenRefreshScheduler()
+    try:
+        # the token is refreshed in background during the upload, so the
+        # token decorator is not needed in the functions of pool
+        token_refresher.subscribe()
+
+        # the manifest is output once, then the registered files and the progress
+        # of upload are appended to its journal instead of rewriting the manifest
+        if output_path:
+            upload_client.output_manifest([], output_path)
+            upload_client.journal = UploadJournal(output_path, new_manifest=True)
+
+        for results in pipelined_map(pre_upload, file_batchs, AppConfig.Env.upload_pipeline_batches):
+            registered_file_objects = [x for file_batch in results for x in file_batch]
+            item_ids.extend(x.item_id for x in registered_file_objects)
+            last_file_object = registered_file_objects[-1] if registered_file_objects else last_file_object
+            progress.add_total(len(registered_file_objects), sum(x.total_size for x in registered_file_objects))
+
+            # then record the registered files before their chunks are uploaded
+            if upload_client.journal is not None:
+                upload_client.journal.register(registered_file_objects)
+            scheduler.add(registered_file_objects)
+        scheduler.finish()
+
+        # finish the upload once all on success api return
+        upload_client.finaliser.wait()
+    finally:
+        scheduler.close()
+        progress.close()
+        token_refresher.unsubscribe()
+        # checkpoint the progress into manifest, also when upload is interrupted
+        if upload_client.journal is not None:
+            upload_client.journal.close()
+        # the background threads and the hash cache are stopped in any case,
+        # and the pool takes no more chunks
+        upload_client.set_finish_upload()
+        pool.close()
     pool.join()
 
-    if attribute:
+    # the files with failed chunks are not finalised
+    report_upload_failures(upload_client)
+
+    if attribute and last_file_object is not None:
         continue_loop = True
         while continue_loop:
             # the last uploaded file
-            succeed = upload_client.check_status(file_object)
+            succeed = upload_client.check_status(last_file_object)
             continue_loop = not succeed
             time.sleep(0.5)
 
-    num_of_file = len(pre_upload_infos)
-    logger.info(f'Upload Time: {time.time() - upload_start_time:.2f}s for {num_of_file:d} files')
+    logger.info(f'Upload Time: {time.time() - upload_start_time:.2f}s for {len(item_ids):d} files')
 
-    return [file_object.item_id for file_object in pre_upload_infos]
+    return item_ids
 
 
-def resume_upload(
+def resume_upload(  # noqa: C901
     manifest_json: Dict[str, Any],
-    num_of_thread: int = 1,
+    num_of_thread: Union[int, str] = 1,
+    max_inflight_mb: int = AppConfig.Env.max_inflight_mb,
+    engine: AsyncTransferEngine = None,
+    output_path: str = None,
+    host_coordinator: HostCoordinator = None,
+    schedule: SchedulePolicy = SchedulePolicy.WALK,
+    hedge: bool = False,
 ):
     """
     Summary:
-        Resume upload from the manifest file
+        Resume upload from the manifest file. For the journaled files, the
+        finalised files and the uploaded chunks are taken from the manifest,
+        and the server is only asked for the status of unfinished files.
     Parameters:
         - manifest_json: the manifest json which store the upload information
-        - num_of_thread: the number of thread to upload the file
+        - num_of_thread: the number of thread to upload the file, or `auto`
+          to adjust it by the throughput and errors
+        - max_inflight_mb: the memory budget in MB of chunks waiting to be uploaded
+        - engine: the async engine to upload chunks, the ThreadPool is used if None
+        - output_path: the path of manifest to journal the progress of resume
+        - host_coordinator: the coordinator to share the chunk uploads with
+          other processes on the host
+        - schedule: the policy to order the files to upload
+        - hedge: send a duplicate request of the slow chunks
     """
     upload_start_time = time.time()
 
+    concurrency = ConcurrencyController.from_thread_option(num_of_thread, host_coordinator)
     upload_client = UploadClient(
         project_code=manifest_json.get('project_code'),
         zone=manifest_json.get('zone'),
@@ -279,68 +535,95 @@ def resume_upload(
         current_folder_node=manifest_json.get('current_folder_node', ''),
         parent_folder_id=manifest_json.get('parent_folder_id', ''),
         tags=manifest_json.get('tags'),
+        max_inflight_size=max_inflight_mb * 1024 * 1024,
+        engine=engine,
+        num_of_thread=concurrency.max_limit,
+        concurrency=concurrency,
+        hedge=hedge,
     )
 
     # check files in manifest if some of them are already uploaded
-    unfinished_items = []
     all_files = manifest_json.get('file_objects')
-    item_ids = []
-    for item_id in all_files:
-        item_ids.append(item_id)
-
-    # here add the batch of 500 per loop, the pre upload api cannot
-    # process very large amount of file at same time. otherwise it will timeout
-    # here is list of pre upload result. We decided to call pre upload api by batch
-    for file_batchs in batch_generator(item_ids, batch_size=AppConfig.Env.upload_batch_size):
+    item_ids = [item_id for item_id, file_info in all_files.items() if not file_info.get('finalised')]
+
+    def check_unfinished_files(file_batchs: List[str]) -> List[FileObject]:
         items = get_file_info_by_geid(file_batchs)
 
         # get the detail of item to see if the file is already uploaded
-        unfinished_files = []
+        unfinished_files, unchecked_files = [], []
         for x in items:
             if x.get('result').get('status') == ItemStatus.REGISTERED:
                 file_info = all_files.get(x.get('result').get('id'))
-                unfinished_files.append(
-                    FileObject(
-                        file_info.get('object_path'),
-                        file_info.get('local_path'),
-                        file_info.get('resumable_id'),
-                        file_info.get('job_id'),
-                        file_info.get('item_id'),
-                    )
+                file_object = FileObject(
+                    file_info.get('object_path'),
+                    file_info.get('local_path'),
+                    file_info.get('resumable_id'),
+                    file_info.get('job_id'),
+                    file_info.get('item_id'),
+                    # the manifest before planned chunk size used the default size
+                    file_info.get('chunk_size', AppConfig.Env.chunk_size),
                 )
+                if file_info.get('journaled'):
+                    # the uploaded chunks are recorded in journal
+                    file_object.uploaded_chunks = file_info.get('uploaded_chunks')
+                    unfinished_files.append(file_object)
+                else:
+                    unchecked_files.append(file_object)
 
         # then for the rest of the files, check if any chunks are already uploaded
         mhandler.SrvOutPutHandler.resume_check_in_progress()
-        if len(unfinished_files) > 0:
-            unfinished_items.extend(upload_client.resume_upload(unfinished_files))
-
-    mhandler.SrvOutPutHandler.resume_warning(len(unfinished_items))
-    mhandler.SrvOutPutHandler.resume_check_success()
+        if len(unchecked_files) > 0:
+            unchecked_files = upload_client.resume_upload(unchecked_files)
+            # the journal takes over the chunks from the server once they are
+            # checked, so the next resume does not upload them again
+            if upload_client.journal is not None:
+                upload_client.journal.checked(unchecked_files)
+        return unfinished_files + unchecked_files
 
     # lastly, start resumable upload for the rest of the chunks
-    # thread number +1 reserve one thread to refresh token
-    # and remove the token decorator in functions
-
-    pool = ThreadPool(num_of_thread + 1)
-    pool.apply_async(upload_client.upload_token_refresh)
-    on_success_res = []
-    for file_object in unfinished_items:
-        chunk_res = upload_client.stream_upload(file_object, pool)
-        # NOTE: if there is some racing error make the combine chunks
-        # out of thread pool.
-        res = pool.apply_async(
-            upload_client.on_succeed,
-            args=(file_object, manifest_json.get('tags'), chunk_res),
-        )
-        on_success_res.append(res)
-
-    # finish the upload once all on success api return
-    # otherwise wait for 1 second and check again
-    [res.wait() for res in on_success_res]
-    upload_client.set_finish_upload()
-
-    pool.close()
+    pool = ThreadPool(concurrency.max_limit)
+    # the on_success api will be called by finaliser after all chunk uploaded
+    scheduler = UploadScheduler(upload_client, pool, schedule)
+    progress = ProgressRenderer()
+    token_refresher = TokenRefreshScheduler()
+    num_of_file = 0
+    try:
+        # the token is refreshed in background during the upload
+        token_refresher.subscribe()
+        if output_path:
+            upload_client.journal = UploadJournal(output_path)
+
+        # here add the batch of 500 per loop, the pre upload api cannot
+        # process very large amount of file at same time. otherwise it will timeout
+        # a few batches are checked concurrently, and each checked batch is
+        # uploaded while the next ones are checked
+        file_batchs = batch_generator(item_ids, batch_size=AppConfig.Env.upload_batch_size)
+        for results in pipelined_map(check_unfinished_files, file_batchs, AppConfig.Env.upload_pipeline_batches):
+            for unfinished_files in results:
+                num_of_file += len(unfinished_files)
+                progress.add_total(len(unfinished_files), sum(x.total_size for x in unfinished_files))
+                scheduler.add(unfinished_files)
+
+        mhandler.SrvOutPutHandler.resume_warning(num_of_file)
+        mhandler.SrvOutPutHandler.resume_check_success()
+        scheduler.finish()
+
+        # finish the upload once all on success api return
+        upload_client.finaliser.wait()
+    finally:
+        scheduler.close()
+        progress.close()
+        token_refresher.unsubscribe()
+        # checkpoint the progress into manifest, also when upload is interrupted
+        if upload_client.journal is not None:
+            upload_client.journal.close()
+        # the background threads and the hash cache are stopped in any case,
+        # and the pool takes no more chunks
+        upload_client.set_finish_upload()
+        pool.close()
     pool.join()
 
-    num_of_file = len(unfinished_items)
+    # the files with failed chunks are not finalised
+    report_upload_failures(upload_client)
+
     logger.info(f'Upload Time: {time.time() - upload_start_time:.2f}s for {num_of_file:d} files')
@@ -0,0 +1,46 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+
+
+class InflightBudget:
+    """
+    Summary:
+        The byte budget shared by all the chunks of one upload action.
+        The reader acquires the size of a chunk before loading it into
+        memory and the worker releases it once the chunk is sent, so the
+        memory held by queued chunks never grows over the budget no matter
+        how large the files are or how slow the network is.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.inflight_size = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int) -> None:
+        """
+        Summary:
+            Block until the chunk with given size fits in the budget.
+            A chunk larger than the whole budget is still allowed when
+            nothing else is in flight, otherwise it would never be sent.
+        Parameter:
+            - size(int): the size of the chunk in bytes.
+        """
+        with self._condition:
+            while self.inflight_size > 0 and self.inflight_size + size > self.max_size:
+                self._condition.wait()
+            self.inflight_size += size
+
+    def release(self, size: int) -> None:
+        """
+        Summary:
+            Give back the size of a chunk that has left the memory.
+        Parameter:
+            - size(int): the size of the chunk in bytes.
+        """
+        with self._condition:
+            self.inflight_size = max(self.inflight_size - size, 0)
+            self._condition.notify_all()
@@ -2,18 +2,25 @@
 #
 # Contact Indoc Systems for any questions regarding the use of this source code.
 
+import base64
+import binascii
 import math
+import sys
+from array import array
 from enum import Enum
 from os.path import basename
 from os.path import dirname
-from os.path import getsize
 from typing import Any
 from typing import Dict
+from typing import NamedTuple
+from typing import Optional
 from typing import Tuple
-
-from tqdm import tqdm
+from typing import Union
 
 from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.part_planner import PartPlanner
+from app.services.output_manager.progress_renderer import ProgressRenderer
+from app.utils.stat_cache import getsize
 
 
 class UploadType(Enum):
@@ -24,6 +31,14 @@ class UploadType(Enum):
         return self.name
 
 
+class UploadTarget(NamedTuple):
+    """The folder on the platform that an input path of upload goes into."""
+
+    job_type: UploadType
+    current_folder_node: str
+    parent_folder_id: str
+
+
 class ItemStatus(str, Enum):
     """
     Summary:
@@ -44,29 +59,205 @@ class ItemStatus(str, Enum):
         return self.name
 
 
-class FileObject:
+# the size of md5 digest that etag of chunk encodes
+ETAG_SIZE = 16
+
+
+class ChunkInfo(NamedTuple):
+    """The chunk that is uploaded to object storage."""
+
+    etag: str
+    # the size of chunk, None if the record does not have it
+    chunk_size: Optional[int]
+
+
+def encode_etag(etag: str) -> Optional[bytes]:
+    """
+    Summary:
+        Decode the base64 md5 etag into its digest.
+    Parameter:
+        - etag(str): the etag of chunk.
+    return:
+        - bytes: the digest, or None if etag is not a base64 md5.
+    """
+    try:
+        digest = base64.b64decode(etag, validate=True)
+    except binascii.Error:
+        return None
+    # the etag must come back the same when it is encoded again
+    if len(digest) != ETAG_SIZE or base64.b64encode(digest).decode() != etag:
+        return None
+    return digest
+
+
+class ChunkState:
     """
     Summary:
-        The class contains file infomation
+        The uploaded chunks of a file. A file of 10k chunks used to carry 10k
+        small dicts, here the chunks are kept in flat buffers instead: a bitmap
+        of uploaded chunk numbers, the md5 digest of each chunk in one byte
+        array and the chunk sizes in an integer array. The etags that are not
+        base64 md5 are kept aside in a dict. The manifest stores the buffers
+        in base64, and the old manifest with a dict per chunk can be read.
     """
 
-    # object storage info
-    resumable_id: str
-    job_id: str
-    item_id: str
-    parent_path: str
-    file_name: str
+    __slots__ = ('_bitmap', '_etags', '_sizes', '_other_etags', '_count')
+
+    def __init__(self) -> None:
+        self._bitmap = bytearray()
+        self._etags = bytearray()
+        self._sizes = array('q')
+        self._other_etags: Dict[int, str] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __repr__(self) -> str:
+        return f'ChunkState({self._count} chunks)'
+
+    def _is_set(self, index: int) -> bool:
+        return index >> 3 < len(self._bitmap) and bool(self._bitmap[index >> 3] & (1 << (index & 7)))
+
+    def _grow(self, chunks: int) -> None:
+        missing = chunks - len(self._sizes)
+        if missing > 0:
+            self._sizes.frombytes(bytes(self._sizes.itemsize * missing))
+            self._etags.extend(bytes(ETAG_SIZE * missing))
+            self._bitmap.extend(bytes(math.ceil(chunks / 8) - len(self._bitmap)))
+
+    def set(self, chunk_number: int, etag: str, chunk_size: Optional[int]) -> None:
+        """
+        Summary:
+            Mark the chunk as uploaded.
+        Parameter:
+            - chunk_number(int): the number of chunk, start from 1.
+            - etag(str): the etag of chunk.
+            - chunk_size(int): the size of chunk.
+        """
+        index = int(chunk_number) - 1
+        self._grow(index + 1)
+
+        digest = encode_etag(etag)
+        if digest is None:
+            self._other_etags[index + 1] = etag
+        else:
+            self._other_etags.pop(index + 1, None)
+            self._etags[index * ETAG_SIZE : (index + 1) * ETAG_SIZE] = digest
+        self._sizes[index] = chunk_size or 0
+
+        # the bit is set last, so the chunk is never read half written
+        if not self._is_set(index):
+            self._bitmap[index >> 3] |= 1 << (index & 7)
+            self._count += 1
+
+    def get(self, chunk_number: int) -> Optional[ChunkInfo]:
+        """
+        Summary:
+            Get the uploaded chunk.
+        Parameter:
+            - chunk_number(int): the number of chunk, start from 1.
+        return:
+            - ChunkInfo: the chunk, or None if it is not uploaded.
+        """
+        index = chunk_number - 1
+        if index < 0 or not self._is_set(index):
+            return None
+
+        etag = self._other_etags.get(chunk_number)
+        if etag is None:
+            etag = base64.b64encode(self._etags[index * ETAG_SIZE : (index + 1) * ETAG_SIZE]).decode()
+        return ChunkInfo(etag, self._sizes[index] or None)
 
-    # local file info
-    local_path: str
-    total_size: int
-    total_chunks: int
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Summary:
+            The function is to convert the state to json format.
+        return:
+            - json format of the state.
+        """
+        sizes = array('q', self._sizes)
+        # the sizes are stored in little endian
+        if sys.byteorder == 'big':
+            sizes.byteswap()
+
+        return {
+            'bitmap': base64.b64encode(self._bitmap).decode(),
+            'etags': base64.b64encode(self._etags).decode(),
+            'sizes': base64.b64encode(sizes.tobytes()).decode(),
+            'other_etags': {str(chunk_number): etag for chunk_number, etag in self._other_etags.items()},
+        }
+
+    @classmethod
+    def from_json(cls, value: Union['ChunkState', Dict[str, Any], None]) -> 'ChunkState':
+        """
+        Summary:
+            Read the state from manifest or the resumable api. The state in
+            json format and the dict per chunk are both accepted.
+        Parameter:
+            - value(dict): the uploaded chunks.
+        return:
+            - ChunkState: the state, it is the value itself if already a state.
+        """
+        if isinstance(value, ChunkState):
+            return value
+
+        state = cls()
+        if not value:
+            return state
+        elif 'bitmap' not in value:
+            for chunk_number, chunk_info in value.items():
+                if chunk_info.get('etag'):
+                    state.set(int(chunk_number), chunk_info.get('etag'), chunk_info.get('chunk_size'))
+            return state
+
+        state._bitmap = bytearray(base64.b64decode(value['bitmap']))
+        state._etags = bytearray(base64.b64decode(value['etags']))
+        state._sizes.frombytes(base64.b64decode(value['sizes']))
+        if sys.byteorder == 'big':
+            state._sizes.byteswap()
+        state._other_etags = {int(chunk_number): etag for chunk_number, etag in value.get('other_etags', {}).items()}
+        state._count = int.from_bytes(state._bitmap, 'little').bit_count()
+        return state
+
+
+def encode_chunk_state(value: Any) -> Dict[str, Any]:
+    """
+    Summary:
+        The `default` of json.dump to write the chunk states in manifest.
+    Parameter:
+        - value(Any): the object json cannot encode.
+    return:
+        - json format of the state.
+    """
+    if isinstance(value, ChunkState):
+        return value.to_json()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
 
-    # resumable info
-    uploaded_chunks: Dict[str, Dict[str, Any]]
 
-    # progress bar object
-    progress_bar = None
+class FileObject:
+    """
+    Summary:
+        The class contains file infomation. The attributes are slots, since
+        a large upload keeps many of the objects alive.
+    """
+
+    __slots__ = (
+        # object storage info
+        'resumable_id',
+        'job_id',
+        'item_id',
+        'object_path',
+        'parent_path',
+        'file_name',
+        # local file info
+        'local_path',
+        'total_size',
+        'total_chunks',
+        'chunk_size',
+        # resumable info
+        '_uploaded_chunks',
+    )
 
     def __init__(
         self,
@@ -75,6 +266,8 @@ class FileObject:
         resumable_id: str = None,
         job_id: str = None,
         item_id: str = None,
+        chunk_size: int = None,
+        part_planner: PartPlanner = None,
     ) -> None:
         # object storage info
         self.resumable_id = resumable_id
@@ -85,24 +278,39 @@ class FileObject:
 
         # local file info
         self.local_path = local_path
-        self.total_size, self.total_chunks = self.generate_meta(local_path)
+        # the chunk size is planned for new upload but kept from manifest
+        # for resumed upload, since the uploaded chunks depend on it
+        self.chunk_size = chunk_size or AppConfig.Env.chunk_size
+        self.total_size, self.total_chunks = self.generate_meta(local_path, None if chunk_size else part_planner)
 
         # resumable info
-        self.uploaded_chunks = {}
+        self._uploaded_chunks = ChunkState()
+
+    @property
+    def uploaded_chunks(self) -> ChunkState:
+        return self._uploaded_chunks
+
+    @uploaded_chunks.setter
+    def uploaded_chunks(self, value: Union[ChunkState, Dict[str, Any], None]) -> None:
+        self._uploaded_chunks = ChunkState.from_json(value)
 
-    def generate_meta(self, local_path: str) -> Tuple[int, int]:
+    def generate_meta(self, local_path: str, part_planner: PartPlanner = None) -> Tuple[int, int]:
         """
         Summary:
             The function is to generate chunk upload meatedata for a file.
+            The chunk size is planned for the file if planner is given.
         Parameter:
             - input_path: The path of the local file eg. a/b/c.txt.
+            - part_planner: The planner to pick the chunk size of file.
         return:
             - total_size: the size of file
             - total_chunks: the number of chunks will be uploaded.
         """
         file_length_in_bytes = getsize(local_path)
         total_size = file_length_in_bytes
-        total_chunks = math.ceil(total_size / AppConfig.Env.chunk_size)
+        if part_planner is not None:
+            self.chunk_size = part_planner.plan(total_size)
+        total_chunks = math.ceil(total_size / self.chunk_size)
         return total_size, total_chunks
 
     def to_dict(self):
@@ -120,33 +328,31 @@ class FileObject:
             'local_path': self.local_path,
             'total_size': self.total_size,
             'total_chunks': self.total_chunks,
-            'uploaded_chunks': self.uploaded_chunks,
+            'chunk_size': self.chunk_size,
+            'uploaded_chunks': self.uploaded_chunks.to_json(),
         }
 
     def update_progress(self, chunk_size: int) -> None:
         """
         Summary:
-            The function is to update the progress bar
+            The function is to add the uploaded bytes to the progress
         Parameter:
             - chunk_size(int): the size of a chunk
         """
-        if self.progress_bar is None:
-            self.progress_bar = tqdm(
-                total=self.total_size,
-                leave=True,
-                bar_format='{desc} |{bar:30} {percentage:3.0f}% {remaining}',
-            )
-            self.progress_bar.set_description(f'Uploading {self.file_name}')
+        ProgressRenderer().update(self.object_path, chunk_size, self.file_name, self.total_size)
 
-        self.progress_bar.update(chunk_size)
-        self.progress_bar.refresh()
+    def set_progress_status(self, status: str) -> None:
+        """
+        Summary:
+            The function is to show the status of upload after progress bar
+        Parameter:
+            - status(str): the status, eg. the concurrency and throughput.
+        """
+        ProgressRenderer().set_status(status)
 
     def close_progress(self) -> None:
         """
         Summary:
-            The function is to close the progress bar
+            The function is to mark the file as finished in progress
         """
-        if self.progress_bar is not None:
-            self.progress_bar.clear()
-            self.progress_bar.close()
-            self.progress_bar = None
+        ProgressRenderer().finish_file(self.object_path)
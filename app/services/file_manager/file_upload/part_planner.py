@@ -0,0 +1,84 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import math
+import threading
+from typing import Optional
+
+from app.configs.app_config import AppConfig
+
+MB = 1024 * 1024
+
+
+class PartPlanner:
+    """
+    Summary:
+        The class picks the chunk size of each file. It starts from the
+        default chunk size, or the size that takes chunk_target_seconds
+        to upload with the observed throughput, then adjusts it so that:
+         - a large file is spread over all the concurrent workers.
+         - the chunks of all workers fit in the inflight memory budget.
+         - it is within the part size and part number limits of multipart
+           upload, so files above 200GB can be uploaded.
+         - a small file is uploaded as one chunk of its own size.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 1,
+        max_inflight_size: int = AppConfig.Env.max_inflight_mb * MB,
+        default_chunk_size: int = None,
+    ) -> None:
+        self.concurrency = max(concurrency, 1)
+        self.max_inflight_size = max_inflight_size
+        self.default_chunk_size = default_chunk_size or AppConfig.Env.chunk_size
+
+        self._lock = threading.Lock()
+        # the moving average of bytes per second for one chunk request
+        self.throughput: Optional[float] = None
+
+    def observe(self, size: int, seconds: float) -> None:
+        """
+        Summary:
+            Record the time spent to upload a chunk.
+        Parameter:
+            - size(int): the size of chunk.
+            - seconds(float): the time spent to upload the chunk.
+        """
+        if seconds <= 0:
+            return
+
+        throughput = size / seconds
+        with self._lock:
+            if self.throughput is None:
+                self.throughput = throughput
+            else:
+                self.throughput += AppConfig.Env.throughput_smoothing * (throughput - self.throughput)
+
+    def plan(self, total_size: int) -> int:
+        """
+        Summary:
+            Pick the chunk size for a file.
+        Parameter:
+            - total_size(int): the size of file.
+        return:
+            - int: the chunk size in bytes.
+        """
+        if self.throughput:
+            chunk_size = int(self.throughput * AppConfig.Env.chunk_target_seconds)
+        else:
+            chunk_size = self.default_chunk_size
+
+        chunk_size = min(
+            chunk_size,
+            math.ceil(total_size / self.concurrency),
+            self.max_inflight_size // self.concurrency,
+        )
+        chunk_size = max(chunk_size, AppConfig.Env.min_chunk_size)
+
+        # the multipart limits always win over the preferences above
+        chunk_size = max(chunk_size, math.ceil(total_size / AppConfig.Env.max_chunk_number))
+        chunk_size = min(math.ceil(chunk_size / MB) * MB, AppConfig.Env.max_chunk_size)
+
+        return max(min(chunk_size, total_size), 1)
@@ -0,0 +1,155 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timezone
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.models import FileObject
+
+
+def get_presigned_url_expiry(url: str, issued_at: float) -> float:
+    """
+    Summary:
+        The function is to find out when a presigned url expires. It reads
+        the X-Amz-Date and X-Amz-Expires from signature v4 url. If they are
+        missing, the default expiry in AppConfig will be used.
+    Parameter:
+        - url(str): the presigned url.
+        - issued_at(float): the timestamp when url was requested.
+    return:
+        - float: the timestamp after which the url should not be used.
+    """
+    query = parse_qs(urlparse(url).query)
+    try:
+        expires_in = int(query['X-Amz-Expires'][0])
+        signed_at = datetime.strptime(query['X-Amz-Date'][0], '%Y%m%dT%H%M%SZ')
+        signed_at = signed_at.replace(tzinfo=timezone.utc).timestamp()
+    except (KeyError, IndexError, ValueError):
+        expires_in = AppConfig.Env.presigned_url_expiry
+        signed_at = issued_at
+
+    return signed_at + expires_in - AppConfig.Env.presigned_url_expiry_margin
+
+
+class PresignPrefetcher:
+    """
+    Summary:
+        The class requests the presigned urls of chunks ahead of the upload.
+        Each chunk is prefetched as soon as it is read from disk, so the
+        url is usually ready when a worker picks the chunk up. Urls are kept
+        until they expire or the chunk is uploaded, so retry of a chunk does
+        not need another round trip to upload service.
+    """
+
+    def __init__(self, presign: Callable[[FileObject, int, int, str], str], max_workers: int) -> None:
+        self.presign = presign
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        # (item_id, chunk_number) -> future of (etag, url, expire_at)
+        self._urls: Dict[Tuple[str, int], Future] = {}
+
+    def _request(
+        self, file_object: FileObject, chunk_number: int, chunk_size: int, etag: str
+    ) -> Tuple[str, str, float]:
+        issued_at = time.time()
+        url = self.presign(file_object, chunk_number, chunk_size, etag)
+        return etag, url, get_presigned_url_expiry(url, issued_at)
+
+    def _is_usable(self, future: Future, etag: str) -> bool:
+        if not future.done():
+            return True
+        if future.cancelled() or future.exception() is not None:
+            return False
+        cached_etag, _, expire_at = future.result()
+        return cached_etag == etag and time.time() < expire_at
+
+    def prefetch(self, file_object: FileObject, chunk_number: int, chunk_size: int, etag: str) -> None:
+        """
+        Summary:
+            Request the presigned url of chunk in background.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - chunk_number(int): the number of chunk.
+            - chunk_size(int): the size of chunk.
+            - etag(str): the md5 of chunk data.
+        """
+        key = (file_object.item_id, chunk_number)
+        with self._lock:
+            future = self._urls.get(key)
+            if future is not None and self._is_usable(future, etag):
+                return
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='presign')
+            self._urls[key] = self._executor.submit(self._request, file_object, chunk_number, chunk_size, etag)
+
+    def get(self, file_object: FileObject, chunk_number: int, chunk_size: int, etag: str) -> str:
+        """
+        Summary:
+            Return the presigned url of chunk. It will wait for the prefetch
+            in progress, or request a new one if there is no valid url. The
+            prefetch still queued in the executor is cancelled and the url is
+            requested by the caller, so the upload workers are not limited
+            by the few workers of prefetch.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - chunk_number(int): the number of chunk.
+            - chunk_size(int): the size of chunk.
+            - etag(str): the md5 of chunk data.
+        return:
+            - str: the presigned url.
+        """
+        key = (file_object.item_id, chunk_number)
+        with self._lock:
+            future = self._urls.get(key)
+
+        if future is None or future.cancel() or not self._is_usable(future, etag):
+            future = Future()
+            try:
+                future.set_result(self._request(file_object, chunk_number, chunk_size, etag))
+            except Exception as e:
+                future.set_exception(e)
+            with self._lock:
+                self._urls[key] = future
+
+        try:
+            _, url, _ = future.result()
+        except Exception:
+            self.discard(file_object, chunk_number)
+            raise
+
+        return url
+
+    def discard(self, file_object: FileObject, chunk_number: int) -> None:
+        """
+        Summary:
+            Forget the url of chunk. it is called once chunk is uploaded.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - chunk_number(int): the number of chunk.
+        """
+        with self._lock:
+            self._urls.pop((file_object.item_id, chunk_number), None)
+
+    def shutdown(self) -> None:
+        """
+        Summary:
+            Stop the background workers after all the chunks are uploaded.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._urls.clear()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
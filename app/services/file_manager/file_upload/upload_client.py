@@ -2,37 +2,62 @@
 #
 # Contact Indoc Systems for any questions regarding the use of this source code.
 
-import base64
-import hashlib
+import asyncio
 import json
 import math
 import os
+import threading
 import time
+from concurrent.futures import Future
+from functools import partial
 from logging import getLogger
 from multiprocessing.pool import ApplyResult
 from multiprocessing.pool import ThreadPool
 from typing import Any
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Optional
 from typing import Tuple
 
-import httpx
 from httpx import HTTPStatusError
+from httpx import Response
 
 import app.services.output_manager.message_handler as mhandler
 from app.configs.app_config import AppConfig
-from app.configs.config import ConfigClass
 from app.configs.user_config import UserConfig
 from app.models.upload_form import generate_on_success_form
+from app.services.clients.bandwidth_limiter import BandwidthLimiter
 from app.services.clients.base_auth_client import BaseAuthClient
+from app.services.clients.http_pool import get_http_client
+from app.services.clients.transfer_engine import AsyncTransferEngine
+from app.services.file_manager.file_upload.chunk_hash_cache import ChunkHashCache
+from app.services.file_manager.file_upload.chunk_hash_cache import FileKey
+from app.services.file_manager.file_upload.chunk_hasher import ChunkHasher
+from app.services.file_manager.file_upload.chunk_hasher import calculate_etag
+from app.services.file_manager.file_upload.chunk_hedger import ChunkHedger
+from app.services.file_manager.file_upload.chunk_hedger import stream_until_cancelled
+from app.services.file_manager.file_upload.chunk_reader import ChunkReader
+from app.services.file_manager.file_upload.chunk_reader import release_page_cache
+from app.services.file_manager.file_upload.chunk_retry import RetryScheduler
+from app.services.file_manager.file_upload.chunk_retry import get_retry_delay
+from app.services.file_manager.file_upload.chunk_retry import is_expired_presigned_url
+from app.services.file_manager.file_upload.chunk_retry import is_retryable
+from app.services.file_manager.file_upload.concurrency_controller import ConcurrencyController
+from app.services.file_manager.file_upload.inflight_budget import InflightBudget
 from app.services.file_manager.file_upload.models import FileObject
+from app.services.file_manager.file_upload.models import UploadTarget
 from app.services.file_manager.file_upload.models import UploadType
+from app.services.file_manager.file_upload.part_planner import PartPlanner
+from app.services.file_manager.file_upload.presign_prefetcher import PresignPrefetcher
+from app.services.file_manager.file_upload.upload_finaliser import UploadFinaliser
+from app.services.file_manager.file_upload.upload_journal import UploadJournal
 from app.services.output_manager.error_handler import ECustomizedError
 from app.services.output_manager.error_handler import SrvErrorHandler
 from app.services.user_authentication.decorator import require_valid_token
-from app.services.user_authentication.token_manager import SrvTokenManager
 from app.utils.aggregated import get_file_info_by_geid
 
+from .exception import CHUNK_UPLOAD_FAILED
 from .exception import INVALID_CHUNK_ETAG
 
 logger = getLogger(__name__)
@@ -47,6 +72,16 @@ class UploadClient(BaseAuthClient):
          - zone: data zone. can be greenroom or core.
          - job_type: based on the input. can be AS_FILE or AS_FOLDER.
          - current_folder_node: the target folder in object storage.
+         - max_inflight_size: the memory budget in bytes shared by all
+           the chunks that are read but not uploaded yet.
+         - engine: the async engine to upload chunks. if it is None, the
+           chunks will be uploaded by the ThreadPool.
+         - num_of_thread: the number of threads in ThreadPool. it is used
+           with the engine to plan the chunk size of files.
+         - concurrency: the limit of concurrent chunk uploads in ThreadPool.
+           it is fixed to num_of_thread if not given.
+         - hedge: send a duplicate request of the chunks slower than the
+           recent ones, and take whichever finishes first.
     """
 
     def __init__(
@@ -60,12 +95,17 @@ class UploadClient(BaseAuthClient):
         tags: list = None,
         source_id: str = '',
         attributes: dict = None,
+        max_inflight_size: int = AppConfig.Env.max_inflight_mb * 1024 * 1024,
+        engine: AsyncTransferEngine = None,
+        num_of_thread: int = 1,
+        concurrency: ConcurrencyController = None,
+        hedge: bool = False,
     ):
+        self._local = threading.local()
         super().__init__('')
 
         self.user = UserConfig()
         self.operator = self.user.username
-        self.chunk_size = AppConfig.Env.chunk_size
 
         prefix = {
             AppConfig.Env.green_zone: AppConfig.Env.greenroom_bucket_prefix,
@@ -83,11 +123,39 @@ class UploadClient(BaseAuthClient):
         self.tags = tags
         self.source_id = source_id
         self.attributes = attributes
+        self.inflight_budget = InflightBudget(max_inflight_size)
+        self.engine = engine
+        # the limit of concurrent chunk uploads in ThreadPool, it is adjusted
+        # by throughput and errors with --thread auto
+        self.concurrency = concurrency or ConcurrencyController(num_of_thread)
+        self.part_planner = PartPlanner(
+            engine.max_requests if engine else self.concurrency.max_limit, max_inflight_size
+        )
+        self.presign_prefetcher = PresignPrefetcher(self.get_presigned_url, AppConfig.Env.presign_prefetch_workers)
+        self.chunk_hasher = ChunkHasher(AppConfig.Env.hash_workers)
+        self.chunk_hash_cache = ChunkHashCache(AppConfig.Env.chunk_hash_cache_path, AppConfig.Env.chunk_hash_cache)
+        self.finaliser = UploadFinaliser(self.on_succeed, AppConfig.Env.finalise_workers)
+        self.retry_scheduler = RetryScheduler()
+        # the first request of chunk is sent by the worker of pool, the
+        # hedger only sends the duplicate of each request in flight
+        self.hedger = ChunkHedger(engine.max_requests if engine else self.concurrency.max_limit) if hedge else None
+        # the journal of upload progress, it is set when manifest is output
+        self.journal: Optional[UploadJournal] = None
 
         # the flag to indicate if all upload process finished
         # then the token refresh loop will end
         self.finish_upload = False
 
+    @property
+    def endpoint(self) -> str:
+        # the stages of upload call different services at the same time
+        # and each request sets the endpoint first, so keep it per thread
+        return getattr(self._local, 'endpoint', '')
+
+    @endpoint.setter
+    def endpoint(self, endpoint: str) -> None:
+        self._local.endpoint = endpoint
+
     def generate_meta(self, local_path: str) -> Tuple[int, int]:
         """
         Summary:
@@ -100,7 +168,7 @@ class UploadClient(BaseAuthClient):
         """
         file_length_in_bytes = os.path.getsize(local_path)
         total_size = file_length_in_bytes
-        total_chunks = math.ceil(total_size / self.chunk_size)
+        total_chunks = math.ceil(total_size / self.part_planner.plan(total_size))
         return total_size, total_chunks
 
     @require_valid_token()
@@ -198,13 +266,17 @@ class UploadClient(BaseAuthClient):
         return list(object_path_file_object_map.values()), exist_files
 
     @require_valid_token()
-    def pre_upload(self, file_objects: List[FileObject], output_path: str) -> List[FileObject]:
+    def pre_upload(
+        self, file_objects: List[FileObject], output_path: str, target: UploadTarget = None
+    ) -> List[FileObject]:
         """
         Summary:
             The function is to initiate all the multipart upload.
         Parameter:
             - local_file_paths(list of str): the local path of files to be uploaded.
             - output_path(str): the output path of manifest.
+            - target(UploadTarget): the folder that files go into, it is the
+                one of upload client if not given.
         return:
             - list of FileObject: the infomation retrieved from backend.
                 - resumable_id(str): the unique identifier for multipart upload.
@@ -213,13 +285,14 @@ class UploadClient(BaseAuthClient):
                 - chunk_info(dict): the mapping for chunks that already been uploaded.
         """
 
+        target = target or UploadTarget(self.job_type, self.current_folder_node, self.parent_folder_id)
         payload = {
             'project_code': self.project_code,
             'operator': self.operator,
-            'job_type': str(self.job_type),
+            'job_type': str(target.job_type),
             'zone': self.zone,
-            'current_folder_node': self.current_folder_node,
-            'parent_folder_id': self.parent_folder_id,
+            'current_folder_node': target.current_folder_node,
+            'parent_folder_id': target.parent_folder_id,
             'folder_tags': self.tags,
             'source_id': self.source_id,
             'data': [
@@ -287,75 +360,265 @@ class UploadClient(BaseAuthClient):
 
         return manifest_json
 
-    def stream_upload(self, file_object: FileObject, pool: ThreadPool) -> List[ApplyResult]:
+    def stream_upload(self, file_object: FileObject, pool: ThreadPool) -> None:
         """
         Summary:
             The function is a wrap to display the uploading process.
             It will submit the async function job to ThreadPool. Each
             of chunk upload process will be queued in pool and scheduled.
+            The file is finalised by the finaliser once all the chunks
+            are uploaded. The uploaded chunks with the same md5 in chunk
+            hash cache are skipped without reading the file. The results
+            of chunks are not kept, the finaliser tracks the completion.
         Parameter:
             - file_object(FileObject): the file object that contains correct
                 information for chunk uploading.
         return:
-            - List[ApplyResult]: the result of each chunk upload. and will be
-                used in on_success function to make sure all the chunks have
-                been uploaded.
+            - None
         """
-        count = 0
+        for _ in self.iter_stream_upload(file_object, pool):
+            pass
 
-        # process on the file content
-        f = open(file_object.local_path, 'rb')
-        # this will be used to check if the chunk has been uploaded
-        # in the on_success function. to make sure on_success is called
-        # after all the chunks have been uploaded.
-        chunk_result = []
-        while True:
-            chunk_info = file_object.uploaded_chunks.get(str(count + 1), {})
-            chunk_etag = chunk_info.get('etag')
-
-            chunk = f.read(self.chunk_size)
-            local_chunk_etag = base64.b64encode(hashlib.md5(chunk).digest()).decode('utf-8')
-            if not chunk:
-                break
-            # if current chunk has been uploaded to object storage
-            # only check the md5 if the file is same. If ture,
-            # skip current chunk, if not, raise the error.
-            elif chunk_etag:
-                if chunk_etag != local_chunk_etag:
-                    SrvErrorHandler.customized_handle(ECustomizedError.INVALID_CHUNK_UPLOAD, value=count + 1)
-                    raise INVALID_CHUNK_ETAG(count + 1)
-                chunk_size = chunk_info.get('chunk_size', self.chunk_size)
-                file_object.update_progress(chunk_size)
-            else:
-                res = pool.apply_async(
-                    self.upload_chunk,
-                    args=(file_object, count + 1, chunk, local_chunk_etag, len(chunk)),
-                )
-                chunk_result.append(res)
+    def iter_stream_upload(self, file_object: FileObject, pool: ThreadPool) -> Iterator[ApplyResult]:
+        """
+        Summary:
+            The step by step version of stream_upload. It yields after each
+            chunk is submitted, so the scheduler can interleave the chunks of
+            several files.
+        Parameter:
+            - file_object(FileObject): the file object that contains correct
+                information for chunk uploading.
+            - pool(ThreadPool): the pool to upload the chunks.
+        return:
+            - Iterator[ApplyResult]: the result of each chunk upload.
+        """
+        count = 0
+        hash_key = self.chunk_hash_cache.file_key(file_object.local_path, file_object.chunk_size)
+        # the cached md5 is only needed to resume the uploaded chunks
+        cached_etags = self.chunk_hash_cache.get(hash_key) if file_object.uploaded_chunks else {}
 
-            count += 1  # uploaded successfully
+        self.finaliser.start(file_object)
+        try:
+            # process on the file content
+            with ChunkReader(file_object.local_path) as reader:
+                while True:
+                    chunk_info = file_object.uploaded_chunks.get(count + 1)
+                    chunk_etag = chunk_info.etag if chunk_info else None
+                    if chunk_etag and chunk_etag == cached_etags.get(count + 1):
+                        file_object.update_progress(chunk_info.chunk_size or file_object.chunk_size)
+                        count += 1
+                        continue
+
+                    # reserve the memory before reading the chunk. it will block the
+                    # reading when too many chunks are waiting in the pool queue
+                    if not chunk_etag:
+                        self.inflight_budget.acquire(file_object.chunk_size)
+
+                    chunk = reader.read(count * file_object.chunk_size, file_object.chunk_size)
+                    if not chunk:
+                        if not chunk_etag:
+                            self.inflight_budget.release(file_object.chunk_size)
+                        break
+                    # if current chunk has been uploaded to object storage
+                    # only check the md5 if the file is same. If ture,
+                    # skip current chunk, if not, raise the error.
+                    elif chunk_etag:
+                        self.verify_uploaded_chunk(chunk, count + 1, chunk_etag, hash_key)
+                        release_page_cache(file_object.local_path, count * file_object.chunk_size, len(chunk))
+                        file_object.update_progress(chunk_info.chunk_size or file_object.chunk_size)
+                    else:
+                        yield self.submit_chunk(file_object, count + 1, chunk, pool, hash_key)
+
+                    count += 1  # uploaded successfully
+        except BaseException as e:
+            self.finaliser.seal(file_object, e)
+            raise
+
+        self.finaliser.seal(file_object)
+
+    def verify_uploaded_chunk(self, chunk: bytes, chunk_number: int, chunk_etag: str, hash_key: FileKey) -> None:
+        """
+        Summary:
+            The function is to check if the chunk uploaded before is same as
+            the local chunk. The md5 is recorded in chunk hash cache for the
+            next resume.
+        Parameter:
+            - chunk(bytes): the local chunk data.
+            - chunk_number(int): the number of current chunk.
+            - chunk_etag(str): the md5 of uploaded chunk.
+            - hash_key(tuple): the key of file in chunk hash cache.
+        return:
+            - None
+        """
+        etag = calculate_etag(chunk)
+        if chunk_etag != etag:
+            SrvErrorHandler.customized_handle(ECustomizedError.INVALID_CHUNK_UPLOAD, value=chunk_number)
+            raise INVALID_CHUNK_ETAG(chunk_number)
+        self.chunk_hash_cache.put(hash_key, chunk_number, etag)
+
+    def submit_chunk(
+        self, file_object: FileObject, chunk_number: int, chunk: bytes, pool: ThreadPool, hash_key: FileKey = None
+    ) -> ApplyResult:
+        """
+        Summary:
+            The function is to queue the upload of a chunk in the pool or the
+            async engine, and report its completion to the finaliser.
+        Parameter:
+            - file_object(FileObject): the file object that contains correct
+                information for chunk uploading.
+            - chunk_number(int): the number of current chunk.
+            - chunk(bytes): the chunk data.
+            - pool(ThreadPool): the pool to upload the chunk.
+            - hash_key(tuple): the key of file in chunk hash cache.
+        return:
+            - ApplyResult: the result of chunk upload.
+        """
 
-        f.close()
+        # the md5 is calculated by the hasher so the reader can move on
+        # to next chunk. once it is ready, the presigned url will be
+        # requested in background while the chunk is in pool queue
+        etag_future = self.chunk_hasher.submit(chunk)
+        etag_future.add_done_callback(partial(self.prefetch_presigned_url, file_object, chunk_number, len(chunk)))
+        etag_future.add_done_callback(partial(self.record_chunk_hash, hash_key, chunk_number))
 
-        return chunk_result
+        self.finaliser.add_chunk(file_object)
+        return self.submit_chunk_attempt(file_object, chunk_number, chunk, etag_future, pool, 1)
 
-    def upload_chunk(self, file_object: FileObject, chunk_number: int, chunk: str, etag: str, chunk_size: int) -> None:
+    def submit_chunk_attempt(
+        self,
+        file_object: FileObject,
+        chunk_number: int,
+        chunk: bytes,
+        etag_future: Future,
+        pool: ThreadPool,
+        attempt: int,
+    ) -> ApplyResult:
         """
         Summary:
-            The function is to upload a chunk directly into minio storage.
+            The function is to queue an attempt of chunk upload. The failed
+            attempt is handed to retry_chunk instead of the finaliser.
         Parameter:
             - file_object(FileObject): the file object that contains correct
                 information for chunk uploading.
             - chunk_number(int): the number of current chunk.
-            - chunk(str): the chunk data.
-            - etag(str): the md5 of chunk data.
+            - chunk(bytes): the chunk data.
+            - etag_future(Future): the future of md5 of chunk data.
+            - pool(ThreadPool): the pool to upload the chunk.
+            - attempt(int): the number of current attempt, from 1.
+        return:
+            - ApplyResult: the result of chunk upload attempt.
+        """
+        chunk_args = (file_object, chunk_number, chunk, etag_future, len(chunk), file_object.chunk_size)
+        # the callbacks are kept by the result, so they must not hold the
+        # chunk data. the chunk is read from the file again for retry
+        retry = partial(self.retry_chunk, file_object, chunk_number, pool, attempt)
+        if self.engine is None:
+            return pool.apply_async(
+                self.upload_chunk_in_budget,
+                args=chunk_args,
+                callback=lambda _: self.finaliser.chunk_done(file_object),
+                error_callback=retry,
+            )
+
+        res = self.engine.submit(self.upload_chunk_async(*chunk_args))
+        res.add_done_callback(lambda r: retry(r.error()) if r.error() else self.finaliser.chunk_done(file_object))
+        return res
+
+    def retry_chunk(
+        self,
+        file_object: FileObject,
+        chunk_number: int,
+        pool: ThreadPool,
+        attempt: int,
+        error: BaseException,
+    ) -> None:
+        """
+        Summary:
+            The function is the error callback of chunk upload attempt. The
+            chunk failed with transient error is queued again after a jittered
+            exponential backoff. The presigned url is kept for the retry
+            unless object storage rejected it as expired, the prefetcher
+            already replaces the url signed for another md5. Once the
+            attempts are used up, or the error is not transient, the chunk
+            is reported as failed by fail_chunk.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - chunk_number(int): the number of current chunk.
+            - pool(ThreadPool): the pool to upload the chunk.
+            - attempt(int): the number of failed attempt.
+            - error(BaseException): the error of failed attempt.
         return:
             - None
         """
+        if isinstance(error, HTTPStatusError) and is_expired_presigned_url(error):
+            self.presign_prefetcher.discard(file_object, chunk_number)
+        if attempt < AppConfig.Env.chunk_max_attempts and is_retryable(error) and not self.finish_upload:
+            delay = get_retry_delay(attempt)
+            logger.warning(f'Retry chunk {chunk_number} of {file_object.file_name} in {delay:.1f}s: {error}')
+            self.retry_scheduler.schedule(
+                delay, partial(self.resubmit_chunk, file_object, chunk_number, pool, attempt + 1)
+            )
+            return
+
+        self.fail_chunk(file_object, chunk_number, attempt, error)
+
+    def fail_chunk(self, file_object: FileObject, chunk_number: int, attempt: int, error: BaseException) -> None:
+        """
+        Summary:
+            The function is to report the chunk as failed to the finaliser
+            once it is not retried any more. Its memory is given back to
+            the inflight budget and its presigned url is discarded.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - chunk_number(int): the number of current chunk.
+            - attempt(int): the number of failed attempt.
+            - error(BaseException): the error of last attempt.
+        return:
+            - None
+        """
+        self.presign_prefetcher.discard(file_object, chunk_number)
+        self.inflight_budget.release(file_object.chunk_size)
+        self.finaliser.chunk_done(file_object, CHUNK_UPLOAD_FAILED(chunk_number, attempt, error))
 
-        file_object.update_progress(0)
+    def resubmit_chunk(self, file_object: FileObject, chunk_number: int, pool: ThreadPool, attempt: int) -> None:
+        """
+        Summary:
+            The function is to queue the chunk again once its backoff is
+            over. The chunk is read from the file by offset, so the memory
+            of chunk is not held during the backoff.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - chunk_number(int): the number of current chunk.
+            - pool(ThreadPool): the pool to upload the chunk.
+            - attempt(int): the number of next attempt.
+        return:
+            - None
+        """
+        try:
+            with ChunkReader(file_object.local_path) as reader:
+                chunk = reader.read((chunk_number - 1) * file_object.chunk_size, file_object.chunk_size)
+            etag_future = self.chunk_hasher.submit(chunk)
+            etag_future.add_done_callback(partial(self.prefetch_presigned_url, file_object, chunk_number, len(chunk)))
+            self.submit_chunk_attempt(file_object, chunk_number, chunk, etag_future, pool, attempt)
+        except Exception as e:
+            # the pool is closed when the upload is interrupted
+            self.fail_chunk(file_object, chunk_number, attempt, e)
+
+    def get_presigned_url(self, file_object: FileObject, chunk_number: int, chunk_size: int, etag: str) -> str:
+        """
+        Summary:
+            The function is to request upload service to generate presigned
+            url for a chunk. it is called by presign prefetcher.
+        Parameter:
+            - file_object(FileObject): the file object that contains correct
+                information for chunk uploading.
+            - chunk_number(int): the number of current chunk.
+            - chunk_size(int): the size of chunk data.
+            - etag(str): the md5 of chunk data.
+        return:
+            - str: the presigned url to upload the chunk.
+        """
 
-        # request upload service to generate presigned url for the chunk
         params = {
             'bucket': self.bucket,
             'key': file_object.item_id,
@@ -366,47 +629,273 @@ class UploadClient(BaseAuthClient):
         headers = {
             'Content-MD5': etag,
         }
+        self.endpoint = {
+            AppConfig.Env.green_zone: AppConfig.Connections.url_upload_greenroom + '/v1',
+            AppConfig.Env.core_zone: AppConfig.Connections.url_upload_core + '/v1',
+        }.get(self.zone.lower())
+        response = self._get('files/chunks/presigned', params=params, headers=headers)
+        return response.json().get('result')
+
+    def prefetch_presigned_url(
+        self, file_object: FileObject, chunk_number: int, chunk_size: int, etag_future: Future
+    ) -> None:
+        """
+        Summary:
+            The function is the callback of chunk hashing. It starts to prefetch
+            the presigned url of chunk as soon as the md5 is calculated.
+        Parameter:
+            - file_object(FileObject): the file object that contains correct
+                information for chunk uploading.
+            - chunk_number(int): the number of current chunk.
+            - chunk_size(int): the size of chunk data.
+            - etag_future(Future): the future of md5 of chunk data.
+        return:
+            - None
+        """
+        if etag_future.cancelled() or etag_future.exception() is not None:
+            return
+        self.presign_prefetcher.prefetch(file_object, chunk_number, chunk_size, etag_future.result())
+
+    def record_chunk_hash(self, hash_key: FileKey, chunk_number: int, etag_future: Future) -> None:
+        """
+        Summary:
+            The function is the callback of chunk hashing. It records the md5
+            in chunk hash cache, so the chunk can be skipped when resumed.
+        Parameter:
+            - hash_key(tuple): the key of file in chunk hash cache.
+            - chunk_number(int): the number of current chunk.
+            - etag_future(Future): the future of md5 of chunk data.
+        return:
+            - None
+        """
+        if etag_future.cancelled() or etag_future.exception() is not None:
+            return
+        self.chunk_hash_cache.put(hash_key, chunk_number, etag_future.result())
+
+    def record_uploaded_chunk(self, file_object: FileObject, chunk_number: int, etag: str, chunk_size: int) -> None:
+        """
+        Summary:
+            The function is to record the chunk acknowledged by object storage
+            in the upload journal, so resume can skip it.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - chunk_number(int): the number of current chunk.
+            - etag(str): the md5 of chunk data.
+            - chunk_size(int): the size of chunk data.
+        return:
+            - None
+        """
+        if self.journal is not None:
+            self.journal.chunk_uploaded(file_object, chunk_number, etag, chunk_size)
+
+    def upload_chunk_in_budget(
+        self,
+        file_object: FileObject,
+        chunk_number: int,
+        chunk: bytes,
+        etag_future: Future,
+        chunk_size: int,
+        reserved_size: int,
+    ) -> None:
+        """
+        Summary:
+            The function is the pool task of a chunk. It waits for the md5
+            from hasher, uploads the chunk within the concurrency limit and
+            gives the reserved memory back to the inflight budget. If the
+            attempt fails, the memory is kept for the retry of chunk. The
+            exit of worker is turned into an error, since the pool worker
+            stops on it and the chunk would never complete.
+        Parameter:
+            - file_object(FileObject): the file object that contains correct
+                information for chunk uploading.
+            - chunk_number(int): the number of current chunk.
+            - chunk(bytes): the chunk data.
+            - etag_future(Future): the future of md5 of chunk data.
+            - chunk_size(int): the size of chunk data.
+            - reserved_size(int): the size acquired from inflight budget.
+        return:
+            - None: the response is dropped on purpose since the ApplyResult
+                is kept until the file finished and the request inside it
+                still refers to the chunk data.
+        """
+        etag = etag_future.result()
+        self.concurrency.acquire()
         try:
-            self.endpoint = {
-                AppConfig.Env.green_zone: AppConfig.Connections.url_upload_greenroom + '/v1',
-                AppConfig.Env.core_zone: AppConfig.Connections.url_upload_core + '/v1',
-            }.get(self.zone.lower())
-            response = self._get('files/chunks/presigned', params=params, headers=headers)
-            presigned_chunk_url = response.json().get('result')
+            start_time = time.monotonic()
+            self.upload_chunk(file_object, chunk_number, chunk, etag, chunk_size)
+        except SystemExit as e:
+            raise RuntimeError(f'Chunk {chunk_number} upload exited with code {e.code}') from e
+        except Exception as e:
+            self.concurrency.on_error(e)
+            raise
+        finally:
+            self.concurrency.release()
+
+        self.concurrency.on_success(chunk_size, time.monotonic() - start_time)
+        if self.concurrency.adaptive:
+            file_object.set_progress_status(self.concurrency.describe())
+
+        self.inflight_budget.release(reserved_size)
+        self.record_uploaded_chunk(file_object, chunk_number, etag, chunk_size)
+        release_page_cache(file_object.local_path, (chunk_number - 1) * file_object.chunk_size, chunk_size)
+
+    def upload_chunk(self, file_object: FileObject, chunk_number: int, chunk: str, etag: str, chunk_size: int) -> None:
+        """
+        Summary:
+            The function is to upload a chunk directly into minio storage.
+        Parameter:
+            - file_object(FileObject): the file object that contains correct
+                information for chunk uploading.
+            - chunk_number(int): the number of current chunk.
+            - chunk(str): the chunk data.
+            - etag(str): the md5 of chunk data.
+        return:
+            - None
+        """
 
-            headers = {
-                'Content-MD5': etag,
-            }
-            res = httpx.put(presigned_chunk_url, data=chunk, timeout=None, headers=headers)
-            res.raise_for_status()
+        file_object.update_progress(0)
+
+        try:
+            presigned_chunk_url = self.presign_prefetcher.get(file_object, chunk_number, chunk_size, etag)
+
+            send = partial(self.put_chunk, presigned_chunk_url, chunk, etag)
+            start_time = time.monotonic()
+            res = self.hedger.call(send, len(chunk)) if self.hedger else send()
+            self.part_planner.observe(len(chunk), time.monotonic() - start_time)
 
         except HTTPStatusError as e:
-            response = e.response
-            logger.error(response.content)
-            SrvErrorHandler.default_handle(response.content, True)
+            # do not exit inside the pool worker, the chunk can be retried
+            logger.error(e.response.content)
+            raise
+
+        self.presign_prefetcher.discard(file_object, chunk_number)
 
         # update the progress bar
         file_object.update_progress(len(chunk))
-        if chunk_number == file_object.total_chunks:
-            file_object.close_progress()
 
         return res
 
-    def on_succeed(self, file_object: FileObject, tags: List[str], chunk_result: List[ApplyResult]) -> None:
+    def put_chunk(
+        self, presigned_chunk_url: str, chunk: bytes, etag: str, cancelled: threading.Event = None
+    ) -> Response:
         """
         Summary:
-            The function is to finalize the upload process.
+            Send the chunk to the presigned url. It can be called again for
+            the same chunk when the request is hedged.
+        Parameter:
+            - presigned_chunk_url(str): the presigned url of chunk.
+            - chunk(bytes): the chunk data.
+            - etag(str): the md5 of chunk data.
+            - cancelled(Event): it is set by the hedger to stop the request.
+        return:
+            - Response: the response of object storage.
+        """
+        headers = {
+            'Content-MD5': etag,
+        }
+        content = chunk
+        limiter = BandwidthLimiter()
+        if limiter.enabled or cancelled is not None:
+            # the length is given, so the blocks are not sent in chunked encoding
+            headers['Content-Length'] = str(len(chunk))
+            content = limiter.stream(chunk) if limiter.enabled else None
+            if cancelled is not None:
+                content = stream_until_cancelled(chunk, cancelled, content)
+        client = get_http_client(presigned_chunk_url)
+        res = client.put(presigned_chunk_url, content=content, timeout=None, headers=headers)
+        res.raise_for_status()
+        return res
+
+    async def put_chunk_async(self, presigned_chunk_url: str, chunk: bytes, etag: str) -> Response:
+        """
+        Summary:
+            The async engine version of put_chunk.
+        Parameter:
+            - presigned_chunk_url(str): the presigned url of chunk.
+            - chunk(bytes): the chunk data.
+            - etag(str): the md5 of chunk data.
+        return:
+            - Response: the response of object storage.
+        """
+        headers = {
+            'Content-MD5': etag,
+        }
+        content = chunk
+        limiter = BandwidthLimiter()
+        if limiter.enabled:
+            headers['Content-Length'] = str(len(chunk))
+            content = limiter.stream_async(chunk)
+        res = await self.engine.client.put(presigned_chunk_url, content=content, headers=headers)
+        res.raise_for_status()
+        return res
+
+    async def upload_chunk_async(
+        self,
+        file_object: FileObject,
+        chunk_number: int,
+        chunk: bytes,
+        etag_future: Future,
+        chunk_size: int,
+        reserved_size: int,
+    ) -> None:
+        """
+        Summary:
+            The function is the async engine version of chunk upload. The md5
+            is awaited from hasher and the presigned url is taken from prefetcher
+            in executor since it may block, then the chunk is sent by the client
+            of async engine.
         Parameter:
             - file_object(FileObject): the file object that contains correct
                 information for chunk uploading.
-            - tags(list of str): the tag attached with uploaded object.
-            - chunk_result(list of ApplyResult): the result of each chunk upload.
+            - chunk_number(int): the number of current chunk.
+            - chunk(bytes): the chunk data.
+            - etag_future(Future): the future of md5 of chunk data.
+            - chunk_size(int): the size of chunk data.
+            - reserved_size(int): the size acquired from inflight budget.
         return:
             - None
         """
 
-        # check if all the chunks have been uploaded
-        [res.wait() for res in chunk_result]
+        file_object.update_progress(0)
+
+        loop = asyncio.get_running_loop()
+        try:
+            etag = await asyncio.wrap_future(etag_future)
+            presigned_chunk_url = await loop.run_in_executor(
+                None, self.presign_prefetcher.get, file_object, chunk_number, chunk_size, etag
+            )
+
+            send = partial(self.put_chunk_async, presigned_chunk_url, chunk, etag)
+            start_time = time.monotonic()
+            await (self.hedger.call_async(send, len(chunk)) if self.hedger else send())
+            self.part_planner.observe(len(chunk), time.monotonic() - start_time)
+            self.record_uploaded_chunk(file_object, chunk_number, etag, chunk_size)
+
+        except HTTPStatusError as e:
+            # do not exit inside the event loop, it will stop other uploads.
+            # the error is kept in the result of chunk instead
+            logger.error(e.response.content)
+            raise
+
+        self.inflight_budget.release(reserved_size)
+        self.presign_prefetcher.discard(file_object, chunk_number)
+        release_page_cache(file_object.local_path, (chunk_number - 1) * file_object.chunk_size, chunk_size)
+
+        # update the progress bar
+        file_object.update_progress(len(chunk))
+
+    def on_succeed(self, file_object: FileObject) -> None:
+        """
+        Summary:
+            The function is to finalize the upload process. It is called
+            by the finaliser after all the chunks have been uploaded.
+        Parameter:
+            - file_object(FileObject): the file object that contains correct
+                information for chunk uploading.
+        return:
+            - dict: the finalised item. it raises HTTPStatusError when the
+                file is failed, so the other files are still finalised.
+        """
 
         payload = generate_on_success_form(
             self.project_code,
@@ -422,9 +911,11 @@ class UploadClient(BaseAuthClient):
 
             response = self._post('files', json=payload)
         except HTTPStatusError as e:
-            response = e.response
-            SrvErrorHandler.default_handle(response.content, True)
+            SrvErrorHandler.default_handle(e.response.content)
+            raise
 
+        if self.journal is not None:
+            self.journal.finalised(file_object)
         result = response.json().get('result')
         return result
 
@@ -450,16 +941,10 @@ class UploadClient(BaseAuthClient):
 
     def set_finish_upload(self):
         self.finish_upload = True
-
-    def upload_token_refresh(self, azp: str = ConfigClass.keycloak_device_client_id):
-        token_manager = SrvTokenManager()
-        DEFAULT_INTERVAL = 2  # seconds to check if the upload is finished
-        total_count = 0  # when total_count equals token_refresh_interval, refresh token
-        while self.finish_upload is not True:
-            if total_count >= AppConfig.Env.token_refresh_interval:
-                token_manager.refresh(azp)
-                total_count = 0
-
-            # if not then sleep for DEFAULT_INTERVAL seconds
-            time.sleep(DEFAULT_INTERVAL)
-            total_count = total_count + DEFAULT_INTERVAL
+        self.presign_prefetcher.shutdown()
+        self.chunk_hasher.shutdown()
+        self.finaliser.shutdown()
+        self.retry_scheduler.shutdown()
+        self.chunk_hash_cache.close()
+        if self.hedger is not None:
+            self.hedger.shutdown()
@@ -0,0 +1,173 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+
+from app.services.file_manager.file_upload.models import FileObject
+
+logger = getLogger(__name__)
+
+
+class UploadFailure(NamedTuple):
+    """The file that is not uploaded or finalised."""
+
+    file_name: str
+    error: BaseException
+
+
+class UploadFinaliser:
+    """
+    Summary:
+        The class finalises a file as soon as all its chunks are uploaded.
+        It counts the chunks in flight of each file and the reader holds one
+        more count until all the chunks of file are submitted. When the count
+        drops to zero, the finalise function runs in a small dedicated pool,
+        so the upload workers never wait for the other chunks of a file.
+        The finalise requests of many small files run concurrently, up to
+        max_workers at a time. The file with any failed chunk is not
+        finalised, and a failed finalise only fails its own file. Only the
+        failed files are kept, so the memory does not grow with the number
+        of uploaded files.
+    """
+
+    def __init__(self, finalise: Callable[[FileObject], Any], max_workers: int) -> None:
+        self.finalise = finalise
+        self.max_workers = max_workers
+        self._executor = None
+        self._condition = threading.Condition()
+
+        # item_id -> number of chunks in flight, plus one until sealed
+        self._pending: Dict[str, int] = {}
+        self._errors: Dict[str, BaseException] = {}
+        # number of finalise functions that are not finished
+        self._running = 0
+        self._exit: Optional[BaseException] = None
+        # item_id -> the file that is not uploaded or finalised
+        self.failures: Dict[str, UploadFailure] = {}
+
+    def start(self, file_object: FileObject) -> None:
+        """
+        Summary:
+            Start to track a file before its chunks are submitted.
+        Parameter:
+            - file_object(FileObject): the file to be uploaded.
+        """
+        with self._condition:
+            self._pending[file_object.item_id] = 1
+
+    def add_chunk(self, file_object: FileObject) -> None:
+        """
+        Summary:
+            Count a chunk of file that is submitted for upload.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+        """
+        with self._condition:
+            self._pending[file_object.item_id] += 1
+
+    def chunk_done(self, file_object: FileObject, error: Optional[BaseException] = None) -> None:
+        """
+        Summary:
+            Mark a chunk of file as finished. it is the completion callback of
+            chunk upload.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - error(BaseException): the error if chunk is failed.
+        """
+        self._done(file_object, error)
+
+    def seal(self, file_object: FileObject, error: Optional[BaseException] = None) -> None:
+        """
+        Summary:
+            Mark that all the chunks of file are submitted.
+        Parameter:
+            - file_object(FileObject): the file that chunks belong to.
+            - error(BaseException): the error if reading the file is failed.
+        """
+        self._done(file_object, error)
+
+    def fail(self, file_object: FileObject, error: BaseException) -> None:
+        """
+        Summary:
+            Mark a file as failed before its chunks are submitted, eg. the
+            scheduler drops it after an error. The file that is tracked is
+            failed by its own chunks instead.
+        Parameter:
+            - file_object(FileObject): the file that is not uploaded.
+            - error(BaseException): the error of file.
+        """
+        item_id = file_object.item_id
+        with self._condition:
+            if item_id in self._pending or item_id in self.failures:
+                return
+            logger.error(f'Failed to upload {file_object.file_name}: {error}')
+            self.failures[item_id] = UploadFailure(file_object.file_name, error)
+
+    def _done(self, file_object: FileObject, error: Optional[BaseException]) -> None:
+        item_id = file_object.item_id
+        with self._condition:
+            if error is not None:
+                self._errors.setdefault(item_id, error)
+            self._pending[item_id] -= 1
+            if self._pending[item_id] > 0:
+                return
+
+            del self._pending[item_id]
+            file_object.close_progress()
+            error = self._errors.pop(item_id, None)
+            if error is not None:
+                logger.error(f'Failed to upload {file_object.file_name}: {error}')
+                self.failures[item_id] = UploadFailure(file_object.file_name, error)
+                self._condition.notify_all()
+                return
+
+            self._running += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='finalise')
+            executor = self._executor
+
+        future = executor.submit(self.finalise, file_object)
+        future.add_done_callback(lambda f: self._finalised(file_object, f))
+
+    def _finalised(self, file_object: FileObject, future: Future) -> None:
+        # the future is dropped once it is done, only the failure is kept
+        error = future.exception()
+        with self._condition:
+            self._running -= 1
+            if isinstance(error, SystemExit):
+                self._exit = self._exit or error
+            elif error is not None:
+                logger.error(f'Failed to finalise {file_object.file_name}: {error}')
+                self.failures[file_object.item_id] = UploadFailure(file_object.file_name, error)
+            self._condition.notify_all()
+
+    def wait(self) -> None:
+        """
+        Summary:
+            Wait until all the tracked files are finalised or failed. The
+            files failed to finalise are added into failures. The exit of
+            finalise function is raised again in the caller thread.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending and not self._running)
+            if self._exit is not None:
+                raise self._exit
+
+    def shutdown(self) -> None:
+        """
+        Summary:
+            Stop the finalise workers.
+        """
+        with self._condition:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
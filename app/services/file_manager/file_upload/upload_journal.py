@@ -0,0 +1,257 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import json
+import os
+import shutil
+import threading
+from logging import getLogger
+from typing import Any
+from typing import Dict
+from typing import List
+
+from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.models import ChunkState
+from app.services.file_manager.file_upload.models import FileObject
+from app.services.file_manager.file_upload.models import encode_chunk_state
+
+logger = getLogger(__name__)
+
+
+def get_journal_path(output_path: str) -> str:
+    return output_path + '.journal'
+
+
+def get_compacting_path(output_path: str) -> str:
+    return output_path + '.journal.compacting'
+
+
+def apply_record(manifest: Dict[str, Any], record: Dict[str, Any]) -> None:
+    """
+    Summary:
+        Apply a journal record on the manifest. The records are idempotent,
+        so replaying a record that is already compacted does nothing.
+    Parameter:
+        - manifest(dict): the manifest in json format.
+        - record(dict): the journal record.
+    """
+    file_objects = manifest.setdefault('file_objects', {})
+    operation = record.get('op')
+    if operation == 'register':
+        # the uploaded chunks of registered file are all recorded in journal
+        file_info = record.get('file')
+        file_objects.setdefault(file_info.get('item_id'), dict(file_info, journaled=True))
+        return
+
+    file_info = file_objects.get(record.get('item_id'))
+    if file_info is None:
+        return
+    elif operation == 'checked':
+        # the uploaded chunks of file in old manifest are checked on server
+        file_info['uploaded_chunks'] = ChunkState.from_json(record.get('uploaded_chunks'))
+        file_info['journaled'] = True
+    elif operation == 'chunk':
+        # the chunks are kept as state until the manifest is written
+        uploaded_chunks = ChunkState.from_json(file_info.get('uploaded_chunks'))
+        uploaded_chunks.set(record.get('chunk_number'), record.get('etag'), record.get('chunk_size'))
+        file_info['uploaded_chunks'] = uploaded_chunks
+    elif operation == 'finalise':
+        file_info['finalised'] = True
+
+
+def replay_journal(manifest: Dict[str, Any], journal_path: str) -> None:
+    """
+    Summary:
+        Apply the records of a journal file on the manifest. The last record
+        can be partly written by a crash, it is ignored.
+    Parameter:
+        - manifest(dict): the manifest in json format.
+        - journal_path(str): the path of journal.
+    """
+    try:
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f'Ignore the broken record in journal {journal_path}')
+                    break
+                apply_record(manifest, record)
+    except FileNotFoundError:
+        pass
+
+
+class UploadJournal:
+    """
+    Summary:
+        The append-only journal of upload progress next to the resumable
+        manifest. The registered files, the uploaded chunks and the finalised
+        files are appended as json lines when they happen, so the progress
+        survives a crash or Ctrl-C without rewriting the manifest each time.
+        The manifest is not kept in memory. Once the journal has as many
+        records as the manifest has files, it is moved aside and compacted
+        into the manifest on disk, while the new records go to a new journal.
+        The manifest is replaced atomically, so it is always either the old
+        or the new one.
+    """
+
+    def __init__(self, output_path: str, new_manifest: bool = False) -> None:
+        self.output_path = output_path
+        self.journal_path = get_journal_path(output_path)
+        self.compacting_path = get_compacting_path(output_path)
+
+        self._lock = threading.Lock()
+        # only one compaction runs at a time, the records are still appended
+        self._compact_lock = threading.Lock()
+        self._file = None
+        self._records = 0
+
+        # the journal next to a manifest that is just written is left by
+        # another upload, it does not belong to the manifest
+        if new_manifest:
+            for path in (self.journal_path, self.compacting_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        else:
+            # the journal left by an interrupted upload is compacted first
+            self._rotate()
+            self._compact()
+        with open(self.output_path, 'r') as f:
+            self._files = len(json.load(f).get('file_objects', {}))
+
+    def _append(self, records: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.journal_path, 'a')
+            self._file.write(''.join(json.dumps(record) + '\n' for record in records))
+            self._file.flush()
+
+            self._files += sum(1 for record in records if record.get('op') == 'register')
+            self._records += len(records)
+            if self._records < max(AppConfig.Env.journal_compact_records, self._files):
+                return
+            if not self._compact_lock.acquire(blocking=False):
+                return
+            self._rotate()
+
+        # the manifest is rewritten without the lock, the chunk workers
+        # keep appending to the new journal
+        try:
+            self._compact()
+        finally:
+            self._compact_lock.release()
+
+    def register(self, file_objects: List[FileObject]) -> None:
+        """
+        Summary:
+            Record the files that are registered for upload.
+        Parameter:
+            - file_objects(list of FileObject): the registered files.
+        """
+        self._append([{'op': 'register', 'file': file_object.to_dict()} for file_object in file_objects])
+
+    def checked(self, file_objects: List[FileObject]) -> None:
+        """
+        Summary:
+            Record the uploaded chunks of the files in old manifest, which are
+            checked on server. The next resume takes them from the journal.
+        Parameter:
+            - file_objects(list of FileObject): the checked files.
+        """
+        self._append(
+            [
+                {'op': 'checked', 'item_id': x.item_id, 'uploaded_chunks': x.uploaded_chunks.to_json()}
+                for x in file_objects
+            ]
+        )
+
+    def chunk_uploaded(self, file_object: FileObject, chunk_number: int, etag: str, chunk_size: int) -> None:
+        """
+        Summary:
+            Record a chunk that is acknowledged by the object storage.
+        Parameter:
+            - file_object(FileObject): the file that chunk belongs to.
+            - chunk_number(int): the number of chunk.
+            - etag(str): the md5 of chunk data.
+            - chunk_size(int): the size of chunk data.
+        """
+        record = {
+            'op': 'chunk',
+            'item_id': file_object.item_id,
+            'chunk_number': chunk_number,
+            'etag': etag,
+            'chunk_size': chunk_size,
+        }
+        self._append([record])
+
+    def finalised(self, file_object: FileObject) -> None:
+        """
+        Summary:
+            Record a file that is finalised.
+        Parameter:
+            - file_object(FileObject): the finalised file.
+        """
+        self._append([{'op': 'finalise', 'item_id': file_object.item_id}])
+
+    def _rotate(self) -> None:
+        # move the journal aside for compaction, the next record opens a new
+        # one. the journal left by a failed compaction is kept before it
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._records = 0
+        if not os.path.exists(self.journal_path):
+            return
+        elif os.path.exists(self.compacting_path):
+            with open(self.journal_path, 'r') as src, open(self.compacting_path, 'a') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.compacting_path)
+
+    def _compact(self) -> None:
+        if not os.path.exists(self.compacting_path):
+            return
+
+        with open(self.output_path, 'r') as f:
+            manifest = json.load(f)
+        replay_journal(manifest, self.compacting_path)
+
+        temp_path = self.output_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, default=encode_chunk_state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.output_path)
+        # the records are in the manifest now
+        os.remove(self.compacting_path)
+
+    def close(self) -> None:
+        """
+        Summary:
+            Compact the journal into the manifest.
+        """
+        with self._compact_lock:
+            with self._lock:
+                self._rotate()
+            self._compact()
+
+    @staticmethod
+    def load(output_path: str) -> Dict[str, Any]:
+        """
+        Summary:
+            Read the manifest and replay the journal left by an interrupted
+            upload, including the one that was being compacted.
+        Parameter:
+            - output_path(str): the path of manifest.
+        return:
+            - dict: the manifest in json format, the uploaded chunks of
+                the replayed records are ChunkState.
+        """
+        with open(output_path, 'r') as f:
+            manifest = json.load(f)
+
+        replay_journal(manifest, get_compacting_path(output_path))
+        replay_journal(manifest, get_journal_path(output_path))
+        return manifest
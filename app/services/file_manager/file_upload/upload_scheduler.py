@@ -0,0 +1,158 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+from collections import deque
+from enum import Enum
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+from queue import Queue
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.models import FileObject
+from app.services.file_manager.file_upload.upload_client import UploadClient
+
+
+class SchedulePolicy(str, Enum):
+    """Available orders to upload the files."""
+
+    # the order the files are found
+    WALK = 'walk'
+    # the largest files first, so no big file is left alone at the end
+    LARGEST_FIRST = 'largest-first'
+    # the chunks of a few largest files at a time in turn
+    INTERLEAVE = 'interleave'
+
+
+class UploadScheduler:
+    """
+    Summary:
+        The scheduler decides the order that registered files are streamed
+        into the pool, to shorten the total time of upload. Except the walk
+        policy, the largest files of each registered batch are started first,
+        since a big file started last keeps a single thread busy while the
+        others are idle. The batch is streamed as soon as it is registered,
+        so the upload is not held back until more files are registered. The
+        interleave policy also streams the chunks of several files in turn.
+        The small files are streamed by a lane of their own as soon as they
+        are registered, so they are not queued behind the chunks of big
+        files. After an error in the lane, the rest of its files are failed
+        with the error, so they are reported and can be resumed.
+    """
+
+    def __init__(
+        self,
+        upload_client: UploadClient,
+        pool: ThreadPool,
+        policy: SchedulePolicy = SchedulePolicy.WALK,
+    ) -> None:
+        self.upload_client = upload_client
+        self.pool = pool
+        self.policy = SchedulePolicy(policy)
+
+        self._closed = False
+        self._lane_error: Optional[BaseException] = None
+        self._lane_queue: Queue = Queue()
+        self._lane_thread = None
+        if self.policy != SchedulePolicy.WALK:
+            self._lane_thread = threading.Thread(target=self._run_lane, daemon=True)
+            self._lane_thread.start()
+
+    def is_small(self, file_object: FileObject) -> bool:
+        return file_object.total_size <= AppConfig.Env.small_file_lane_size
+
+    def add(self, file_objects: Iterable[FileObject]) -> None:
+        """
+        Summary:
+            Stream a batch of registered files. With walk policy they are
+            streamed in the given order, otherwise the largest first.
+        Parameter:
+            - file_objects(list of FileObject): the registered files.
+        """
+        if self._closed:
+            return
+
+        pending = []
+        for file_object in file_objects:
+            if self.policy == SchedulePolicy.WALK:
+                self.upload_client.stream_upload(file_object, self.pool)
+            elif self.is_small(file_object):
+                self._lane_queue.put(file_object)
+            else:
+                pending.append(file_object)
+
+        pending.sort(key=lambda file_object: file_object.total_size, reverse=True)
+        if self.policy == SchedulePolicy.INTERLEAVE:
+            self._interleave(pending)
+        else:
+            for file_object in pending:
+                self.upload_client.stream_upload(file_object, self.pool)
+
+    def _interleave(self, file_objects: List[FileObject]) -> None:
+        remaining = iter(file_objects)
+        active = deque(
+            self.upload_client.iter_stream_upload(file_object, self.pool)
+            for file_object in islice(remaining, AppConfig.Env.upload_interleave_files)
+        )
+        try:
+            while active:
+                steps = active.popleft()
+                # a file takes its turn once a chunk is submitted
+                if next(steps, None) is not None:
+                    active.append(steps)
+                    continue
+                file_object = next(remaining, None)
+                if file_object is not None:
+                    active.append(self.upload_client.iter_stream_upload(file_object, self.pool))
+        finally:
+            # the files in turn are sealed with the error
+            for steps in active:
+                steps.close()
+
+    def _run_lane(self) -> None:
+        while True:
+            file_object = self._lane_queue.get()
+            if file_object is None:
+                return
+            # the rest of the files are dropped after close, and failed
+            # after an error since they are already registered
+            if self._closed:
+                continue
+            elif self._lane_error is not None:
+                self.upload_client.finaliser.fail(file_object, self._lane_error)
+                continue
+            try:
+                self.upload_client.stream_upload(file_object, self.pool)
+            except BaseException as e:
+                self._lane_error = e
+                self.upload_client.finaliser.fail(file_object, e)
+
+    def _stop_lane(self) -> None:
+        if self._lane_thread is not None:
+            self._lane_queue.put(None)
+            self._lane_thread.join()
+            self._lane_thread = None
+
+    def finish(self) -> None:
+        """
+        Summary:
+            Wait for the lane of small files. The files failed in the lane
+            are reported by the finaliser, only the exit or interrupt of the
+            lane is raised here.
+        """
+        self._stop_lane()
+        if self._lane_error is not None and not isinstance(self._lane_error, Exception):
+            raise self._lane_error
+
+    def close(self) -> None:
+        """
+        Summary:
+            Stop the scheduler when the upload is interrupted, the files not
+            streamed yet are dropped.
+        """
+        self._closed = True
+        self._stop_lane()
@@ -95,6 +95,22 @@ def file_help_page(FileHELP: FileHELP):
     return helps.get(FileHELP.name)
 
 
+class TransferHELP(enum.Enum):
+    TRANSFER_HEDGE = 'TRANSFER_HEDGE'
+    TRANSFER_SCHEDULE = 'TRANSFER_SCHEDULE'
+    TRANSFER_HOST_THREADS = 'TRANSFER_HOST_THREADS'
+    TRANSFER_LIMIT_RATE = 'TRANSFER_LIMIT_RATE'
+    TRANSFER_PROGRESS_FILES = 'TRANSFER_PROGRESS_FILES'
+    TRANSFER_MAX_INFLIGHT_MB = 'TRANSFER_MAX_INFLIGHT_MB'
+    TRANSFER_ENGINE = 'TRANSFER_ENGINE'
+    TRANSFER_CONCURRENCY = 'TRANSFER_CONCURRENCY'
+
+
+def transfer_help_page(TransferHELP: TransferHELP):
+    helps = help_msg.get('transfer', 'default transfer help')
+    return helps.get(TransferHELP.name)
+
+
 class ContainerRegistryHELP(enum.Enum):
     LIST_PROJECTS = 'LIST_PROJECTS'
     LIST_REPOSITORIES = 'LIST_REPOSITORIES'
@@ -193,6 +193,11 @@ class SrvOutPutHandler(metaclass=MetaService):
         """e.g. Start Uploading: ./test_file."""
         logger.info(f'Starting upload of: {filename}')
 
+    @staticmethod
+    def upload_failed(filename, error):
+        """e.g. Failed to upload ./test_file: chunk 1 failed after 5 attempts."""
+        logger.error(f'Failed to upload {filename}: {error}')
+
     @staticmethod
     def cancel_upload():
         logger.warning('Upload cancelled.')
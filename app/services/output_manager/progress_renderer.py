@@ -0,0 +1,267 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import heapq
+import sys
+import threading
+import time
+from collections import deque
+from typing import IO
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from tqdm import tqdm
+
+from app.configs.app_config import AppConfig
+from app.models.singleton import Singleton
+
+TOTAL_FORMAT = '{desc} |{bar:30} {percentage:3.0f}% {n_fmt}B/{total_fmt}B {files} {rate_fmt} ETA {remaining}{postfix}'
+NO_TOTAL_FORMAT = '{desc} {n_fmt}B {files} {rate_fmt}{postfix}'
+SUMMARY_FORMAT = '{desc} {percentage:3.0f}% {n_fmt}B/{total_fmt}B {files} {rate_fmt} ETA {remaining}{postfix}'
+FILE_FORMAT = '  {desc} |{bar:20} {percentage:3.0f}% {n_fmt}B/{total_fmt}B'
+# the longest file name shown in the view of active files
+FILE_NAME_WIDTH = 40
+
+
+class ActiveFile:
+    """The progress of a file in transfer."""
+
+    __slots__ = ('name', 'total', 'done')
+
+    def __init__(self, name: str, total: Optional[int]) -> None:
+        self.name = name
+        self.total = total
+        self.done = 0
+
+
+class ProgressRenderer(metaclass=Singleton):
+    """
+    Summary:
+        The progress of all the files transferred by the process. The
+        transfers only add up the bytes, and a dedicated thread draws one
+        aggregate bar of bytes, files, throughput and ETA at a capped rate,
+        so thousands of files in flight do not redraw the terminal on each
+        chunk. The largest active files can be listed under the bar. When
+        the output is not a terminal, a one-line summary is printed
+        periodically instead.
+    """
+
+    def __init__(self) -> None:
+        self.description = 'Transferring'
+        self.top_files = 0
+        self.stream: Optional[IO] = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._tty = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._active: Dict[str, ActiveFile] = {}
+        self._total_files = 0
+        self._total_bytes = 0
+        self._done_files = 0
+        self._bytes = 0
+        self._status = ''
+        self._started = time.monotonic()
+        self._samples = deque()
+        self._lines = 0
+
+    def configure(self, description: str, top_files: int = 0, stream: IO = None) -> None:
+        """
+        Summary:
+            Set up the progress of a command.
+        Parameter:
+            - description(str): the action shown before the bar, eg. Uploading.
+            - top_files(int): the number of active files shown under the bar.
+            - stream(IO): the output, default is stderr.
+        """
+        self.close()
+        with self._lock:
+            self.description = description
+            self.top_files = top_files or 0
+            self.stream = stream
+            self._reset()
+
+    def add_total(self, files: int, size: int) -> None:
+        """
+        Summary:
+            Add the files that will be transferred to the total.
+        Parameter:
+            - files(int): the number of files.
+            - size(int): the size of files.
+        """
+        with self._lock:
+            self._total_files += files
+            self._total_bytes += size or 0
+
+    def update(self, key: str, size: int, name: str = None, total: int = None) -> None:
+        """
+        Summary:
+            Add the bytes transferred for a file. The file is shown as active
+            from its first update until it is finished.
+        Parameter:
+            - key(str): the unique key of file.
+            - size(int): the bytes transferred.
+            - name(str): the name of file shown in active files.
+            - total(int): the size of file.
+        """
+        with self._lock:
+            active_file = self._active.get(key)
+            if active_file is None:
+                active_file = self._active[key] = ActiveFile(name or key, total)
+            active_file.done += size
+            self._bytes += size
+
+        if self._thread is None:
+            self._start()
+
+    def finish_file(self, key: str) -> None:
+        """
+        Summary:
+            Mark a file as finished.
+        Parameter:
+            - key(str): the unique key of file.
+        """
+        with self._lock:
+            if self._active.pop(key, None) is not None:
+                self._done_files += 1
+
+    def set_status(self, status: str) -> None:
+        """
+        Summary:
+            Show the status after the bar, eg. the concurrency and throughput.
+        Parameter:
+            - status(str): the status.
+        """
+        self._status = status
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.stream = self.stream or sys.stderr
+            self._tty = self.stream.isatty()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='progress', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        interval = AppConfig.Env.progress_refresh_interval if self._tty else AppConfig.Env.progress_summary_interval
+        while not self._stop.wait(interval):
+            self.render()
+
+    def _rate(self, now: float, transferred: int) -> Optional[float]:
+        # the throughput of the last window, with at least one sample before
+        samples = self._samples
+        samples.append((now, transferred))
+        while len(samples) > 2 and samples[1][0] <= now - AppConfig.Env.progress_rate_window:
+            samples.popleft()
+        start_time, start_bytes = samples[0]
+        return (transferred - start_bytes) / (now - start_time) if now > start_time else None
+
+    def _snapshot(self) -> Tuple[int, int, str, List[Tuple[str, int, Optional[int]]]]:
+        with self._lock:
+            files = (
+                f'{self._done_files}/{self._total_files} files' if self._total_files else f'{self._done_files} files'
+            )
+            top_files = []
+            if self._tty and self.top_files:
+                top_files = heapq.nlargest(self.top_files, self._active.values(), key=lambda f: (f.total or 0) - f.done)
+                top_files = [(f.name, f.done, f.total) for f in top_files]
+            return self._bytes, self._total_bytes, files, top_files
+
+    def format_summary(self, now: float = None) -> Tuple[str, List[str]]:
+        """
+        Summary:
+            Format the aggregate bar and the lines of active files.
+        Parameter:
+            - now(float): the monotonic time of the render.
+        return:
+            - str: the aggregate bar, or the summary when output is not a terminal.
+            - list of str: the lines of active files.
+        """
+        now = now or time.monotonic()
+        transferred, total, files, top_files = self._snapshot()
+        # the total can be unknown or smaller than the bytes with unknown sizes
+        total = total if total >= transferred else 0
+        bar_format = (TOTAL_FORMAT if self._tty else SUMMARY_FORMAT) if total else NO_TOTAL_FORMAT
+        summary = tqdm.format_meter(
+            transferred,
+            total or None,
+            now - self._started,
+            prefix=self.description,
+            unit='iB',
+            unit_scale=True,
+            unit_divisor=1024,
+            rate=self._rate(now, transferred),
+            bar_format=bar_format,
+            postfix=self._status,
+            files=files,
+        )
+
+        file_lines = []
+        for name, done, file_total in top_files:
+            name = name if len(name) <= FILE_NAME_WIDTH else '...' + name[-FILE_NAME_WIDTH + 3 :]
+            file_lines.append(
+                tqdm.format_meter(
+                    done,
+                    file_total if file_total and file_total >= done else None,
+                    now - self._started,
+                    prefix=name,
+                    unit='iB',
+                    unit_scale=True,
+                    unit_divisor=1024,
+                    bar_format=FILE_FORMAT if file_total and file_total >= done else '  {desc} {n_fmt}B',
+                )
+            )
+        return summary, file_lines
+
+    def render(self, final: bool = False) -> None:
+        """
+        Summary:
+            Draw the progress. On terminal the bar is redrawn in place, and
+            the last one is kept when it is final. Otherwise a summary line
+            is printed.
+        Parameter:
+            - final(bool): if the transfer is finished.
+        """
+        summary, file_lines = self.format_summary()
+        if not self._tty:
+            self.stream.write(summary + '\n')
+            self.stream.flush()
+            return
+
+        lines = [summary] + ([] if final else file_lines)
+        # the lines of previous draw that are not used now are cleared
+        lines += [''] * (self._lines - len(lines))
+        output = f'\x1b[{self._lines - 1}A' if self._lines > 1 else ''
+        output += '\n'.join(f'\r{line}\x1b[K' for line in lines)
+        if final:
+            # the cursor goes back under the bar, the cleared lines are reused
+            output += f'\x1b[{len(lines) - 1}A' if len(lines) > 1 else ''
+            output += '\n'
+        self._lines = 0 if final else len(lines)
+        self.stream.write(output)
+        self.stream.flush()
+
+    def close(self) -> None:
+        """
+        Summary:
+            Stop the drawing thread and draw the final progress, then the
+            progress is reset for the next transfer.
+        """
+        thread = self._thread
+        if thread is None:
+            return
+
+        self._stop.set()
+        thread.join()
+        self.render(final=True)
+        with self._lock:
+            self._thread = None
+            self._reset()
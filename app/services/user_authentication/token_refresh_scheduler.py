@@ -0,0 +1,123 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+import time
+import weakref
+from logging import getLogger
+from typing import Optional
+
+from app.configs.app_config import AppConfig
+from app.configs.config import ConfigClass
+from app.configs.user_config import UserConfig
+from app.models.singleton import Singleton
+from app.services.user_authentication.token_manager import SrvTokenManager
+
+logger = getLogger(__name__)
+
+
+class TokenRefreshScheduler(metaclass=Singleton):
+    """
+    Summary:
+        The refresh of access token shared by the long-running operations of
+        the process. While any operation subscribes, a timer thread sleeps
+        until shortly before the `exp` of access token, refreshes it and
+        publishes the new token to the headers of all the auth clients. The
+        thread does not take a worker of any pool, and it stops when the
+        last operation unsubscribes.
+    """
+
+    def __init__(self, azp: str = ConfigClass.keycloak_device_client_id) -> None:
+        self.azp = azp
+        self._lock = threading.Lock()
+        # the clients are not kept alive by the scheduler
+        self._clients = weakref.WeakSet()
+        self._subscribers = 0
+        self._stop: Optional[threading.Event] = None
+
+    def register(self, client) -> None:
+        """
+        Summary:
+            Add a client to receive the refreshed token.
+        Parameter:
+            - client(BaseAuthClient): the client with Authorization header.
+        """
+        with self._lock:
+            self._clients.add(client)
+
+    def subscribe(self) -> None:
+        """
+        Summary:
+            Keep the token refreshed until unsubscribe. The timer thread is
+            started by the first subscriber.
+        """
+        with self._lock:
+            self._subscribers += 1
+            if self._subscribers > 1:
+                return
+            # each thread has its own stop event, so a thread that is still
+            # refreshing after unsubscribe never runs with the next one
+            self._stop = threading.Event()
+            threading.Thread(target=self._run, args=(self._stop,), name='token-refresh', daemon=True).start()
+
+    def unsubscribe(self) -> None:
+        """
+        Summary:
+            Stop the refresh of the operation. The timer thread is stopped
+            by the last subscriber.
+        """
+        with self._lock:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                self._stop.set()
+
+    def next_delay(self, now: float = None) -> float:
+        """
+        Summary:
+            The seconds until the next refresh. The token is refreshed
+            token_warn_need_refresh seconds before it expires, or at half of
+            its lifetime if the lifetime is shorter.
+        Parameter:
+            - now(float): the current unix time.
+        return:
+            - float: the seconds to wait.
+        """
+        try:
+            access_token = SrvTokenManager().decode_access_token()
+            expiry_at = int(access_token['exp'])
+        except Exception as e:
+            logger.debug(f'Unable to read the expiry of access token: {e}')
+            return AppConfig.Env.token_refresh_interval
+
+        margin = AppConfig.Env.token_warn_need_refresh
+        if 'iat' in access_token:
+            margin = min(margin, (expiry_at - int(access_token['iat'])) / 2)
+        return max(expiry_at - (now or time.time()) - margin, AppConfig.Env.token_refresh_min_delay)
+
+    def _run(self, stop: threading.Event) -> None:
+        while not stop.wait(self.next_delay()):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f'Failed to refresh the access token: {e}')
+
+    def refresh(self) -> None:
+        """
+        Summary:
+            Refresh the access token and publish it to the clients.
+        """
+        SrvTokenManager().refresh(self.azp)
+        self.publish(UserConfig().access_token)
+
+    def publish(self, access_token: str) -> None:
+        """
+        Summary:
+            Set the new token into the headers of all the clients.
+        Parameter:
+            - access_token(str): the access token.
+        """
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.headers['Authorization'] = 'Bearer ' + access_token
@@ -5,8 +5,14 @@
 import os
 import re
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Tuple
 
@@ -22,6 +28,8 @@ from app.services.clients.base_auth_client import BaseAuthClient
 from app.services.output_manager.error_handler import ECustomizedError
 from app.services.output_manager.error_handler import SrvErrorHandler
 from app.services.user_authentication.decorator import require_valid_token
+from app.utils.stat_cache import StatCache
+from app.utils.stat_cache import parallel_walk
 
 
 @require_valid_token()
@@ -159,18 +167,49 @@ def doc(arg):
     return decorator
 
 
-def get_file_in_folder(path):
+def iter_file_in_folder(path) -> Iterator[str]:
+    '''
+    Summary:
+        Stream the files under the folders with os.scandir, so the files
+        can be processed while the rest of tree is scanned. Same as os.walk,
+        the symlinks to folder are not followed and the folders that cannot
+        be read are skipped. When the stat cache is enabled, the folders are
+        read concurrently and the stat of files are cached.
+    Parameter:
+        - path(str|list): the folder or file, or a list of them.
+    Return:
+        - Iterator[str]: the path of files.
+    '''
     path = path if isinstance(path, list) else [path]
-    files_list = []
     for _path in path:
-        if os.path.isdir(_path):
-            for path, _, files in os.walk(_path):
-                for name in files:
-                    file = normalize_join(path, name)
-                    files_list.append(file)
-        else:
-            files_list.append(_path)
-    return files_list
+        if not os.path.isdir(_path):
+            yield _path
+            continue
+        elif StatCache().enabled:
+            yield from parallel_walk(_path)
+            continue
+
+        folders = [_path]
+        while folders:
+            folder = folders.pop()
+            try:
+                entries = os.scandir(folder)
+            except OSError:
+                continue
+
+            sub_folders = []
+            with entries:
+                for entry in entries:
+                    if entry.is_dir() and not entry.is_symlink():
+                        sub_folders.append(normalize_join(folder, entry.name))
+                    elif not entry.is_dir():
+                        yield normalize_join(folder, entry.name)
+            # keep the top down order of os.walk
+            folders.extend(reversed(sub_folders))
+
+
+def get_file_in_folder(path):
+    return list(iter_file_in_folder(path))
 
 
 def identify_target_folder(project_path: str) -> Tuple[str, ItemType, str]:
@@ -211,10 +250,45 @@ def identify_target_folder(project_path: str) -> Tuple[str, ItemType, str]:
     return project_code, folder_type, target_folder
 
 
-def batch_generator(iterable: List[Any], batch_size=1):
-    max_size = len(iterable)
-    for start_index in range(0, max_size, batch_size):
-        yield iterable[start_index : min(start_index + batch_size, max_size)]
+def batch_generator(iterable: Iterable[Any], batch_size=1) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def pipelined_map(func: Callable[[Any], Any], iterable: Iterable[Any], max_in_flight: int) -> Iterator[List[Any]]:
+    '''
+    Summary:
+        Apply the function to the items in a thread pool with at most
+        max_in_flight items in progress. The caller can process the first
+        results while the following items are still in progress, which
+        makes the stages of a job overlap. The items are consumed lazily.
+    Parameter:
+        - func(Callable): the function applied to each item.
+        - iterable(Iterable): the items.
+        - max_in_flight(int): the maximum number of items in progress.
+    Return:
+        - Iterator[List]: the results in the order of items. Each time, all
+            the finished results in order are returned, and at least one.
+    '''
+    items = iter(iterable)
+    in_flight = deque()
+    with ThreadPoolExecutor(max_in_flight) as executor:
+        for item in islice(items, max_in_flight):
+            in_flight.append(executor.submit(func, item))
+
+        while in_flight:
+            results = [in_flight.popleft().result()]
+            while in_flight and in_flight[0].done():
+                results.append(in_flight.popleft().result())
+
+            # refill before the caller takes the results
+            for item in islice(items, len(results)):
+                in_flight.append(executor.submit(func, item))
+            yield results
 
 
 def remove_the_output_file(filepath: str) -> None:
@@ -0,0 +1,165 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import os
+import stat
+import threading
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from app.configs.app_config import AppConfig
+from app.models.singleton import Singleton
+
+
+class StatCache(metaclass=Singleton):
+    """
+    Summary:
+        The cache of file metadata for the upload path. On network filesystem
+        each stat is a round trip to the server, so once it is enabled the
+        folder listings and the stat results found by the scanner are kept
+        and reused by the size, file and folder checks of the upload. It is
+        only enabled in cloud mode where the data is on NFS.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Optional[os.stat_result]] = {}
+        # folder -> (files, sub folders)
+        self._listings: Dict[str, Tuple[List[str], List[str]]] = {}
+
+    def stat(self, path: str) -> Optional[os.stat_result]:
+        """
+        Summary:
+            Get the stat of path, follow the symlink.
+        Parameter:
+            - path(str): the local path.
+        return:
+            - os.stat_result: the stat or None if path does not exist.
+        """
+        with self._lock:
+            if path in self._stats:
+                return self._stats[path]
+
+        try:
+            result = os.stat(path)
+        except OSError:
+            result = None
+        self.put(path, result)
+        return result
+
+    def put(self, path: str, result: Optional[os.stat_result]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stats[path] = result
+
+    def get_listing(self, folder: str) -> Optional[Tuple[List[str], List[str]]]:
+        with self._lock:
+            return self._listings.get(folder)
+
+    def put_listing(self, folder: str, files: List[str], sub_folders: List[str]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._listings[folder] = (files, sub_folders)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._listings.clear()
+
+
+def getsize(path: str) -> int:
+    """Same as os.path.getsize, but use the stat cache if it is enabled."""
+    cache = StatCache()
+    if not cache.enabled:
+        return os.path.getsize(path)
+
+    result = cache.stat(path)
+    if result is None:
+        # raise the same error as os.path.getsize
+        return os.path.getsize(path)
+    return result.st_size
+
+
+def isfile(path: str) -> bool:
+    """Same as os.path.isfile, but use the stat cache if it is enabled."""
+    cache = StatCache()
+    if not cache.enabled:
+        return os.path.isfile(path)
+
+    result = cache.stat(path)
+    return result is not None and stat.S_ISREG(result.st_mode)
+
+
+def isdir(path: str) -> bool:
+    """Same as os.path.isdir, but use the stat cache if it is enabled."""
+    cache = StatCache()
+    if not cache.enabled:
+        return os.path.isdir(path)
+
+    result = cache.stat(path)
+    return result is not None and stat.S_ISDIR(result.st_mode)
+
+
+def _read_folder(folder: str) -> Tuple[List[str], List[str]]:
+    cache = StatCache()
+    listing = cache.get_listing(folder)
+    if listing is not None:
+        return listing
+
+    files, sub_folders = [], []
+    try:
+        entries = os.scandir(folder)
+    except OSError:
+        return files, sub_folders
+
+    with entries:
+        for entry in entries:
+            # same as normalize_join, the path uses forward slashes
+            path = os.path.join(folder, entry.name).replace('\\', '/')
+            if entry.is_dir():
+                # same as os.walk, the symlinks to folder are not followed
+                if not entry.is_symlink():
+                    sub_folders.append(path)
+                continue
+
+            files.append(path)
+            try:
+                cache.put(path, entry.stat())
+            except OSError:
+                pass
+
+    cache.put_listing(folder, files, sub_folders)
+    return files, sub_folders
+
+
+def parallel_walk(folder: str, max_workers: int = AppConfig.Env.scan_workers) -> Iterator[str]:
+    """
+    Summary:
+        Walk the folder with a pool of folder readers. Each reader lists one
+        folder and stats its files, so the round trips of a network filesystem
+        run concurrently. The files are returned once their folder is read
+        and their stat is kept in StatCache.
+    Parameter:
+        - folder(str): the folder to scan.
+        - max_workers(int): the number of folder readers.
+    return:
+        - Iterator[str]: the path of files, not in the order of os.walk.
+    """
+    with ThreadPoolExecutor(max_workers, thread_name_prefix='scanner') as executor:
+        pending = {executor.submit(_read_folder, folder)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, sub_folders = future.result()
+                pending.update(executor.submit(_read_folder, sub_folder) for sub_folder in sub_folders)
+                yield from files
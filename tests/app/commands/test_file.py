@@ -18,17 +18,21 @@ from app.commands.file import file_move
 from app.commands.file import file_put
 from app.commands.file import file_resume
 from app.commands.file import file_trash
+from app.configs.user_config import UserConfig
 from app.models.item import ItemType
 from app.services.file_manager.file_metadata.file_metadata_client import FileMetaClient
 from app.services.file_manager.file_upload.models import FileObject
+from app.services.file_manager.file_upload.upload_scheduler import SchedulePolicy
 from app.services.output_manager.error_handler import ECustomizedError
 from app.services.output_manager.error_handler import customized_error_msg
+from app.utils.stat_cache import StatCache
 from tests.conftest import decoded_token
 
 
 @pytest.mark.parametrize('ending_slash', ['', '/'])
 def test_file_upload_command_success_with_attribute(mocker, cli_runner, ending_slash):
     mocker.patch('app.commands.file.validate_upload_event', return_value={'source_file': '', 'attribute': 'test'})
+    mocker.patch('app.commands.file.resolve_target_folder', return_value=({'id': 'id'}, '', 'test'))
     mocker.patch('app.commands.file.assemble_path', return_value=('test', {'id': 'id'}, True, 'test'))
 
     mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
@@ -64,6 +68,56 @@ def test_file_upload_command_success_with_attribute(mocker, cli_runner, ending_s
     attribute_mock.assert_called_once()
 
 
+def test_file_upload_command_uploads_all_inputs_together(mocker, cli_runner):
+    mocker.patch('app.commands.file.validate_upload_event', return_value={'source_file': '', 'attribute': None})
+    mocker.patch('app.commands.file.resolve_target_folder', return_value=({'id': 'id'}, '', 'test'))
+    mocker.patch('app.commands.file.assemble_path', return_value=('test', {'id': 'id'}, False, 'test'))
+    simple_upload_mock = mocker.patch('app.commands.file.simple_upload', return_value=['item_id'])
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        for name in ('a.txt', 'b.txt'):
+            with open(name, 'w') as f:
+                f.write(name)
+
+        result = cli_runner.invoke(
+            file_put, [f'test_project/{ItemType.NAMEFOLDER.get_prefix_by_type()}admin', 'a.txt', 'b.txt']
+        )
+
+    assert result.exit_code == 0
+    simple_upload_mock.assert_called_once()
+    upload_events = simple_upload_mock.call_args.args[0]
+    assert sorted(event['file'] for event in upload_events) == ['a.txt', 'b.txt']
+    # the files are uploaded in the order they are found unless a policy is chosen
+    assert simple_upload_mock.call_args.kwargs['schedule'] == SchedulePolicy.WALK.value
+
+
+def test_file_upload_command_caches_stat_from_path_check_to_end_of_upload(mocker, cli_runner):
+    mocker.patch('app.commands.file.validate_upload_event', return_value={'source_file': '', 'attribute': None})
+    mocker.patch('app.commands.file.resolve_target_folder', return_value=({'id': 'id'}, '', 'test'))
+    mocker.patch.object(UserConfig(), 'is_cloud_mode', True)
+    enabled = []
+
+    def assemble_path(*args):
+        enabled.append(StatCache().enabled)
+        StatCache().put('a.txt', None)
+        return 'test', {'id': 'id'}, False, 'test'
+
+    mocker.patch('app.commands.file.assemble_path', side_effect=assemble_path)
+    mocker.patch('app.commands.file.simple_upload', side_effect=ValueError('failed'))
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open('a.txt', 'w') as f:
+            f.write('a.txt')
+
+        cli_runner.invoke(file_put, [f'test_project/{ItemType.NAMEFOLDER.get_prefix_by_type()}admin', 'a.txt'])
+
+    assert enabled == [True]
+    # the cache is cleared also when the upload failed
+    assert StatCache()._stats == {}
+
+
 def test_file_upload_failed_with_invalid_tag_file(cli_runner):
     # create invalid tag file with wrong format
     runner = click.testing.CliRunner()
@@ -132,6 +186,37 @@ def test_resumable_upload_command_with_file_attribute_success(mocker, cli_runner
     attribute_fun_mock.assert_called_once()
 
 
+def test_resumable_upload_command_closes_engine_when_upload_failed(mocker, cli_runner):
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open('test.json', 'w') as f:
+            json.dump({'file_objects': {'test_item_id': {'file_name': 'test.json'}}, 'zone': 1}, f)
+
+        engine = Mock()
+        mocker.patch('app.commands.file.get_transfer_engine', return_value=engine)
+        mocker.patch('app.commands.file.resume_upload', side_effect=ValueError('failed'))
+        result = cli_runner.invoke(file_resume, ['--resumable-manifest', 'test.json', '--engine', 'async'])
+
+    assert isinstance(result.exception, ValueError)
+    engine.close.assert_called_once()
+
+
+def test_resumable_upload_command_closes_host_coordinator_when_upload_failed(mocker, cli_runner):
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open('test.json', 'w') as f:
+            json.dump({'file_objects': {'test_item_id': {'file_name': 'test.json'}}, 'zone': 1}, f)
+
+        host_coordinator = Mock()
+        mocker.patch('app.commands.file.HostCoordinator.from_host_option', return_value=host_coordinator)
+        mocker.patch('app.commands.file.BandwidthLimiter')
+        mocker.patch('app.commands.file.resume_upload', side_effect=ValueError('failed'))
+        result = cli_runner.invoke(file_resume, ['--resumable-manifest', 'test.json', '--host-threads', 4])
+
+    assert isinstance(result.exception, ValueError)
+    host_coordinator.close.assert_called_once()
+
+
 def test_resumable_upload_command_failed_with_file_not_exists(mocker, cli_runner):
     mocker.patch('os.path.exists', return_value=False)
 
@@ -317,6 +402,35 @@ def test_file_download_success(mocker, cli_runner, parent_folder_type):
     download_mock.assert_called_once()
 
 
+def test_file_download_with_async_engine_checks_each_download(mocker, cli_runner):
+    mocker.patch(
+        'app.services.user_authentication.token_manager.SrvTokenManager.decode_access_token',
+        return_value=decoded_token(),
+    )
+    mocker.patch(
+        'app.commands.file.search_item',
+        return_value={'code': 200, 'result': {'type': ItemType.FILE.value, 'id': 'id'}},
+    )
+    download_result = Mock()
+    download_result.get.return_value = './test.txt'
+    download_mock = mocker.patch(
+        'app.services.file_manager.file_download.download_client.SrvFileDownload.simple_download_file',
+        return_value=download_result,
+    )
+    finish_mock = mocker.patch(
+        'app.services.file_manager.file_download.download_client.SrvFileDownload.finish_download',
+        return_value=None,
+    )
+
+    paths = ['testproject/users/test/a.txt', 'testproject/users/test/b.txt']
+    result = cli_runner.invoke(file_download, [*paths, './', '--engine', 'async', '--concurrency', 4])
+
+    assert result.exit_code == 0
+    assert download_mock.call_count == 2
+    assert finish_mock.call_count == 2
+    finish_mock.assert_called_with('./test.txt')
+
+
 def test_download_file_metadata_file_duplicate_success(mocker, cli_runner):
     mocker.patch(
         'app.services.user_authentication.token_manager.SrvTokenManager.decode_access_token',
@@ -0,0 +1,98 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+from datetime import datetime
+
+import pytest
+
+from app.services.clients.bandwidth_limiter import BandwidthLimiter
+from app.services.clients.bandwidth_limiter import RateWindow
+from app.services.clients.bandwidth_limiter import parse_rate
+from app.services.clients.bandwidth_limiter import parse_rate_schedule
+
+
+@pytest.mark.parametrize(
+    'value,expected',
+    [
+        ('500', 500),
+        ('500K', 500 * 1024),
+        ('200M', 200 * 1024**2),
+        ('1.5G', 1.5 * 1024**3),
+        ('10mb', 10 * 1024**2),
+    ],
+)
+def test_parse_rate(value, expected):
+    assert parse_rate(value) == expected
+
+
+@pytest.mark.parametrize('value', ['0', 'unlimited'])
+def test_parse_rate_without_limit(value):
+    assert parse_rate(value) is None
+
+
+@pytest.mark.parametrize('value', ['fast', '10T', '08:00-25:00=1M', '08:00-18:61=1M'])
+def test_parse_rate_schedule_rejects_invalid_value(value):
+    with pytest.raises(ValueError):
+        parse_rate_schedule(value)
+
+
+def test_parse_rate_schedule_checks_default_rate_after_windows():
+    schedule = parse_rate_schedule('200M,08:00-18:00=50M')
+
+    assert schedule == [RateWindow(8 * 60, 18 * 60, 50 * 1024**2), RateWindow(0, 24 * 60, 200 * 1024**2)]
+
+
+def test_bandwidth_limiter_follows_schedule_of_local_time():
+    limiter = BandwidthLimiter()
+    limiter.configure(parse_rate_schedule('08:00-18:00=50M,22:00-06:00=0,200M'))
+
+    assert limiter.get_rate(datetime(2024, 1, 1, 9, 30)) == 50 * 1024**2
+    assert limiter.get_rate(datetime(2024, 1, 1, 18, 0)) == 200 * 1024**2
+    # the window crosses midnight
+    assert limiter.get_rate(datetime(2024, 1, 1, 23, 0)) is None
+    assert limiter.get_rate(datetime(2024, 1, 1, 5, 59)) is None
+
+
+def test_bandwidth_limiter_does_nothing_without_rate(mocker):
+    sleep_mock = mocker.patch('app.services.clients.bandwidth_limiter.time.sleep')
+    limiter = BandwidthLimiter()
+    limiter.configure(None)
+
+    limiter.consume(1024**3)
+
+    assert not limiter.enabled
+    sleep_mock.assert_not_called()
+
+
+def test_bandwidth_limiter_waits_for_the_bytes_over_rate(mocker):
+    mocker.patch('app.services.clients.bandwidth_limiter.time.monotonic', return_value=100.0)
+    limiter = BandwidthLimiter()
+    limiter.configure(parse_rate_schedule('1K'))
+
+    assert limiter.reserve(512) == 0.5
+    # the bucket is in debt, so the next bytes wait longer
+    assert limiter.reserve(1024) == 1.5
+
+
+def test_bandwidth_limiter_refills_tokens_up_to_burst(mocker):
+    monotonic_mock = mocker.patch('app.services.clients.bandwidth_limiter.time.monotonic', return_value=100.0)
+    mocker.patch('app.configs.app_config.AppConfig.Env.limit_rate_burst_seconds', 2)
+    limiter = BandwidthLimiter()
+    limiter.configure(parse_rate_schedule('1K'))
+
+    monotonic_mock.return_value = 200.0
+    assert limiter.reserve(2048) == 0
+    assert limiter.reserve(1024) == 1
+
+
+def test_bandwidth_limiter_streams_all_data_in_blocks(mocker):
+    mocker.patch('app.configs.app_config.AppConfig.Env.limit_rate_block_size', 4)
+    consume_mock = mocker.patch.object(BandwidthLimiter, 'consume')
+    limiter = BandwidthLimiter()
+    limiter.configure(parse_rate_schedule('1M'))
+
+    blocks = list(limiter.stream(b'0123456789'))
+
+    assert b''.join(blocks) == b'0123456789'
+    assert [call.args[0] for call in consume_mock.call_args_list] == [4, 4, 2]
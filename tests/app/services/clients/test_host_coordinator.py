@@ -0,0 +1,122 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import multiprocessing
+import time
+
+import pytest
+
+from app.services.clients.bandwidth_limiter import BandwidthLimiter
+from app.services.clients.bandwidth_limiter import parse_rate_schedule
+from app.services.clients.host_coordinator import HostCoordinator
+from app.services.file_manager.file_upload.concurrency_controller import ConcurrencyController
+
+pytestmark = pytest.mark.skipif(not HostCoordinator.supported, reason='file lock is not supported')
+
+
+@pytest.fixture
+def lock_path(tmp_path, mocker):
+    mocker.patch('app.configs.app_config.AppConfig.Env.host_coordinator_refresh_interval', 0)
+    mocker.patch('app.configs.app_config.AppConfig.Env.host_coordinator_poll_interval', 0.01)
+    return str(tmp_path / 'coordinator')
+
+
+def test_host_coordinator_splits_slots_between_processes(lock_path):
+    first = HostCoordinator(lock_path, 2)
+    second = HostCoordinator(lock_path, 2)
+
+    slot = first.acquire()
+    # the fair share of each process is one slot
+    assert first._try_acquire() is None
+    assert second.acquire() != slot
+
+    first.close()
+    second.close()
+
+
+def test_host_coordinator_never_exceeds_slots_of_host(lock_path):
+    first = HostCoordinator(lock_path, 3)
+    slots = [first.acquire() for _ in range(3)]
+    second = HostCoordinator(lock_path, 3)
+
+    assert second._try_acquire() is None
+    first.release(slots[0])
+    assert second._try_acquire() == slots[0]
+
+    first.close()
+    second.close()
+
+
+def test_host_coordinator_ignores_release_after_close(lock_path):
+    coordinator = HostCoordinator(lock_path, 2)
+    slot = coordinator.acquire()
+
+    # the upload is interrupted while a worker still holds the slot
+    coordinator.close()
+    coordinator.release(slot)
+
+    with pytest.raises(RuntimeError):
+        coordinator.acquire()
+
+
+def test_host_coordinator_removes_member_left_by_crashed_process(lock_path):
+    coordinator = HostCoordinator(lock_path, 2)
+    stale_member = f'{lock_path}/member-0-stale.lock'
+    open(stale_member, 'w').close()
+
+    assert coordinator.count_members() == 1
+    with pytest.raises(FileNotFoundError):
+        open(stale_member)
+    coordinator.close()
+
+
+def test_bandwidth_limiter_splits_rate_of_host(lock_path, mocker):
+    mocker.patch('app.services.clients.bandwidth_limiter.time.monotonic', return_value=100.0)
+    first = HostCoordinator(lock_path, 2)
+    second = HostCoordinator(lock_path, 2)
+    limiter = BandwidthLimiter()
+    limiter.configure(parse_rate_schedule('2K'), first)
+
+    # the process has 1K of the 2K rate of host
+    assert limiter.reserve(1024) == 1
+
+    first.close()
+    second.close()
+
+
+def test_concurrency_controller_holds_slot_of_host_during_upload(lock_path):
+    coordinator = HostCoordinator(lock_path, 1)
+    controller = ConcurrencyController(2, coordinator=coordinator)
+
+    controller.acquire()
+    assert coordinator._try_acquire() is None
+    controller.release()
+    assert coordinator._try_acquire() == 0
+
+    coordinator.close()
+
+
+def upload_with_host_slots(lock_path, active, peak, lock):
+    coordinator = HostCoordinator(lock_path, 2)
+    for _ in range(5):
+        slot = coordinator.acquire()
+        with lock:
+            active.value += 1
+            peak.value = max(peak.value, active.value)
+        time.sleep(0.02)
+        with lock:
+            active.value -= 1
+        coordinator.release(slot)
+    coordinator.close()
+
+
+def test_host_coordinator_limits_uploads_of_concurrent_processes(lock_path):
+    context = multiprocessing.get_context('fork')
+    active, peak, lock = context.Value('i', 0), context.Value('i', 0), context.Lock()
+    processes = [context.Process(target=upload_with_host_slots, args=(lock_path, active, peak, lock)) for _ in range(4)]
+    [process.start() for process in processes]
+    [process.join(10) for process in processes]
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert 1 <= peak.value <= 2
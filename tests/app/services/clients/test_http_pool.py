@@ -0,0 +1,40 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+from app.services.clients.base_client import BaseClient
+from app.services.clients.http_pool import HttpConnectionPool
+from app.services.clients.http_pool import get_http_client
+
+
+def test_get_http_client_returns_same_client_for_same_host():
+    first = get_http_client('http://minio:9000/bucket/object?part=1')
+    second = get_http_client('http://minio:9000/bucket/object?part=2')
+
+    assert first is second
+
+
+def test_get_http_client_returns_client_per_host():
+    minio_client = get_http_client('http://minio:9000/bucket/object')
+    api_client = get_http_client('http://api/portal/v1/files')
+
+    assert minio_client is not api_client
+
+
+def test_http_connection_pool_close_removes_clients():
+    client = get_http_client('http://api/portal/v1/files')
+
+    HttpConnectionPool().close()
+
+    assert client.is_closed
+    assert get_http_client('http://api/portal/v1/files') is not client
+
+
+def test_base_client_does_not_keep_request_headers(httpx_mock):
+    httpx_mock.add_response(method='GET', url='http://api/test', json={})
+    http_client = BaseClient('http://api')
+
+    http_client._get('test', headers={'Content-MD5': 'etag'})
+
+    assert httpx_mock.get_request().headers['Content-MD5'] == 'etag'
+    assert 'Content-MD5' not in http_client.headers
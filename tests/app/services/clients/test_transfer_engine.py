@@ -0,0 +1,53 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import asyncio
+
+import pytest
+
+from app.services.clients.transfer_engine import AsyncTransferEngine
+from app.services.clients.transfer_engine import TransferEngine
+from app.services.clients.transfer_engine import get_transfer_engine
+
+
+async def add(a: int, b: int) -> int:
+    await asyncio.sleep(0)
+    return a + b
+
+
+async def fail() -> None:
+    raise ValueError('failed')
+
+
+def test_async_transfer_engine_runs_submitted_coroutines():
+    engine = AsyncTransferEngine(4)
+    results = [engine.submit(add(i, 1)) for i in range(10)]
+
+    [res.wait() for res in results]
+    engine.close()
+
+    assert all(res.successful() for res in results)
+    assert [res.get() for res in results] == list(range(1, 11))
+
+
+def test_async_apply_result_keeps_the_error():
+    engine = AsyncTransferEngine(1)
+    result = engine.submit(fail())
+
+    result.wait()
+    engine.close()
+
+    assert result.ready()
+    assert not result.successful()
+    with pytest.raises(ValueError, match='failed'):
+        result.get()
+
+
+@pytest.mark.parametrize('engine, expected', [(TransferEngine.THREAD, type(None)), ('async', AsyncTransferEngine)])
+def test_get_transfer_engine(engine, expected):
+    transfer_engine = get_transfer_engine(engine, 2)
+
+    assert isinstance(transfer_engine, expected)
+    if transfer_engine:
+        transfer_engine.close()
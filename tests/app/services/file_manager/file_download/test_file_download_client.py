@@ -2,6 +2,8 @@
 #
 # Contact Indoc Systems for any questions regarding the use of this source code.
 
+import os
+
 import click
 import jwt
 import pytest
@@ -9,6 +11,7 @@ from pytest_httpx import IteratorStream
 
 from app.configs.app_config import AppConfig
 from app.models.item import ItemZone
+from app.services.clients.transfer_engine import AsyncTransferEngine
 from app.services.file_manager.file_download.download_client import SrvFileDownload
 from app.services.file_manager.file_download.model import EFileStatus
 from app.services.output_manager.error_handler import ECustomizedError
@@ -143,6 +146,54 @@ def test_file_stream_download(mocker, httpx_mock, total_size_presented):
             assert f.read() == '123'
 
 
+def test_file_stream_download_with_async_engine(mocker, httpx_mock):
+    file_url = 'http://test.com'
+    file_content = b'123'
+
+    httpx_mock.add_response(
+        url=file_url,
+        method='GET',
+        status_code=200,
+        content=file_content,
+    )
+
+    engine = AsyncTransferEngine(2)
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        download_client = SrvFileDownload(0, True, engine)
+        download_client.total_size = len(file_content)
+
+        result = engine.submit(download_client.download_file_async(file_url, 'test_file'))
+        saved_filename = result.get()
+        engine.close()
+
+        with open(saved_filename, 'r') as f:
+            assert f.read() == '123'
+
+
+def test_file_stream_download_with_async_engine_removes_file_when_failed(mocker, httpx_mock, capsys):
+    file_url = 'http://test.com'
+    httpx_mock.add_response(url=file_url, method='GET', status_code=500)
+
+    engine = AsyncTransferEngine(2)
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        download_client = SrvFileDownload(0, False, engine)
+        # the placeholder is created before the download is submitted
+        open('test_file', 'wb').close()
+
+        result = engine.submit(download_client.download_file_async(file_url, 'test_file'))
+        saved_filename = result.get()
+        engine.close()
+        download_client.finish_download(saved_filename)
+
+        assert saved_filename is None
+        assert not os.path.exists('test_file')
+
+    out, _ = capsys.readouterr()
+    assert customized_error_msg(ECustomizedError.DOWNLOAD_FAIL) in out
+
+
 @pytest.mark.parametrize(
     'total_size',
     [1, 5],
@@ -0,0 +1,81 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import os
+import sqlite3
+
+from app.services.file_manager.file_upload.chunk_hash_cache import ChunkHashCache
+
+
+def test_chunk_hash_cache_returns_recorded_etags_after_reopen(tmp_path):
+    local_file = tmp_path / 'file.txt'
+    local_file.write_text('1' * 10)
+    db_path = str(tmp_path / 'cache' / 'chunk_hash.db')
+
+    cache = ChunkHashCache(db_path)
+    key = cache.file_key(str(local_file), 2)
+    cache.put(key, 1, 'etag_1')
+    cache.put(key, 2, 'etag_2')
+    cache.close()
+
+    cache = ChunkHashCache(db_path)
+    assert cache.get(key) == {1: 'etag_1', 2: 'etag_2'}
+    assert cache.get(cache.file_key(str(local_file), 5)) == {}
+    cache.close()
+
+
+def test_chunk_hash_cache_uses_rollback_journal_for_network_filesystem(tmp_path):
+    db_path = str(tmp_path / 'chunk_hash.db')
+    # the cache created by the version with WAL
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.close()
+
+    cache = ChunkHashCache(db_path)
+    cache.get((1, 1, 1, 1, 1))
+    cache.close()
+
+    connection = sqlite3.connect(db_path)
+    assert connection.execute('PRAGMA journal_mode').fetchone() == ('delete',)
+    connection.close()
+
+
+def test_chunk_hash_cache_misses_when_file_is_modified(tmp_path):
+    local_file = tmp_path / 'file.txt'
+    local_file.write_text('1' * 10)
+    cache = ChunkHashCache(str(tmp_path / 'chunk_hash.db'))
+    key = cache.file_key(str(local_file), 2)
+    cache.put(key, 1, 'etag_1')
+
+    stat = os.stat(local_file)
+    os.utime(local_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+    assert cache.get(cache.file_key(str(local_file), 2)) == {}
+    cache.close()
+
+
+def test_chunk_hash_cache_does_nothing_when_disabled(tmp_path):
+    db_path = tmp_path / 'chunk_hash.db'
+    cache = ChunkHashCache(str(db_path), enabled=False)
+    cache.put((1, 2, 3, 4, 5), 1, 'etag_1')
+
+    assert cache.get((1, 2, 3, 4, 5)) == {}
+    assert not db_path.exists()
+
+
+def test_chunk_hash_cache_is_disabled_on_database_error(tmp_path, mocker):
+    cache = ChunkHashCache(str(tmp_path / 'chunk_hash.db'))
+    mocker.patch(
+        'app.services.file_manager.file_upload.chunk_hash_cache.sqlite3.connect',
+        side_effect=sqlite3.OperationalError('unable to open database file'),
+    )
+
+    cache.put((1, 2, 3, 4, 5), 1, 'etag_1')
+
+    assert cache.enabled is False
+    assert cache.get((1, 2, 3, 4, 5)) == {}
+
+
+def test_chunk_hash_cache_file_key_is_none_for_missing_file(tmp_path):
+    assert ChunkHashCache.file_key(str(tmp_path / 'missing.txt'), 2) is None
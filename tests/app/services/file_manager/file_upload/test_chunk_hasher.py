@@ -0,0 +1,33 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import base64
+import hashlib
+
+from app.services.file_manager.file_upload.chunk_hasher import ChunkHasher
+from app.services.file_manager.file_upload.chunk_hasher import calculate_etag
+
+
+def test_calculate_etag_returns_base64_md5():
+    chunk = b'test chunk'
+
+    assert calculate_etag(chunk) == base64.b64encode(hashlib.md5(chunk).digest()).decode('utf-8')
+
+
+def test_chunk_hasher_calculates_chunks_in_background():
+    hasher = ChunkHasher(2)
+    chunks = [str(i).encode() * 1024 for i in range(10)]
+
+    futures = [hasher.submit(chunk) for chunk in chunks]
+
+    assert [f.result() for f in futures] == [calculate_etag(chunk) for chunk in chunks]
+    hasher.shutdown()
+
+
+def test_chunk_hasher_restarts_after_shutdown():
+    hasher = ChunkHasher(1)
+    hasher.shutdown()
+
+    assert hasher.submit(b'1').result() == calculate_etag(b'1')
+    hasher.shutdown()
@@ -0,0 +1,161 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import asyncio
+import threading
+
+import pytest
+
+from app.services.file_manager.file_upload.chunk_hedger import ChunkHedger
+from app.services.file_manager.file_upload.chunk_hedger import LatencyTracker
+from app.services.file_manager.file_upload.chunk_hedger import stream_until_cancelled
+from app.services.file_manager.file_upload.exception import CHUNK_REQUEST_CANCELLED
+
+
+@pytest.fixture(autouse=True)
+def min_delay(mocker):
+    mocker.patch('app.configs.app_config.AppConfig.Env.chunk_hedge_min_delay', 0.01)
+
+
+def warm_up(tracker, seconds=0.01, count=20):
+    for _ in range(count):
+        tracker.observe(1, seconds)
+
+
+def test_latency_tracker_has_no_delay_before_enough_samples():
+    tracker = LatencyTracker(percentile=95, window=100, min_samples=3)
+    tracker.observe(10, 1)
+    tracker.observe(10, 1)
+
+    assert tracker.hedge_delay(10) is None
+
+
+def test_latency_tracker_delay_is_percentile_of_latency_per_byte():
+    tracker = LatencyTracker(percentile=90, window=100, min_samples=10)
+    for seconds in range(1, 11):
+        tracker.observe(100, seconds)
+
+    # the 90th percentile is 9 seconds per 100 bytes
+    assert tracker.hedge_delay(200) == pytest.approx(18)
+    assert tracker.hedge_delay(0) == 0.01
+
+
+def test_chunk_hedger_does_not_hedge_fast_request():
+    hedger = ChunkHedger(2)
+    warm_up(hedger.tracker, seconds=1)
+    calls = []
+
+    assert hedger.call(lambda cancelled: calls.append(1) or 'done', 1) == 'done'
+    assert calls == [1]
+    assert hedger.hedged == 0
+    hedger.shutdown()
+
+
+def test_chunk_hedger_takes_duplicate_and_cancels_slow_request():
+    hedger = ChunkHedger(1)
+    warm_up(hedger.tracker)
+    calls, cancelled_calls = [], []
+
+    def request(cancelled):
+        calls.append(threading.current_thread())
+        if len(calls) == 1:
+            # the first request is on the calling thread, it stops once cancelled
+            if cancelled.wait(5):
+                cancelled_calls.append(1)
+                raise CHUNK_REQUEST_CANCELLED()
+            return 'first'
+        return 'second'
+
+    assert hedger.call(request, 1) == 'second'
+    assert hedger.hedged == 1
+    assert calls[0] is threading.current_thread()
+    assert cancelled_calls == [1]
+    hedger.shutdown()
+
+
+def test_chunk_hedger_cancels_duplicate_when_first_request_finished():
+    hedger = ChunkHedger(1)
+    warm_up(hedger.tracker)
+    duplicate_started, duplicate_cancelled = threading.Event(), threading.Event()
+
+    def request(cancelled):
+        if threading.current_thread().name.startswith('chunk-hedger'):
+            duplicate_started.set()
+            if cancelled.wait(5):
+                duplicate_cancelled.set()
+                raise CHUNK_REQUEST_CANCELLED()
+            return 'second'
+        duplicate_started.wait(5)
+        return 'first'
+
+    assert hedger.call(request, 1) == 'first'
+    assert duplicate_cancelled.wait(5)
+    hedger.shutdown()
+
+
+def test_stream_until_cancelled_stops_at_next_block(mocker):
+    mocker.patch('app.configs.app_config.AppConfig.Env.chunk_hedge_block_size', 2)
+    cancelled = threading.Event()
+    blocks = stream_until_cancelled(b'123456', cancelled)
+
+    assert bytes(next(blocks)) == b'12'
+    cancelled.set()
+    with pytest.raises(CHUNK_REQUEST_CANCELLED):
+        next(blocks)
+
+
+def test_chunk_hedger_waits_other_request_when_one_failed():
+    hedger = ChunkHedger(2)
+    warm_up(hedger.tracker)
+    calls = []
+
+    def request(cancelled):
+        calls.append(len(calls))
+        if calls[-1] == 0:
+            threading.Event().wait(0.1)
+            raise ValueError('failed')
+        threading.Event().wait(0.2)
+        return 'second'
+
+    assert hedger.call(request, 1) == 'second'
+    hedger.shutdown()
+
+
+def test_chunk_hedger_raises_when_all_requests_failed():
+    hedger = ChunkHedger(2)
+    warm_up(hedger.tracker)
+
+    def request(cancelled):
+        threading.Event().wait(0.05)
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        hedger.call(request, 1)
+    hedger.shutdown()
+
+
+def test_chunk_hedger_cancels_slow_request_with_async_engine():
+    hedger = ChunkHedger(1)
+    warm_up(hedger.tracker)
+    calls, cancelled = [], []
+
+    async def request():
+        calls.append(len(calls))
+        if calls[-1] == 0:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return 'first'
+        return 'second'
+
+    async def upload():
+        result = await hedger.call_async(request, 1)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(upload()) == 'second'
+    assert cancelled == [True]
+    hedger.shutdown()
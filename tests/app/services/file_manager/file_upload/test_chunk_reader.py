@@ -0,0 +1,41 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import os
+
+import click
+
+from app.services.file_manager.file_upload.chunk_reader import ChunkReader
+from app.services.file_manager.file_upload.chunk_reader import release_page_cache
+
+
+def test_chunk_reader_reads_chunks_by_offset():
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open('test.txt', 'wb') as f:
+            f.write(b'0123456789')
+
+        with ChunkReader('test.txt') as reader:
+            assert reader.read(4, 4) == b'4567'
+            assert reader.read(0, 4) == b'0123'
+            assert reader.read(8, 4) == b'89'
+            assert reader.read(12, 4) == b''
+
+
+def test_chunk_reader_joins_short_reads(mocker):
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open('test.txt', 'wb') as f:
+            f.write(b'0123456789')
+
+        with ChunkReader('test.txt') as reader:
+            pread = os.pread
+            mocker.patch('os.pread', side_effect=lambda fd, n, pos: pread(fd, min(n, 3), pos))
+            assert reader.read(1, 8) == b'12345678'
+
+
+def test_release_page_cache_ignores_missing_file():
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        release_page_cache('not_exist.txt', 0, 10)
@@ -0,0 +1,70 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+
+import httpx
+import pytest
+
+from app.configs.app_config import AppConfig
+from app.services.clients.exception import REQUEST_NOT_SENT
+from app.services.file_manager.file_upload.chunk_retry import RetryScheduler
+from app.services.file_manager.file_upload.chunk_retry import get_retry_delay
+from app.services.file_manager.file_upload.chunk_retry import is_retryable
+from tests.conftest import create_status_error
+
+
+@pytest.mark.parametrize('status_code, expected', [(502, True), (403, False), (400, False), (404, False)])
+def test_is_retryable_checks_status_code(status_code, expected):
+    assert is_retryable(create_status_error(status_code)) is expected
+
+
+def test_is_retryable_only_with_expired_presigned_url_of_forbidden():
+    assert is_retryable(create_status_error(403, text='<Message>Request has expired</Message>'))
+    # the presign endpoint denies the permission
+    assert not is_retryable(create_status_error(403, method='GET', text='Permission denied, expired session'))
+
+
+def test_is_retryable_with_network_error():
+    assert is_retryable(httpx.ConnectError('connection reset'))
+    assert is_retryable(REQUEST_NOT_SENT('Unable to query data with url'))
+    assert is_retryable(ConnectionResetError())
+    assert not is_retryable(Exception('unexpected error'))
+    assert not is_retryable(FileNotFoundError('local file is removed'))
+    assert not is_retryable(PermissionError('local file is not readable'))
+    assert not is_retryable(ValueError('invalid value'))
+
+
+def test_get_retry_delay_grows_exponentially_within_cap(monkeypatch):
+    monkeypatch.setattr(AppConfig.Env, 'chunk_retry_backoff', 1)
+    monkeypatch.setattr(AppConfig.Env, 'chunk_retry_max_backoff', 8)
+
+    assert 0.5 <= get_retry_delay(1) <= 1
+    assert 2 <= get_retry_delay(3) <= 4
+    assert 4 <= get_retry_delay(10) <= 8
+
+
+def test_retry_scheduler_runs_retries_in_order_of_delay():
+    scheduler = RetryScheduler()
+    called = []
+    done = threading.Event()
+
+    scheduler.schedule(0.2, lambda: (called.append('late'), done.set()))
+    scheduler.schedule(0.01, lambda: called.append('early'))
+
+    assert done.wait(5)
+    assert called == ['early', 'late']
+    scheduler.shutdown()
+
+
+def test_retry_scheduler_drops_retries_after_shutdown():
+    scheduler = RetryScheduler()
+    called = []
+
+    scheduler.schedule(0.1, lambda: called.append('retry'))
+    scheduler.shutdown()
+
+    scheduler._thread.join(1)
+    assert not scheduler._thread.is_alive()
+    assert called == []
@@ -0,0 +1,96 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+
+import click
+import pytest
+
+from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.concurrency_controller import ConcurrencyController
+from app.services.file_manager.file_upload.concurrency_controller import ThreadCountType
+from tests.conftest import create_status_error
+
+
+def complete_round(controller: ConcurrencyController, size: int, seconds: float) -> None:
+    for _ in range(controller.limit):
+        controller.on_success(size, seconds)
+
+
+def test_controller_with_fixed_thread_never_changes_limit():
+    controller = ConcurrencyController.from_thread_option(4)
+
+    complete_round(controller, 100, 0.1)
+    controller.on_error(create_status_error(503))
+
+    assert controller.adaptive is False
+    assert controller.limit == 4
+
+
+def test_controller_increases_limit_while_throughput_kept(mocker):
+    monotonic_mock = mocker.patch(
+        'app.services.file_manager.file_upload.concurrency_controller.time.monotonic', return_value=0
+    )
+    controller = ConcurrencyController.from_thread_option('auto')
+    assert controller.limit == AppConfig.Env.auto_thread_min
+
+    # each round takes one second, so the throughput grows with the limit
+    monotonic_mock.return_value = 1
+    complete_round(controller, 100, 0.1)
+    monotonic_mock.return_value = 2
+    complete_round(controller, 100, 0.1)
+
+    assert controller.limit == AppConfig.Env.auto_thread_min + 2
+
+
+def test_controller_holds_limit_when_latency_grows(mocker):
+    monotonic_mock = mocker.patch(
+        'app.services.file_manager.file_upload.concurrency_controller.time.monotonic', return_value=0
+    )
+    controller = ConcurrencyController(2, 10)
+    monotonic_mock.return_value = 1
+    complete_round(controller, 100, 0.1)
+    limit = controller.limit
+
+    monotonic_mock.return_value = 2
+    complete_round(controller, 100, 1)
+
+    assert controller.limit == limit
+
+
+def test_controller_halves_limit_once_per_round_on_congestion():
+    controller = ConcurrencyController(2, 32)
+    controller.limit = 16
+
+    controller.on_error(create_status_error(503))
+    controller.on_error(create_status_error(503))
+    assert controller.limit == 8
+
+    controller.on_error(create_status_error(400))
+    assert controller.limit == 8
+
+
+def test_controller_acquire_blocks_over_limit():
+    controller = ConcurrencyController(1)
+    controller.acquire()
+    acquired = threading.Event()
+
+    thread = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    controller.release()
+    assert acquired.wait(5)
+    thread.join()
+
+
+@pytest.mark.parametrize('value, expected', [('auto', 'auto'), ('4', 4), (2, 2)])
+def test_thread_count_type_converts_value(value, expected):
+    assert ThreadCountType().convert(value, None, None) == expected
+
+
+@pytest.mark.parametrize('value', ['0', 'many'])
+def test_thread_count_type_rejects_invalid_value(value):
+    with pytest.raises(click.BadParameter):
+        ThreadCountType().convert(value, None, None)
@@ -2,15 +2,24 @@
 #
 # Contact Indoc Systems for any questions regarding the use of this source code.
 
+import json
+
+import pytest
+
 from app.configs.app_config import AppConfig
 from app.models.item import ItemType
 from app.services.file_manager.file_upload.file_upload import assemble_path
+from app.services.file_manager.file_upload.file_upload import resolve_target_folder
 from app.services.file_manager.file_upload.file_upload import resume_upload
 from app.services.file_manager.file_upload.file_upload import simple_upload
+from app.services.file_manager.file_upload.models import ChunkInfo
+from app.services.file_manager.file_upload.models import ChunkState
 from app.services.file_manager.file_upload.models import FileObject
 from app.services.file_manager.file_upload.models import ItemStatus
+from app.services.file_manager.file_upload.upload_journal import UploadJournal
 from app.services.output_manager.error_handler import ECustomizedError
 from app.services.output_manager.error_handler import customized_error_msg
+from app.services.user_authentication.token_refresh_scheduler import TokenRefreshScheduler
 
 
 def test_assemble_path_at_name_folder(mocker):
@@ -46,47 +55,33 @@ def test_assemble_path_at_exsting_folder(mocker):
     target_folder = 'admin/test_folder_exist'
     project_code = 'test_project'
     zone = 0
+    prefix = ItemType.NAMEFOLDER.get_prefix_by_type()
 
-    node_list = [
-        {
-            'result': {
-                'id': 'test',
-                'parent_id': 'test_parent',
-                'parent_path': '',
-                'name': ItemType.NAMEFOLDER.get_prefix_by_type().strip('/'),
-                'zone': 0,
-                'type': 'folder',
-            }
-        },
-        {
-            'result': {
-                'id': 'test',
-                'parent_id': 'test_parent',
-                'parent_path': ItemType.NAMEFOLDER.get_prefix_by_type(),
-                'name': 'admin',
-                'zone': 0,
-                'type': 'folder',
-            }
-        },
-        {
+    check_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.check_item_duplication',
+        return_value=[f'{prefix}admin/test_folder_exist'],
+    )
+    search_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.search_item',
+        return_value={
             'result': {
                 'id': 'test',
                 'parent_id': 'test_parent',
-                'parent_path': ItemType.NAMEFOLDER.get_prefix_by_type() + 'admin',
+                'parent_path': prefix + 'admin',
                 'name': 'test_folder_exist',
                 'zone': 0,
                 'type': 'folder',
             }
         },
-    ]
-
-    mocker.patch('app.services.file_manager.file_upload.file_upload.search_item', side_effect=node_list)
+    )
     current_file_path, parent_folder, create_folder_flag, _ = assemble_path(
         local_file_path, target_folder, project_code, ItemType.NAMEFOLDER, zone
     )
-    assert current_file_path == f'{ItemType.NAMEFOLDER.get_prefix_by_type()}admin/test_folder_exist/file.txt'
+    assert current_file_path == f'{prefix}admin/test_folder_exist/file.txt'
     assert parent_folder.get('name') == 'test_folder_exist'
     assert create_folder_flag is False
+    check_mock.assert_called_once_with([f'{prefix}admin/test_folder_exist'], 0, project_code)
+    search_mock.assert_called_once_with(project_code, zone, f'{prefix}admin/test_folder_exist')
 
 
 def test_assemble_path_at_non_existing_folder(mocker):
@@ -94,40 +89,86 @@ def test_assemble_path_at_non_existing_folder(mocker):
     target_folder = 'admin/test_folder_not_exist'
     project_code = 'test_project'
     zone = 0
+    prefix = ItemType.NAMEFOLDER.get_prefix_by_type()
 
-    node_list = [
-        {
-            'result': {
-                'id': 'test',
-                'parent_id': 'test_parent',
-                'parent_path': '',
-                'name': ItemType.NAMEFOLDER.get_prefix_by_type().strip('/'),
-                'zone': 0,
-                'type': 'folder',
-            }
-        },
-        {
+    mocker.patch('app.services.file_manager.file_upload.file_upload.check_item_duplication', return_value=[])
+    search_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.search_item',
+        return_value={
             'result': {
                 'id': 'test',
                 'parent_id': 'test_parent',
-                'parent_path': ItemType.NAMEFOLDER.get_prefix_by_type(),
+                'parent_path': prefix,
                 'name': 'admin',
                 'zone': 0,
                 'type': 'folder',
             }
         },
-        {'result': {}},
-    ]
-
-    mocker.patch('app.services.file_manager.file_upload.file_upload.search_item', side_effect=node_list)
+    )
     mocker.patch('app.services.file_manager.file_upload.file_upload.click.confirm', return_value=None)
 
     current_file_path, parent_folder, create_folder_flag, _ = assemble_path(
         local_file_path, target_folder, project_code, ItemType.NAMEFOLDER, zone
     )
-    assert current_file_path == f'{ItemType.NAMEFOLDER.get_prefix_by_type()}admin/test_folder_not_exist'
+    assert current_file_path == f'{prefix}admin/test_folder_not_exist'
     assert parent_folder.get('name') == 'admin'
     assert create_folder_flag is True
+    search_mock.assert_called_once_with(project_code, zone, f'{prefix}admin')
+
+
+def test_assemble_path_checks_nested_folders_in_one_request(mocker):
+    local_file_path = './test/file.txt'
+    target_folder = 'admin/a/b/c'
+    project_code = 'test_project'
+    prefix = ItemType.NAMEFOLDER.get_prefix_by_type()
+
+    check_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.check_item_duplication',
+        # the existing folders are matched case insensitively
+        return_value=[f'{prefix}admin/a', f'{prefix}admin/A/B'],
+    )
+    search_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.search_item',
+        return_value={'result': {'id': 'test', 'name': 'b', 'type': 'folder'}},
+    )
+    mocker.patch('app.services.file_manager.file_upload.file_upload.click.confirm', return_value=None)
+
+    current_file_path, parent_folder, create_folder_flag, _ = assemble_path(
+        local_file_path, target_folder, project_code, ItemType.NAMEFOLDER, AppConfig.Env.core_zone
+    )
+    assert current_file_path == f'{prefix}admin/a/b/c'
+    assert parent_folder.get('name') == 'b'
+    assert create_folder_flag is True
+    check_mock.assert_called_once_with(
+        [f'{prefix}admin/a', f'{prefix}admin/a/b', f'{prefix}admin/a/b/c'], 1, project_code
+    )
+    search_mock.assert_called_once_with(project_code, AppConfig.Env.core_zone, f'{prefix}admin/A/B')
+
+
+def test_assemble_path_reuses_resolved_target_folder_for_inputs(mocker):
+    target_folder = 'admin/new'
+    project_code = 'test_project'
+    prefix = ItemType.NAMEFOLDER.get_prefix_by_type()
+
+    check_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.check_item_duplication', return_value=[]
+    )
+    search_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.search_item', return_value={'result': {'id': 'test'}}
+    )
+    confirm_mock = mocker.patch('app.services.file_manager.file_upload.file_upload.click.confirm', return_value=None)
+
+    resolved_target = resolve_target_folder(target_folder, project_code, ItemType.NAMEFOLDER, 0)
+    results = [
+        assemble_path(f, target_folder, project_code, ItemType.NAMEFOLDER, 0, resolved_target)
+        for f in ('./a.txt', './folder_b')
+    ]
+
+    # the user is asked once, and all the inputs create from the same folder
+    confirm_mock.assert_called_once()
+    check_mock.assert_called_once()
+    search_mock.assert_called_once()
+    assert [result[:3] for result in results] == [(f'{prefix}admin/new', {'id': 'test'}, True)] * 2
 
 
 def test_assemble_path_at_project_folder(mocker):
@@ -177,8 +218,8 @@ def test_file_upload_skip_empty_file(mocker, tmp_path, capfd):
 
         expect = (
             f'Starting upload of: {file_name}\n'
-            + 'Skip the file with 0 size: test\n'
             + 'Checking for file duplication...\n'
+            + 'Skip the file with 0 size: test\n'
             + '\nAll files already exist in the upload destination.\n\n'
             + customized_error_msg(ECustomizedError.UPLOAD_CANCEL)
             + '\n'
@@ -251,15 +292,21 @@ def test_folder_merge_succuss_with_no_duplication(mocker, mock_upload_client):
     mocker.patch('os.path.isdir', return_value=False)
     mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
 
-    non_dup_list = [FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')]
-    mocker.patch(
+    check_mock = mocker.patch(
         'app.services.file_manager.file_upload.file_upload.UploadClient.check_upload_duplication',
-        return_value=(non_dup_list, []),
+        side_effect=lambda file_objects: (file_objects, []),
+    )
+    mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.pre_upload',
+        side_effect=lambda file_objects, output_path, target: [
+            FileObject(x.object_path, x.local_path, 'resumable_id', 'job_id', 'item_id') for x in file_objects
+        ],
     )
 
     item_ids = simple_upload(upload_event)
-    assert len(item_ids) == 1
-    assert item_ids[0] == non_dup_list[0].item_id
+    assert item_ids == ['item_id']
+    # the files are not checked again after the confirmation
+    check_mock.assert_called_once()
 
 
 def test_folder_merge_succuss_with_duplication(mocker, mock_upload_client):
@@ -275,17 +322,26 @@ def test_folder_merge_succuss_with_duplication(mocker, mock_upload_client):
     mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
     click_yes_mock = mocker.patch('app.services.file_manager.file_upload.file_upload.click.confirm', return_value=None)
 
-    non_dup_list = [FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')]
-    dup_list = ['object/dup']
-    mocker.patch(
+    upload_events = [upload_event, dict(upload_event, file='DUP')]
+    check_mock = mocker.patch(
         'app.services.file_manager.file_upload.file_upload.UploadClient.check_upload_duplication',
-        return_value=(non_dup_list, dup_list),
+        side_effect=lambda file_objects: (
+            [x for x in file_objects if x.object_path != 'DUP'],
+            [x.object_path.lower() for x in file_objects if x.object_path == 'DUP'],
+        ),
+    )
+    pre_upload_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.pre_upload',
+        side_effect=lambda file_objects, output_path, target: file_objects,
     )
 
-    item_ids = simple_upload(upload_event)
+    item_ids = simple_upload(upload_events)
     assert len(item_ids) == 1
-    assert item_ids[0] == non_dup_list[0].item_id
     assert click_yes_mock.call_count == 1
+    check_mock.assert_called_once()
+    # the duplicated file is skipped with the case insensitive path
+    registered = [x.object_path for call in pre_upload_mock.call_args_list for x in call.args[0]]
+    assert registered == [file_name]
 
 
 def test_folder_merge_skip_with_all_duplication(mocker, mock_upload_client, capfd):
@@ -326,6 +382,90 @@ def test_folder_merge_skip_with_all_duplication(mocker, mock_upload_client, capf
         AssertionError('SystemExit not raised')
 
 
+def test_multiple_inputs_share_one_upload_pipeline(mocker, mock_upload_client):
+    upload_events = [
+        {
+            'file': 'file_a',
+            'project_code': 'test_project',
+            'zone': 'greenroom',
+            'target_folder': 'admin',
+            'current_folder_node': 'admin',
+            'parent_folder_id': 'parent_a',
+            'create_folder_flag': False,
+        },
+        {
+            'file': 'folder_b/file_b',
+            'project_code': 'test_project',
+            'zone': 'greenroom',
+            'target_folder': 'admin/new',
+            'current_folder_node': 'admin/new',
+            'parent_folder_id': 'parent_b',
+            'create_folder_flag': True,
+        },
+    ]
+
+    mocker.patch('os.path.isdir', return_value=False)
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    check_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.check_upload_duplication',
+        side_effect=lambda file_objects: (file_objects, []),
+    )
+    pre_upload_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.pre_upload',
+        side_effect=lambda file_objects, output_path, target: file_objects,
+    )
+    pool_mock = mocker.patch('app.services.file_manager.file_upload.file_upload.ThreadPool')
+
+    item_ids = simple_upload(upload_events)
+
+    assert len(item_ids) == 2
+    pool_mock.assert_called_once()
+    # only the input without new folder is checked for duplication
+    checked = [x.object_path for call in check_mock.call_args_list for x in call.args[0]]
+    assert set(checked) == {'admin/file_a'}
+    targets = {call.kwargs['target'].parent_folder_id: call.args[0] for call in pre_upload_mock.call_args_list}
+    assert [x.object_path for x in targets['parent_a']] == ['admin/file_a']
+    assert [x.object_path for x in targets['parent_b']] == ['admin/new/file_b']
+
+
+def test_simple_upload_does_not_keep_token_refresh_when_setup_failed(mocker, mock_upload_client):
+    upload_event = {'file': 'test', 'project_code': 'test_project', 'zone': 'greenroom', 'create_folder_flag': True}
+    mocker.patch('os.path.isdir', return_value=False)
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.output_manifest',
+        side_effect=OSError('disk full'),
+    )
+
+    with pytest.raises(OSError):
+        simple_upload(upload_event, output_path='manifest.json')
+
+    assert TokenRefreshScheduler()._subscribers == 0
+
+
+def test_resume_upload_stops_background_threads_when_interrupted(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    test_obj = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
+    manifest_json = {
+        'project_code': 'project_code',
+        'zone': AppConfig.Env.green_zone,
+        'file_objects': {test_obj.item_id: test_obj.to_dict()},
+    }
+    mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.get_file_info_by_geid', side_effect=KeyboardInterrupt()
+    )
+    set_finish_upload_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.set_finish_upload'
+    )
+    pool_close_mock = mocker.patch('app.services.file_manager.file_upload.file_upload.ThreadPool.close')
+
+    with pytest.raises(KeyboardInterrupt):
+        resume_upload(manifest_json, 1)
+
+    set_finish_upload_mock.assert_called_once()
+    pool_close_mock.assert_called_once()
+
+
 def test_resume_upload(mocker):
     mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
     test_obj = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
@@ -354,3 +494,97 @@ def test_resume_upload(mocker):
 
     get_mock.assert_called_once()
     resume_upload_mock.assert_called_once()
+
+
+def test_resume_upload_with_journaled_manifest_skips_server_chunk_check(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    unfinished_obj = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
+    unfinished_obj.uploaded_chunks = {'1': {'etag': 'etag', 'chunk_size': 1}}
+    finalised_info = FileObject('object/done', 'local_done', 'resumable_id', 'job_id', 'done_id').to_dict()
+    finalised_info['finalised'] = True
+
+    manifest_json = {
+        'project_code': 'project_code',
+        'zone': AppConfig.Env.green_zone,
+        'file_objects': {'item_id': dict(unfinished_obj.to_dict(), journaled=True), 'done_id': finalised_info},
+    }
+
+    get_return = unfinished_obj.to_dict()
+    get_return.update({'status': ItemStatus.REGISTERED, 'id': 'item_id'})
+    get_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.get_file_info_by_geid', return_value=[{'result': get_return}]
+    )
+    resume_upload_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.resume_upload', return_value=[]
+    )
+    stream_upload_mock = mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.stream_upload', return_value=[]
+    )
+
+    resume_upload(manifest_json, 1)
+
+    get_mock.assert_called_once_with(['item_id'])
+    resume_upload_mock.assert_not_called()
+    resumed_obj = stream_upload_mock.call_args[0][0]
+    assert resumed_obj.uploaded_chunks.get(1) == ChunkInfo('etag', 1)
+
+
+def test_resume_upload_journals_server_chunks_of_legacy_manifest(mocker, tmp_path):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    test_obj = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
+    manifest_json = {
+        'project_code': 'project_code',
+        'zone': AppConfig.Env.green_zone,
+        'file_objects': {test_obj.item_id: test_obj.to_dict()},
+    }
+
+    get_return = test_obj.to_dict()
+    get_return.update({'status': ItemStatus.REGISTERED, 'id': 'item_id'})
+    mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.get_file_info_by_geid', return_value=[{'result': get_return}]
+    )
+
+    def resume_server_chunks(file_objects):
+        for file_object in file_objects:
+            file_object.uploaded_chunks = {'1': {'etag': 'etag', 'chunk_size': 1}}
+        return file_objects
+
+    mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.UploadClient.resume_upload',
+        side_effect=resume_server_chunks,
+    )
+    mocker.patch('app.services.file_manager.file_upload.file_upload.UploadClient.stream_upload', return_value=None)
+    output_path = str(tmp_path / 'manifest.json')
+    with open(output_path, 'w') as f:
+        json.dump(manifest_json, f)
+
+    resume_upload(manifest_json, 1, output_path=output_path)
+
+    # the next resume trusts the journal, so it has the chunks from the server
+    file_info = UploadJournal.load(output_path)['file_objects']['item_id']
+    assert file_info['journaled'] is True
+    assert ChunkState.from_json(file_info['uploaded_chunks']).get(1) == ChunkInfo('etag', 1)
+
+
+def test_resume_upload_checks_legacy_files_again_when_interrupted_before_check(mocker, tmp_path):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    test_obj = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
+    manifest_json = {
+        'project_code': 'project_code',
+        'zone': AppConfig.Env.green_zone,
+        'file_objects': {test_obj.item_id: test_obj.to_dict()},
+    }
+    mocker.patch(
+        'app.services.file_manager.file_upload.file_upload.get_file_info_by_geid', side_effect=KeyboardInterrupt()
+    )
+    output_path = str(tmp_path / 'manifest.json')
+    with open(output_path, 'w') as f:
+        json.dump(manifest_json, f)
+
+    with pytest.raises(KeyboardInterrupt):
+        resume_upload(manifest_json, 1, output_path=output_path)
+
+    # the chunks of file are not checked, so the next resume asks the server
+    manifest = UploadJournal.load(output_path)
+    assert not manifest.get('journaled')
+    assert not manifest['file_objects']['item_id'].get('journaled')
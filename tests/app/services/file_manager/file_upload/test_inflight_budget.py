@@ -0,0 +1,40 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+import time
+
+from app.services.file_manager.file_upload.inflight_budget import InflightBudget
+
+
+def test_inflight_budget_blocks_until_released():
+    budget = InflightBudget(10)
+    budget.acquire(6)
+
+    acquired = threading.Event()
+
+    def acquire_next():
+        budget.acquire(6)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire_next)
+    thread.start()
+    time.sleep(0.1)
+    assert not acquired.is_set()
+
+    budget.release(6)
+    thread.join(timeout=5)
+
+    assert acquired.is_set()
+    assert budget.inflight_size == 6
+
+
+def test_inflight_budget_allows_oversized_chunk_when_empty():
+    budget = InflightBudget(10)
+    budget.acquire(20)
+
+    assert budget.inflight_size == 20
+
+    budget.release(20)
+    assert budget.inflight_size == 0
@@ -2,35 +2,103 @@
 #
 # Contact Indoc Systems for any questions regarding the use of this source code.
 
+import base64
+import hashlib
+import json
+
 from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.models import ChunkInfo
+from app.services.file_manager.file_upload.models import ChunkState
 from app.services.file_manager.file_upload.models import FileObject
+from app.services.file_manager.file_upload.part_planner import PartPlanner
 
 
-def test_file_upload_model_update_progress_bar(mocker):
+def test_file_upload_model_update_progress(mocker):
     mocker.patch('app.services.file_manager.file_upload.models.getsize', return_value=100)
+    update_mock = mocker.patch('app.services.output_manager.progress_renderer.ProgressRenderer.update')
 
-    file_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    file_obj = FileObject('folder/test', 'test', 'test', 'test', 'test')
     file_obj.update_progress(1)
 
-    assert file_obj.progress_bar is not None
-    assert file_obj.progress_bar.n == 1
+    update_mock.assert_called_once_with('folder/test', 1, 'test', 100)
 
 
-def test_file_upload_model_close_progress_bar(mocker):
+def test_file_upload_model_close_progress(mocker):
     mocker.patch('app.services.file_manager.file_upload.models.getsize', return_value=100)
+    finish_mock = mocker.patch('app.services.output_manager.progress_renderer.ProgressRenderer.finish_file')
 
-    file_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    file_obj = FileObject('folder/test', 'test', 'test', 'test', 'test')
     file_obj.close_progress()
 
-    assert file_obj.progress_bar is None
+    finish_mock.assert_called_once_with('folder/test')
 
 
 def test_file_upload_model_generate_meta(mocker):
-    AppConfig.Env.chunk_size = 10
     mocker.patch('app.services.file_manager.file_upload.models.getsize', return_value=100)
 
-    file_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    file_obj = FileObject('test', 'test', 'test', 'test', 'test', chunk_size=10)
     total_size, total_chunks = file_obj.generate_meta('test')
 
     assert total_size == 100
     assert total_chunks == (100 / 10)
+
+
+def test_file_upload_model_generate_meta_with_part_planner(mocker):
+    total_size = 300 * 1024 * 1024 * 1024
+    mocker.patch('app.services.file_manager.file_upload.models.getsize', return_value=total_size)
+
+    file_obj = FileObject('test', 'test', 'test', 'test', 'test', part_planner=PartPlanner(4))
+
+    assert file_obj.chunk_size > AppConfig.Env.chunk_size
+    assert file_obj.total_chunks <= AppConfig.Env.max_chunk_number
+    assert file_obj.to_dict()['chunk_size'] == file_obj.chunk_size
+
+
+def test_chunk_state_keeps_md5_etags_and_other_etags():
+    md5_etag = base64.b64encode(hashlib.md5(b'chunk').digest()).decode()
+    state = ChunkState()
+    state.set(3, md5_etag, 10)
+    state.set(10, 'not-md5', None)
+    state.set(3, md5_etag, 10)
+
+    assert len(state) == 2
+    assert state.get(1) is None
+    assert state.get(11) is None
+    assert state.get(3) == ChunkInfo(md5_etag, 10)
+    assert state.get(10) == ChunkInfo('not-md5', None)
+
+
+def test_chunk_state_json_round_trip_does_not_expand_chunks():
+    etags = [base64.b64encode(hashlib.md5(str(i).encode()).digest()).decode() for i in range(100)]
+    state = ChunkState()
+    for i, etag in enumerate(etags):
+        state.set(i + 1, etag, 5)
+    state.set(101, 'etag', 1)
+
+    value = json.loads(json.dumps(state.to_json()))
+    assert set(value) == {'bitmap', 'etags', 'sizes', 'other_etags'}
+
+    loaded = ChunkState.from_json(value)
+    assert len(loaded) == 101
+    assert [loaded.get(i + 1) for i in range(100)] == [ChunkInfo(etag, 5) for etag in etags]
+    assert loaded.get(101) == ChunkInfo('etag', 1)
+
+
+def test_chunk_state_reads_dict_per_chunk():
+    state = ChunkState.from_json({'1': {'etag': 'etag', 'chunk_size': 2}, '2': {'etag': None}})
+
+    assert len(state) == 1
+    assert state.get(1) == ChunkInfo('etag', 2)
+    assert ChunkState.from_json(state) is state
+
+
+def test_file_upload_model_sets_uploaded_chunks_from_manifest(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.getsize', return_value=100)
+
+    file_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    file_obj.uploaded_chunks = {'1': {'etag': 'etag', 'chunk_size': 2}}
+    restored = FileObject('test', 'test', 'test', 'test', 'test')
+    restored.uploaded_chunks = json.loads(json.dumps(file_obj.to_dict()))['uploaded_chunks']
+
+    assert restored.uploaded_chunks.get(1) == ChunkInfo('etag', 2)
+    assert not hasattr(restored, '__dict__')
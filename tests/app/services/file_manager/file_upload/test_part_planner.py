@@ -0,0 +1,64 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import math
+
+from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.part_planner import MB
+from app.services.file_manager.file_upload.part_planner import PartPlanner
+
+
+def test_part_planner_uses_file_size_for_small_file():
+    planner = PartPlanner()
+
+    assert planner.plan(1024) == 1024
+
+
+def test_part_planner_uses_default_chunk_size_for_large_file():
+    planner = PartPlanner(default_chunk_size=20 * MB)
+
+    assert planner.plan(1024 * MB) == 20 * MB
+
+
+def test_part_planner_spreads_file_over_workers():
+    planner = PartPlanner(4, max_inflight_size=1024 * MB, default_chunk_size=20 * MB)
+
+    assert planner.plan(40 * MB) == 10 * MB
+
+
+def test_part_planner_keeps_minimum_chunk_size():
+    planner = PartPlanner(8, max_inflight_size=1024 * MB, default_chunk_size=20 * MB)
+
+    assert planner.plan(16 * MB) == AppConfig.Env.min_chunk_size
+
+
+def test_part_planner_fits_chunks_in_inflight_budget():
+    planner = PartPlanner(10, max_inflight_size=100 * MB, default_chunk_size=20 * MB)
+
+    assert planner.plan(1024 * MB) == 10 * MB
+
+
+def test_part_planner_respects_maximum_chunk_number():
+    total_size = 500 * 1024 * MB
+    planner = PartPlanner(4, default_chunk_size=20 * MB)
+
+    chunk_size = planner.plan(total_size)
+
+    assert math.ceil(total_size / chunk_size) <= AppConfig.Env.max_chunk_number
+    assert chunk_size % MB == 0
+
+
+def test_part_planner_follows_observed_throughput():
+    planner = PartPlanner(1, max_inflight_size=1024 * MB, default_chunk_size=20 * MB)
+    planner.observe(8 * MB, 1)
+
+    assert planner.plan(1024 * MB) == 8 * MB * AppConfig.Env.chunk_target_seconds
+
+
+def test_part_planner_smooths_throughput():
+    planner = PartPlanner()
+    planner.observe(100, 1)
+    planner.observe(200, 1)
+
+    assert planner.throughput == 100 + AppConfig.Env.throughput_smoothing * 100
@@ -0,0 +1,96 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload.models import FileObject
+from app.services.file_manager.file_upload.presign_prefetcher import PresignPrefetcher
+from app.services.file_manager.file_upload.presign_prefetcher import get_presigned_url_expiry
+
+
+def test_get_presigned_url_expiry_from_signature_v4_url():
+    url = 'http://minio/bucket/key?X-Amz-Date=20240101T000000Z&X-Amz-Expires=3600&X-Amz-Signature=test'
+
+    expire_at = get_presigned_url_expiry(url, time.time())
+
+    # 2024-01-01T00:00:00Z + 1 hour
+    assert expire_at == 1704067200 + 3600 - AppConfig.Env.presigned_url_expiry_margin
+
+
+def test_get_presigned_url_expiry_fallback_to_default():
+    issued_at = time.time()
+
+    expire_at = get_presigned_url_expiry('http://minio/bucket/key', issued_at)
+
+    expected = issued_at + AppConfig.Env.presigned_url_expiry - AppConfig.Env.presigned_url_expiry_margin
+    assert expire_at == expected
+
+
+def test_presign_prefetcher_reuses_prefetched_url(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    file_object = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
+    presign = Mock(return_value='http://minio/presigned')
+
+    prefetcher = PresignPrefetcher(presign, 2)
+    prefetcher.prefetch(file_object, 1, 10, 'etag')
+    first = prefetcher.get(file_object, 1, 10, 'etag')
+    # retry of the same chunk should not request a new url
+    second = prefetcher.get(file_object, 1, 10, 'etag')
+    prefetcher.shutdown()
+
+    assert first == second == 'http://minio/presigned'
+    presign.assert_called_once_with(file_object, 1, 10, 'etag')
+
+
+def test_presign_prefetcher_requests_again_when_url_expired(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    mocker.patch('app.services.file_manager.file_upload.presign_prefetcher.get_presigned_url_expiry', return_value=0)
+    file_object = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
+    presign = Mock(side_effect=['http://minio/first', 'http://minio/second'])
+
+    prefetcher = PresignPrefetcher(presign, 2)
+    assert prefetcher.get(file_object, 1, 10, 'etag') == 'http://minio/first'
+    assert prefetcher.get(file_object, 1, 10, 'etag') == 'http://minio/second'
+
+
+def test_presign_prefetcher_does_not_cache_failure(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    file_object = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
+    presign = Mock(side_effect=[Exception('presign failed'), 'http://minio/presigned'])
+
+    prefetcher = PresignPrefetcher(presign, 2)
+    with pytest.raises(Exception, match='presign failed'):
+        prefetcher.get(file_object, 1, 10, 'etag')
+
+    assert prefetcher.get(file_object, 1, 10, 'etag') == 'http://minio/presigned'
+    assert presign.call_count == 2
+
+
+def test_presign_prefetcher_requests_inline_when_prefetch_is_queued(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    file_object = FileObject('object/path', 'local_path', 'resumable_id', 'job_id', 'item_id')
+    blocked = threading.Event()
+
+    def presign(file_object, chunk_number, chunk_size, etag):
+        if chunk_number == 1:
+            blocked.wait(5)
+        return f'http://minio/{chunk_number}'
+
+    # the only worker of prefetch is busy with the first chunk
+    prefetcher = PresignPrefetcher(presign, 1)
+    prefetcher.prefetch(file_object, 1, 10, 'etag')
+    prefetcher.prefetch(file_object, 2, 10, 'etag')
+    try:
+        start_time = time.monotonic()
+        assert prefetcher.get(file_object, 2, 10, 'etag') == 'http://minio/2'
+        # it does not wait for the first chunk
+        assert time.monotonic() - start_time < 1
+    finally:
+        blocked.set()
+        prefetcher.shutdown()
@@ -6,16 +6,23 @@ import base64
 import hashlib
 import math
 import re
+import threading
+import tracemalloc
+from concurrent.futures import Future
 from functools import wraps
-from multiprocessing import TimeoutError
 from multiprocessing.pool import ThreadPool
-from time import sleep
 
 import click
 import pytest
+from httpx import HTTPStatusError
 
 from app.configs.app_config import AppConfig
+from app.services.clients.bandwidth_limiter import BandwidthLimiter
+from app.services.clients.bandwidth_limiter import parse_rate_schedule
+from app.services.clients.transfer_engine import AsyncTransferEngine
+from app.services.file_manager.file_upload.exception import CHUNK_UPLOAD_FAILED
 from app.services.file_manager.file_upload.exception import INVALID_CHUNK_ETAG
+from app.services.file_manager.file_upload.models import ChunkInfo
 from app.services.file_manager.file_upload.models import FileObject
 from app.services.file_manager.file_upload.upload_client import UploadClient
 from tests.conftest import decoded_token
@@ -70,6 +77,37 @@ def test_check_status_fail(httpx_mock, mocker):
     assert result is False
 
 
+def test_upload_client_keeps_endpoint_per_thread():
+    upload_client = UploadClient('project_code', 'parent_folder_id')
+    upload_client.endpoint = 'main'
+
+    endpoints = []
+
+    def set_endpoint():
+        upload_client.endpoint = 'worker'
+        endpoints.append(upload_client.endpoint)
+
+    worker = threading.Thread(target=set_endpoint)
+    worker.start()
+    worker.join()
+
+    assert endpoints == ['worker']
+    assert upload_client.endpoint == 'main'
+
+
+def test_on_succeed_raises_error_without_exit(httpx_mock, mocker):
+    upload_client = UploadClient('project_code', 'parent_folder_id')
+
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    httpx_mock.add_response(
+        method='POST', url=AppConfig.Connections.url_upload_greenroom + '/v1/files', status_code=500, json={}
+    )
+
+    test_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    with pytest.raises(HTTPStatusError):
+        upload_client.on_succeed(test_obj)
+
+
 def test_chunk_upload(httpx_mock, mocker):
     upload_client = UploadClient('project_code', 'parent_folder_id')
 
@@ -79,11 +117,53 @@ def test_chunk_upload(httpx_mock, mocker):
     httpx_mock.add_response(method='PUT', url=test_presigned_url, json={'result': ''})
     mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
 
+    update_mock = mocker.patch('app.services.output_manager.progress_renderer.ProgressRenderer.update')
+
+    test_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    res = upload_client.upload_chunk(test_obj, 0, b'1', 'test_etag', 10)
+
+    update_mock.assert_called_with('test', 1, 'test', 1)
+    assert res.status_code == 200
+
+
+def test_chunk_upload_with_limit_rate_streams_chunk_with_content_length(httpx_mock, mocker):
+    upload_client = UploadClient('project_code', 'parent_folder_id')
+    BandwidthLimiter().configure(parse_rate_schedule('1G'))
+
+    test_presigned_url = 'http://test.url/presigned'
+    url = re.compile('^' + AppConfig.Connections.url_upload_greenroom + '/v1/files/chunks/presigned.*$')
+    httpx_mock.add_response(method='GET', url=url, json={'result': test_presigned_url})
+    httpx_mock.add_response(method='PUT', url=test_presigned_url, json={'result': ''})
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    mocker.patch('app.configs.app_config.AppConfig.Env.limit_rate_block_size', 2)
+
+    test_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    res = upload_client.upload_chunk(test_obj, 0, b'12345', 'test_etag', 10)
+
+    request = httpx_mock.get_request(method='PUT')
+    assert res.status_code == 200
+    assert request.headers['Content-Length'] == '5'
+    assert 'Transfer-Encoding' not in request.headers
+    assert request.read() == b'12345'
+
+
+def test_chunk_upload_with_hedge_sends_chunk_through_hedger(httpx_mock, mocker):
+    upload_client = UploadClient('project_code', 'parent_folder_id', hedge=True)
+    hedger_call = mocker.spy(upload_client.hedger, 'call')
+
+    test_presigned_url = 'http://test.url/presigned'
+    url = re.compile('^' + AppConfig.Connections.url_upload_greenroom + '/v1/files/chunks/presigned.*$')
+    httpx_mock.add_response(method='GET', url=url, json={'result': test_presigned_url})
+    httpx_mock.add_response(method='PUT', url=test_presigned_url, json={'result': ''})
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+
     test_obj = FileObject('test', 'test', 'test', 'test', 'test')
     res = upload_client.upload_chunk(test_obj, 0, b'1', 'test_etag', 10)
 
-    assert test_obj.progress_bar.n == 1
     assert res.status_code == 200
+    hedger_call.assert_called_once()
+    assert len(upload_client.hedger.tracker._samples) == 1
+    upload_client.set_finish_upload()
 
 
 def test_chunk_upload_failed_with_401(httpx_mock, mocker):
@@ -96,41 +176,87 @@ def test_chunk_upload_failed_with_401(httpx_mock, mocker):
     mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
 
     test_obj = FileObject('test', 'test', 'test', 'test', 'test')
-    with pytest.raises(SystemExit):
+    # the error is raised to retry the chunk instead of exiting the worker
+    with pytest.raises(HTTPStatusError):
         upload_client.upload_chunk(test_obj, 0, b'1', 'test_etag', 10)
 
 
+def test_chunk_upload_with_async_engine(httpx_mock, mocker):
+    engine = AsyncTransferEngine(2)
+    upload_client = UploadClient('project_code', 'parent_folder_id', engine=engine)
+    upload_client.inflight_budget.acquire(10)
+
+    test_presigned_url = 'http://test.url/presigned'
+    url = re.compile('^' + AppConfig.Connections.url_upload_greenroom + '/v1/files/chunks/presigned.*$')
+    httpx_mock.add_response(method='GET', url=url, json={'result': test_presigned_url})
+    httpx_mock.add_response(method='PUT', url=test_presigned_url, json={'result': ''})
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+
+    test_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    etag_future = Future()
+    etag_future.set_result('test_etag')
+    res = engine.submit(upload_client.upload_chunk_async(test_obj, 1, b'1', etag_future, 1, 10))
+    res.wait()
+    engine.close()
+
+    assert res.successful()
+    assert upload_client.inflight_budget.inflight_size == 0
+    assert httpx_mock.get_request(method='PUT').headers['Content-MD5'] == 'test_etag'
+
+
+def test_chunk_upload_with_async_engine_keeps_error(httpx_mock, mocker):
+    engine = AsyncTransferEngine(2)
+    upload_client = UploadClient('project_code', 'parent_folder_id', engine=engine)
+
+    test_presigned_url = 'http://test.url/presigned'
+    url = re.compile('^' + AppConfig.Connections.url_upload_greenroom + '/v1/files/chunks/presigned.*$')
+    httpx_mock.add_response(method='GET', url=url, json={'result': test_presigned_url})
+    httpx_mock.add_response(method='PUT', url=test_presigned_url, status_code=500)
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+
+    test_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    etag_future = Future()
+    etag_future.set_result('test_etag')
+    res = engine.submit(upload_client.upload_chunk_async(test_obj, 1, b'1', etag_future, 1, 10))
+    res.wait()
+    engine.close()
+
+    assert not res.successful()
+
+
 @pytest.mark.parametrize('total_size, chunk_size', [(101, 1), (101, 5), (101, 101)])
 def test_stream_upload_success_with_new_upload(mocker, total_size, chunk_size):
     upload_client = UploadClient('project_code', 'parent_folder_id')
-    upload_client.chunk_size = chunk_size
     test_data = '1' * total_size
     file_size = len(test_data)
-    file_chunks = math.ceil(file_size / upload_client.chunk_size)
+    file_chunks = math.ceil(file_size / chunk_size)
     file_local_path = 'test.txt'
 
     mocker.patch(
         'app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(file_size, file_chunks)
     )
-    test_obj = FileObject('object_path', file_local_path)
+    test_obj = FileObject('object_path', file_local_path, chunk_size=chunk_size)
     upload_chunk_mock = mocker.patch(
         'app.services.file_manager.file_upload.upload_client.UploadClient.upload_chunk', return_value=None
     )
+    mocker.patch(
+        'app.services.file_manager.file_upload.presign_prefetcher.PresignPrefetcher.prefetch', return_value=None
+    )
 
     runner = click.testing.CliRunner()
     with runner.isolated_filesystem():
         with open(file_local_path, 'w') as f:
             f.write(test_data)
         pool = ThreadPool(2)
-        res = upload_client.stream_upload(test_obj, pool)
+        upload_client.stream_upload(test_obj, pool)
 
         pool.close()
         pool.join()
 
-    assert len(res) == file_chunks
+    assert upload_chunk_mock.call_count == file_chunks
     # assert call with all chunks and params
     for i in range(file_chunks):
-        chunk = test_data[i * upload_client.chunk_size : (i + 1) * upload_client.chunk_size].encode()
+        chunk = test_data[i * test_obj.chunk_size : (i + 1) * test_obj.chunk_size].encode()
 
         etag = base64.b64encode(hashlib.md5(chunk).digest()).decode('utf-8')
         chunk_size = len(chunk)
@@ -140,59 +266,162 @@ def test_stream_upload_success_with_new_upload(mocker, total_size, chunk_size):
 @pytest.mark.parametrize('total_size, chunk_size, uploaded_offest', [(101, 1, 1), (101, 5, 1), (101, 101, 1)])
 def test_stream_upload_success_with_resume_upload(mocker, total_size, chunk_size, uploaded_offest):
     upload_client = UploadClient('project_code', 'parent_folder_id')
-    upload_client.chunk_size = chunk_size
     test_data = '1' * total_size
     file_size = len(test_data)
-    file_chunks = math.ceil(file_size / upload_client.chunk_size)
+    file_chunks = math.ceil(file_size / chunk_size)
     file_local_path = 'test.txt'
     uploaded_chunk, uploaded_offest = {}, uploaded_offest
     for i in range(uploaded_offest):
-        chunk = test_data[i * upload_client.chunk_size : (i + 1) * upload_client.chunk_size].encode()
+        chunk = test_data[i * chunk_size : (i + 1) * chunk_size].encode()
         etag = base64.b64encode(hashlib.md5(chunk).digest()).decode('utf-8')
         uploaded_chunk.update({str(i + 1): {'etag': etag, 'chunk_size': len(chunk)}})
 
     mocker.patch(
         'app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(file_size, file_chunks)
     )
-    test_obj = FileObject('object_path', file_local_path)
+    test_obj = FileObject('object_path', file_local_path, chunk_size=chunk_size)
     test_obj.uploaded_chunks = uploaded_chunk
     upload_chunk_mock = mocker.patch(
         'app.services.file_manager.file_upload.upload_client.UploadClient.upload_chunk', return_value=None
     )
+    mocker.patch(
+        'app.services.file_manager.file_upload.presign_prefetcher.PresignPrefetcher.prefetch', return_value=None
+    )
 
     runner = click.testing.CliRunner()
     with runner.isolated_filesystem():
         with open(file_local_path, 'w') as f:
             f.write(test_data)
         pool = ThreadPool(2)
-        res = upload_client.stream_upload(test_obj, pool)
+        upload_client.stream_upload(test_obj, pool)
 
         pool.close()
         pool.join()
 
-    assert len(res) == file_chunks - uploaded_offest
+    assert upload_chunk_mock.call_count == file_chunks - uploaded_offest
     # assert call with all chunks and params
     for i in range(file_chunks - uploaded_offest):
         offset = uploaded_offest + i
-        chunk = test_data[offset * upload_client.chunk_size : (offset + 1) * upload_client.chunk_size].encode()
+        chunk = test_data[offset * test_obj.chunk_size : (offset + 1) * test_obj.chunk_size].encode()
 
         etag = base64.b64encode(hashlib.md5(chunk).digest()).decode('utf-8')
         chunk_size = len(chunk)
         upload_chunk_mock.assert_any_call(test_obj, offset + 1, chunk, etag, chunk_size)
 
 
+def test_stream_upload_releases_inflight_budget_after_chunk_uploaded(mocker):
+    upload_client = UploadClient('project_code', 'parent_folder_id', max_inflight_size=4)
+    test_data = '1' * 10
+    file_local_path = 'test.txt'
+
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(10, 5))
+    test_obj = FileObject('object_path', file_local_path, chunk_size=2)
+    upload_chunk_mock = mocker.patch(
+        'app.services.file_manager.file_upload.upload_client.UploadClient.upload_chunk', return_value=None
+    )
+    mocker.patch(
+        'app.services.file_manager.file_upload.presign_prefetcher.PresignPrefetcher.prefetch', return_value=None
+    )
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open(file_local_path, 'w') as f:
+            f.write(test_data)
+        pool = ThreadPool(1)
+        upload_client.stream_upload(test_obj, pool)
+
+        pool.close()
+        pool.join()
+
+    assert upload_chunk_mock.call_count == 5
+    assert upload_client.inflight_budget.inflight_size == 0
+
+
+def test_stream_upload_releases_chunk_memory_while_file_is_streaming(mocker):
+    chunk_size = 1024 * 1024
+    upload_client = UploadClient('project_code', 'parent_folder_id')
+    file_local_path = 'test.txt'
+
+    mocker.patch(
+        'app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(8 * chunk_size, 8)
+    )
+    test_obj = FileObject('object_path', file_local_path, chunk_size=chunk_size)
+    # the mock is not used since it keeps the arguments of calls
+    mocker.patch.object(UploadClient, 'upload_chunk', new=lambda *args: None)
+    mocker.patch(
+        'app.services.file_manager.file_upload.presign_prefetcher.PresignPrefetcher.prefetch', return_value=None
+    )
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open(file_local_path, 'wb') as f:
+            f.write(b'1' * 8 * chunk_size)
+        pool = ThreadPool(1)
+        results = []
+        tracemalloc.start()
+        try:
+            for res in upload_client.iter_stream_upload(test_obj, pool):
+                res.wait()
+                results.append(res)
+                if len(results) == 6:
+                    traced_size, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            pool.close()
+            pool.join()
+            upload_client.set_finish_upload()
+
+    # the results of uploaded chunks do not keep the chunk data alive,
+    # only the chunk being read is in memory
+    assert traced_size < 2 * chunk_size
+
+
+def test_stream_upload_finalises_file_after_all_chunks_uploaded(mocker):
+    upload_client = UploadClient('project_code', 'parent_folder_id')
+    test_data = '1' * 10
+    file_local_path = 'test.txt'
+
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(10, 5))
+    test_obj = FileObject('object_path', file_local_path, item_id='item_id', chunk_size=2)
+    upload_chunk_mock = mocker.patch(
+        'app.services.file_manager.file_upload.upload_client.UploadClient.upload_chunk', return_value=None
+    )
+    mocker.patch(
+        'app.services.file_manager.file_upload.presign_prefetcher.PresignPrefetcher.prefetch', return_value=None
+    )
+    on_succeed_mock = mocker.patch(
+        'app.services.file_manager.file_upload.upload_client.UploadClient.on_succeed', return_value=None
+    )
+    upload_client.finaliser.finalise = on_succeed_mock
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open(file_local_path, 'w') as f:
+            f.write(test_data)
+        # one worker is enough since no worker waits for the other chunks
+        pool = ThreadPool(1)
+        upload_client.stream_upload(test_obj, pool)
+        upload_client.finaliser.wait()
+
+        pool.close()
+        pool.join()
+
+    assert upload_chunk_mock.call_count == 5
+    on_succeed_mock.assert_called_once_with(test_obj)
+
+
 def test_stream_upload_failed_with_etag_mismatch(mocker):
     upload_client = UploadClient('project_code', 'parent_folder_id')
-    upload_client.chunk_size = 2
+    chunk_size = 2
     test_data = '1' * 10
     file_size = len(test_data)
-    file_chunks = math.ceil(file_size / upload_client.chunk_size)
+    file_chunks = math.ceil(file_size / chunk_size)
     file_local_path = 'test.txt'
 
     mocker.patch(
         'app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(file_size, file_chunks)
     )
-    test_obj = FileObject('object_path', file_local_path)
+    test_obj = FileObject('object_path', file_local_path, chunk_size=chunk_size)
     # wrong etag
     test_obj.uploaded_chunks = {'1': {'etag': 'test_etag', 'chunk_size': 2}}
 
@@ -213,32 +442,6 @@ def test_stream_upload_failed_with_etag_mismatch(mocker):
             pool.join()
 
 
-def test_token_refresh_auto(mocker):
-    AppConfig.Env.token_refresh_interval = 1
-
-    token_refresh_mock = mocker.patch(
-        'app.services.user_authentication.token_manager.SrvTokenManager.refresh', return_value=None
-    )
-
-    upload_client = UploadClient('project_code', 'parent_folder_id')
-    pool = ThreadPool(2)
-    async_fun = pool.apply_async(upload_client.upload_token_refresh)
-    sleep(3)
-    upload_client.set_finish_upload()
-
-    # add the timeout to avoid the test stuck
-    try:
-        async_fun.get(timeout=5)
-    except TimeoutError:
-        raise AssertionError('token refresh failed')
-
-    pool.close()
-    pool.join()
-
-    # make sure the token refresh function is called
-    token_refresh_mock.assert_called_once()
-
-
 def test_resumable_pre_upload_success(httpx_mock, mocker):
     mocker.patch(
         'app.services.user_authentication.token_manager.SrvTokenManager.decode_access_token',
@@ -251,14 +454,16 @@ def test_resumable_pre_upload_success(httpx_mock, mocker):
 
     url = AppConfig.Connections.url_bff + f'/v1/project/{upload_client.project_code}/files/resumable'
     httpx_mock.add_response(
-        method='POST', url=url, json={'result': [{'resumable_id': 'resumable_id', 'chunks_info': ['chunks_info']}]}
+        method='POST',
+        url=url,
+        json={'result': [{'resumable_id': 'resumable_id', 'chunks_info': {'1': {'etag': 'etag', 'chunk_size': 1}}}]},
     )
 
     res = upload_client.resume_upload([test_obj])
 
     assert len(res) == 1
     assert res[0].resumable_id == 'resumable_id'
-    assert res[0].uploaded_chunks == ['chunks_info']
+    assert res[0].uploaded_chunks.get(1) == ChunkInfo('etag', 1)
 
 
 def test_resumable_pre_upload_failed_with_404(httpx_mock, mocker):
@@ -355,3 +560,158 @@ def test_output_manifest_success(mocker, tmp_path):
     assert file_item.get('item_id') == 'item_id'
 
     json_dump_mocker.assert_called_once()
+
+
+def test_stream_upload_skips_reading_uploaded_chunks_in_chunk_hash_cache(mocker):
+    test_data = '1' * 10
+    file_local_path = 'test.txt'
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(10, 5))
+    upload_chunk_mock = mocker.patch(
+        'app.services.file_manager.file_upload.upload_client.UploadClient.upload_chunk', return_value=None
+    )
+    mocker.patch(
+        'app.services.file_manager.file_upload.presign_prefetcher.PresignPrefetcher.prefetch', return_value=None
+    )
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open(file_local_path, 'w') as f:
+            f.write(test_data)
+
+        # the md5 of chunks are recorded by the first upload
+        upload_client = UploadClient('project_code', 'parent_folder_id')
+        pool = ThreadPool(1)
+        upload_client.stream_upload(FileObject('object_path', file_local_path, chunk_size=2), pool)
+        pool.close()
+        pool.join()
+        upload_client.set_finish_upload()
+
+        etag = base64.b64encode(hashlib.md5(b'11').digest()).decode('utf-8')
+        test_obj = FileObject('object_path', file_local_path, chunk_size=2)
+        test_obj.uploaded_chunks = {str(i + 1): {'etag': etag, 'chunk_size': 2} for i in range(5)}
+        read_mock = mocker.patch(
+            'app.services.file_manager.file_upload.upload_client.ChunkReader.read', return_value=b''
+        )
+
+        upload_client = UploadClient('project_code', 'parent_folder_id')
+        pool = ThreadPool(1)
+        upload_client.stream_upload(test_obj, pool)
+        pool.close()
+        pool.join()
+        upload_client.set_finish_upload()
+
+    # only the chunks of first upload are sent
+    assert upload_chunk_mock.call_count == 5
+    # only the read to find the end of file
+    read_mock.assert_called_once_with(10, 2)
+
+
+def test_stream_upload_retries_chunk_failed_with_transient_error(httpx_mock, mocker, monkeypatch):
+    monkeypatch.setattr(AppConfig.Env, 'chunk_retry_backoff', 0.01)
+    upload_client = UploadClient('project_code', 'parent_folder_id', max_inflight_size=10)
+
+    test_presigned_url = 'http://test.url/presigned'
+    url = re.compile('^' + AppConfig.Connections.url_upload_greenroom + '/v1/files/chunks/presigned.*$')
+    httpx_mock.add_response(method='GET', url=url, json={'result': test_presigned_url})
+    httpx_mock.add_response(method='PUT', url=test_presigned_url, status_code=502)
+    httpx_mock.add_response(method='PUT', url=test_presigned_url, json={'result': ''})
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(2, 1))
+    test_obj = FileObject('object_path', 'test.txt', item_id='item_id', chunk_size=2)
+    on_succeed_mock = mocker.patch(
+        'app.services.file_manager.file_upload.upload_client.UploadClient.on_succeed', return_value=None
+    )
+    upload_client.finaliser.finalise = on_succeed_mock
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open('test.txt', 'w') as f:
+            f.write('11')
+        pool = ThreadPool(1)
+        upload_client.stream_upload(test_obj, pool)
+        upload_client.finaliser.wait()
+        upload_client.set_finish_upload()
+        pool.close()
+        pool.join()
+
+    assert len(httpx_mock.get_requests(method='PUT')) == 2
+    # the presigned url is reused for the retry
+    assert len(httpx_mock.get_requests(method='GET')) == 1
+    assert upload_client.finaliser.failures == {}
+    on_succeed_mock.assert_called_once_with(test_obj)
+    assert upload_client.inflight_budget.inflight_size == 0
+
+
+def test_stream_upload_requests_new_presigned_url_after_expired(httpx_mock, mocker, monkeypatch):
+    monkeypatch.setattr(AppConfig.Env, 'chunk_retry_backoff', 0.01)
+    upload_client = UploadClient('project_code', 'parent_folder_id', max_inflight_size=10)
+
+    test_presigned_url = 'http://test.url/presigned'
+    url = re.compile('^' + AppConfig.Connections.url_upload_greenroom + '/v1/files/chunks/presigned.*$')
+    httpx_mock.add_response(method='GET', url=url, json={'result': test_presigned_url})
+    httpx_mock.add_response(
+        method='PUT', url=test_presigned_url, status_code=403, text='<Message>Request has expired</Message>'
+    )
+    httpx_mock.add_response(method='PUT', url=test_presigned_url, json={'result': ''})
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(2, 1))
+    test_obj = FileObject('object_path', 'test.txt', item_id='item_id', chunk_size=2)
+    upload_client.finaliser.finalise = mocker.Mock()
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open('test.txt', 'w') as f:
+            f.write('11')
+        pool = ThreadPool(1)
+        upload_client.stream_upload(test_obj, pool)
+        upload_client.finaliser.wait()
+        upload_client.set_finish_upload()
+        pool.close()
+        pool.join()
+
+    # the url rejected by object storage is not used again
+    assert len(httpx_mock.get_requests(method='GET')) == 2
+    assert upload_client.finaliser.failures == {}
+
+
+def test_stream_upload_fails_chunk_without_retry_on_client_error(httpx_mock, mocker):
+    upload_client = UploadClient('project_code', 'parent_folder_id', max_inflight_size=10)
+
+    test_presigned_url = 'http://test.url/presigned'
+    url = re.compile('^' + AppConfig.Connections.url_upload_greenroom + '/v1/files/chunks/presigned.*$')
+    httpx_mock.add_response(method='GET', url=url, json={'result': test_presigned_url})
+    httpx_mock.add_response(method='PUT', url=test_presigned_url, status_code=400)
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(2, 1))
+    test_obj = FileObject('object_path', 'test.txt', item_id='item_id', chunk_size=2)
+
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        with open('test.txt', 'w') as f:
+            f.write('11')
+        pool = ThreadPool(1)
+        upload_client.stream_upload(test_obj, pool)
+        upload_client.finaliser.wait()
+        # the url of failed chunk is not kept until the end of upload
+        failed_urls = dict(upload_client.presign_prefetcher._urls)
+        upload_client.set_finish_upload()
+        pool.close()
+        pool.join()
+
+    error = upload_client.finaliser.failures['item_id'].error
+    assert isinstance(error, CHUNK_UPLOAD_FAILED)
+    assert error.chunk_number == 1
+    assert error.attempts == 1
+    assert upload_client.inflight_budget.inflight_size == 0
+    assert failed_urls == {}
+
+
+def test_upload_chunk_in_budget_turns_exit_into_error(mocker):
+    upload_client = UploadClient('project_code', 'parent_folder_id')
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    mocker.patch(
+        'app.services.file_manager.file_upload.upload_client.UploadClient.upload_chunk', side_effect=SystemExit(1)
+    )
+    test_obj = FileObject('test', 'test', 'test', 'test', 'test')
+    etag_future = Future()
+    etag_future.set_result('test_etag')
+
+    with pytest.raises(RuntimeError):
+        upload_client.upload_chunk_in_budget(test_obj, 1, b'1', etag_future, 1, 1)
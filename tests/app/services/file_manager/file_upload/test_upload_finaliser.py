@@ -0,0 +1,120 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import pytest
+
+from app.services.file_manager.file_upload.models import FileObject
+from app.services.file_manager.file_upload.upload_finaliser import UploadFailure
+from app.services.file_manager.file_upload.upload_finaliser import UploadFinaliser
+
+
+@pytest.fixture
+def file_object(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    return FileObject('test', 'test', 'test', 'test', 'item_id')
+
+
+def test_finaliser_runs_after_last_chunk_done(mocker, file_object):
+    finalise = mocker.Mock(return_value='result')
+    finaliser = UploadFinaliser(finalise, 1)
+
+    finaliser.start(file_object)
+    finaliser.add_chunk(file_object)
+    finaliser.add_chunk(file_object)
+    finaliser.chunk_done(file_object)
+    finaliser.seal(file_object)
+    finalise.assert_not_called()
+
+    finaliser.chunk_done(file_object)
+    finaliser.wait()
+    finaliser.shutdown()
+
+    finalise.assert_called_once_with(file_object)
+    assert finaliser.failures == {}
+
+
+def test_finaliser_runs_for_file_without_chunk_to_upload(mocker, file_object):
+    finalise = mocker.Mock()
+    finaliser = UploadFinaliser(finalise, 1)
+
+    finaliser.start(file_object)
+    finaliser.seal(file_object)
+    finaliser.wait()
+    finaliser.shutdown()
+
+    finalise.assert_called_once_with(file_object)
+
+
+def test_finaliser_skips_file_with_failed_chunk(mocker, file_object):
+    finalise = mocker.Mock()
+    finaliser = UploadFinaliser(finalise, 1)
+    error = Exception('chunk failed')
+
+    finaliser.start(file_object)
+    finaliser.add_chunk(file_object)
+    finaliser.chunk_done(file_object, error)
+    finaliser.seal(file_object)
+    finaliser.wait()
+
+    finalise.assert_not_called()
+    assert finaliser.failures == {'item_id': UploadFailure('test', error)}
+
+
+def test_finaliser_fails_file_that_is_not_streamed(mocker, file_object):
+    finaliser = UploadFinaliser(mocker.Mock(), 1)
+    error = Exception('lane failed')
+
+    finaliser.fail(file_object, error)
+    finaliser.wait()
+
+    assert finaliser.failures == {'item_id': UploadFailure('test', error)}
+
+
+def test_finaliser_raises_exit_of_finalise(file_object):
+    def finalise(file_object):
+        raise SystemExit(1)
+
+    finaliser = UploadFinaliser(finalise, 1)
+    finaliser.start(file_object)
+    finaliser.seal(file_object)
+
+    with pytest.raises(SystemExit):
+        finaliser.wait()
+
+
+def test_finaliser_keeps_other_files_when_one_finalise_failed(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    file_objects = [FileObject(f'test_{i}', 'test', 'test', 'test', f'item_{i}') for i in range(5)]
+    error = Exception('finalise failed')
+    finalised = []
+
+    def finalise(file_object):
+        if file_object.item_id == 'item_2':
+            raise error
+        finalised.append(file_object.item_id)
+
+    finaliser = UploadFinaliser(finalise, 2)
+    for file_object in file_objects:
+        finaliser.start(file_object)
+        finaliser.seal(file_object)
+    finaliser.wait()
+    finaliser.shutdown()
+
+    assert finaliser.failures == {'item_2': UploadFailure('test_2', error)}
+    assert sorted(finalised) == ['item_0', 'item_1', 'item_3', 'item_4']
+
+
+def test_finaliser_does_not_keep_finalised_files(mocker):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(1, 1))
+    finaliser = UploadFinaliser(lambda file_object: 'result', 2)
+
+    for i in range(10):
+        file_object = FileObject(f'test_{i}', 'test', 'test', 'test', f'item_{i}')
+        finaliser.start(file_object)
+        finaliser.seal(file_object)
+    finaliser.wait()
+    finaliser.shutdown()
+
+    # nothing is kept for each succeeded file until the end of upload
+    assert all(not value for value in vars(finaliser).values() if isinstance(value, dict))
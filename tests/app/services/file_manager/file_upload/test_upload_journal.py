@@ -0,0 +1,154 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import json
+import os
+import threading
+
+from app.configs.app_config import AppConfig
+from app.services.file_manager.file_upload import upload_journal
+from app.services.file_manager.file_upload.models import ChunkInfo
+from app.services.file_manager.file_upload.models import ChunkState
+from app.services.file_manager.file_upload.models import FileObject
+from app.services.file_manager.file_upload.upload_journal import UploadJournal
+from app.services.file_manager.file_upload.upload_journal import get_compacting_path
+from app.services.file_manager.file_upload.upload_journal import get_journal_path
+
+
+def create_file_object(mocker, item_id):
+    mocker.patch('app.services.file_manager.file_upload.models.FileObject.generate_meta', return_value=(4, 2))
+    return FileObject(f'object/{item_id}', f'local/{item_id}', 'resumable_id', 'job_id', item_id, chunk_size=2)
+
+
+def write_manifest(output_path, file_objects=None):
+    with open(output_path, 'w') as f:
+        json.dump({'project_code': 'project_code', 'file_objects': file_objects or {}}, f)
+
+
+def test_upload_journal_appends_records_without_rewriting_manifest(mocker, tmp_path):
+    output_path = str(tmp_path / 'manifest.json')
+    test_obj = create_file_object(mocker, 'item_id')
+    write_manifest(output_path)
+
+    journal = UploadJournal(output_path, new_manifest=True)
+    journal.register([test_obj])
+    journal.chunk_uploaded(test_obj, 1, 'etag_1', 2)
+
+    with open(output_path, 'r') as f:
+        assert json.load(f).get('file_objects') == {}
+    with open(get_journal_path(output_path), 'r') as f:
+        assert len(f.readlines()) == 2
+
+    manifest = UploadJournal.load(output_path)
+    file_info = manifest.get('file_objects').get('item_id')
+    assert file_info.get('local_path') == 'local/item_id'
+    assert file_info.get('journaled') is True
+    assert ChunkState.from_json(file_info.get('uploaded_chunks')).get(1) == ChunkInfo('etag_1', 2)
+
+
+def test_upload_journal_close_compacts_into_manifest(mocker, tmp_path):
+    output_path = str(tmp_path / 'manifest.json')
+    test_obj = create_file_object(mocker, 'item_id')
+    write_manifest(output_path)
+
+    journal = UploadJournal(output_path, new_manifest=True)
+    journal.register([test_obj])
+    journal.chunk_uploaded(test_obj, 1, 'etag_1', 2)
+    journal.finalised(test_obj)
+    journal.close()
+
+    assert not os.path.exists(get_journal_path(output_path))
+    with open(output_path, 'r') as f:
+        manifest = json.load(f)
+    assert manifest.get('project_code') == 'project_code'
+    file_info = manifest.get('file_objects').get('item_id')
+    assert file_info.get('journaled') is True
+    assert file_info.get('finalised') is True
+    assert ChunkState.from_json(file_info.get('uploaded_chunks')).get(1) == ChunkInfo('etag_1', 2)
+
+
+def test_upload_journal_compacts_when_records_reach_limit(mocker, tmp_path, monkeypatch):
+    monkeypatch.setattr(AppConfig.Env, 'journal_compact_records', 3)
+    output_path = str(tmp_path / 'manifest.json')
+    test_obj = create_file_object(mocker, 'item_id')
+    write_manifest(output_path)
+
+    journal = UploadJournal(output_path, new_manifest=True)
+    journal.register([test_obj])
+    journal.chunk_uploaded(test_obj, 1, 'etag_1', 2)
+    with open(output_path, 'r') as f:
+        assert json.load(f).get('file_objects') == {}
+
+    journal.chunk_uploaded(test_obj, 2, 'etag_2', 2)
+    with open(output_path, 'r') as f:
+        assert 'item_id' in json.load(f).get('file_objects')
+    assert not os.path.exists(get_journal_path(output_path))
+    assert not os.path.exists(get_compacting_path(output_path))
+
+
+def test_upload_journal_load_ignores_broken_last_record(mocker, tmp_path):
+    output_path = str(tmp_path / 'manifest.json')
+    test_obj = create_file_object(mocker, 'item_id')
+    with open(output_path, 'w') as f:
+        json.dump({'file_objects': {'item_id': test_obj.to_dict()}}, f)
+    with open(get_journal_path(output_path), 'w') as f:
+        f.write(json.dumps({'op': 'chunk', 'item_id': 'item_id', 'chunk_number': 1, 'etag': 'etag_1', 'chunk_size': 2}))
+        f.write('\n{"op": "chunk", "item_id": "ite')
+
+    manifest = UploadJournal.load(output_path)
+
+    assert manifest['file_objects']['item_id']['uploaded_chunks'].get(1) == ChunkInfo('etag_1', 2)
+
+
+def test_upload_journal_appends_records_while_manifest_is_compacted(mocker, tmp_path, monkeypatch):
+    monkeypatch.setattr(AppConfig.Env, 'journal_compact_records', 2)
+    output_path = str(tmp_path / 'manifest.json')
+    test_obj = create_file_object(mocker, 'item_id')
+    write_manifest(output_path)
+    journal = UploadJournal(output_path, new_manifest=True)
+    journal.register([test_obj])
+
+    compacting, appended = threading.Event(), threading.Event()
+    replay_journal = upload_journal.replay_journal
+
+    def slow_replay_journal(manifest, journal_path):
+        compacting.set()
+        assert appended.wait(5)
+        replay_journal(manifest, journal_path)
+
+    mocker.patch.object(upload_journal, 'replay_journal', side_effect=slow_replay_journal)
+    compaction = threading.Thread(target=journal.chunk_uploaded, args=(test_obj, 1, 'etag_1', 2))
+    compaction.start()
+    assert compacting.wait(5)
+
+    # the manifest is rewritten without the lock of the records
+    journal.chunk_uploaded(test_obj, 2, 'etag_2', 2)
+    appended.set()
+    compaction.join()
+
+    manifest = UploadJournal.load(output_path)
+    uploaded_chunks = manifest['file_objects']['item_id']['uploaded_chunks']
+    assert uploaded_chunks.get(1) == ChunkInfo('etag_1', 2)
+    assert uploaded_chunks.get(2) == ChunkInfo('etag_2', 2)
+
+
+def test_upload_journal_compacts_journal_left_by_interrupted_upload(mocker, tmp_path):
+    output_path = str(tmp_path / 'manifest.json')
+    test_obj = create_file_object(mocker, 'item_id')
+    write_manifest(output_path, {'item_id': test_obj.to_dict()})
+    with open(get_compacting_path(output_path), 'w') as f:
+        f.write(json.dumps({'op': 'chunk', 'item_id': 'item_id', 'chunk_number': 1, 'etag': 'etag_1', 'chunk_size': 2}))
+        f.write('\n')
+    with open(get_journal_path(output_path), 'w') as f:
+        f.write(json.dumps({'op': 'chunk', 'item_id': 'item_id', 'chunk_number': 2, 'etag': 'etag_2', 'chunk_size': 2}))
+        f.write('\n')
+
+    UploadJournal(output_path)
+
+    assert not os.path.exists(get_journal_path(output_path))
+    assert not os.path.exists(get_compacting_path(output_path))
+    with open(output_path, 'r') as f:
+        uploaded_chunks = ChunkState.from_json(json.load(f)['file_objects']['item_id']['uploaded_chunks'])
+    assert uploaded_chunks.get(1) == ChunkInfo('etag_1', 2)
+    assert uploaded_chunks.get(2) == ChunkInfo('etag_2', 2)
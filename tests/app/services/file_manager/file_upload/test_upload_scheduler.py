@@ -0,0 +1,157 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from app.services.file_manager.file_upload.upload_scheduler import SchedulePolicy
+from app.services.file_manager.file_upload.upload_scheduler import UploadScheduler
+
+MB = 1024 * 1024
+
+
+class FakeUploadClient:
+    def __init__(self, chunk_size=MB):
+        self.chunk_size = chunk_size
+        self.streamed = []
+        self.threads = {}
+        self.closed = []
+        self.finaliser = Mock()
+
+    def stream_upload(self, file_object, pool):
+        return list(self.iter_stream_upload(file_object, pool))
+
+    def iter_stream_upload(self, file_object, pool):
+        self.threads[file_object.name] = threading.current_thread()
+        try:
+            for chunk_number in range(max(file_object.total_size // self.chunk_size, 1)):
+                self.streamed.append((file_object.name, chunk_number + 1))
+                yield chunk_number
+        except GeneratorExit:
+            self.closed.append(file_object.name)
+            raise
+
+
+def make_files(**sizes):
+    return [SimpleNamespace(name=name, total_size=size) for name, size in sizes.items()]
+
+
+@pytest.fixture(autouse=True)
+def small_file_lane_size(mocker):
+    mocker.patch('app.configs.app_config.AppConfig.Env.small_file_lane_size', MB)
+
+
+def test_walk_policy_streams_files_in_found_order():
+    upload_client = FakeUploadClient()
+    scheduler = UploadScheduler(upload_client, None, SchedulePolicy.WALK)
+
+    scheduler.add(make_files(small=10, big=3 * MB, medium=2 * MB))
+    scheduler.finish()
+
+    assert [name for name, _ in upload_client.streamed] == ['small', 'big', 'big', 'big', 'medium', 'medium']
+    assert upload_client.threads['small'] is threading.current_thread()
+
+
+def test_largest_first_policy_streams_big_files_first_and_small_files_in_lane():
+    upload_client = FakeUploadClient()
+    scheduler = UploadScheduler(upload_client, None, SchedulePolicy.LARGEST_FIRST)
+
+    scheduler.add(make_files(small=10, medium=2 * MB, tiny=1, big=3 * MB))
+    scheduler.finish()
+
+    big_files = [name for name, _ in upload_client.streamed if name in ('big', 'medium')]
+    assert big_files == ['big', 'big', 'big', 'medium', 'medium']
+    assert upload_client.threads['small'] is not threading.current_thread()
+    assert upload_client.threads['tiny'] is upload_client.threads['small']
+    assert ('small', 1) in upload_client.streamed and ('tiny', 1) in upload_client.streamed
+
+
+def test_scheduler_streams_each_batch_as_it_is_added():
+    upload_client = FakeUploadClient()
+    scheduler = UploadScheduler(upload_client, None, SchedulePolicy.LARGEST_FIRST)
+
+    scheduler.add(make_files(medium=2 * MB))
+    assert [name for name, _ in upload_client.streamed] == ['medium', 'medium']
+    scheduler.add(make_files(big=3 * MB))
+    assert [name for name, _ in upload_client.streamed] == ['medium', 'medium', 'big', 'big', 'big']
+
+    scheduler.finish()
+
+
+def test_interleave_policy_streams_chunks_of_files_in_turn(mocker):
+    mocker.patch('app.configs.app_config.AppConfig.Env.upload_interleave_files', 2)
+    upload_client = FakeUploadClient()
+    scheduler = UploadScheduler(upload_client, None, SchedulePolicy.INTERLEAVE)
+
+    scheduler.add(make_files(a=2 * MB, b=4 * MB, c=3 * MB))
+    scheduler.finish()
+
+    assert upload_client.streamed == [
+        ('b', 1),
+        ('c', 1),
+        ('b', 2),
+        ('c', 2),
+        ('b', 3),
+        ('c', 3),
+        ('b', 4),
+        ('a', 1),
+        ('a', 2),
+    ]
+
+
+def test_interleave_policy_closes_files_in_turn_on_error(mocker):
+    upload_client = FakeUploadClient()
+    iter_stream_upload = upload_client.iter_stream_upload
+
+    def fail_on_b(file_object, pool):
+        if file_object.name == 'b':
+            raise ValueError('failed')
+            yield
+        yield from iter_stream_upload(file_object, pool)
+
+    upload_client.iter_stream_upload = fail_on_b
+    scheduler = UploadScheduler(upload_client, None, SchedulePolicy.INTERLEAVE)
+
+    with pytest.raises(ValueError):
+        scheduler.add(make_files(a=4 * MB, b=3 * MB))
+    scheduler.close()
+    assert upload_client.closed == ['a']
+
+
+def test_scheduler_fails_rest_of_small_files_after_lane_error(mocker):
+    upload_client = FakeUploadClient()
+    error = ValueError('failed')
+    mocker.patch.object(upload_client, 'stream_upload', side_effect=error)
+    scheduler = UploadScheduler(upload_client, None, SchedulePolicy.LARGEST_FIRST)
+
+    small_files = make_files(small=10, tiny=1)
+    scheduler.add(small_files)
+    scheduler.finish()
+
+    # the files are registered already, so they are reported as failed
+    upload_client.stream_upload.assert_called_once()
+    assert upload_client.finaliser.fail.call_args_list == [((x, error),) for x in small_files]
+
+
+def test_scheduler_raises_exit_of_small_file_lane(mocker):
+    upload_client = FakeUploadClient()
+    mocker.patch.object(upload_client, 'stream_upload', side_effect=SystemExit(1))
+    scheduler = UploadScheduler(upload_client, None, SchedulePolicy.LARGEST_FIRST)
+
+    scheduler.add(make_files(small=10))
+    with pytest.raises(SystemExit):
+        scheduler.finish()
+
+
+def test_scheduler_drops_files_not_streamed_when_closed():
+    upload_client = FakeUploadClient()
+    scheduler = UploadScheduler(upload_client, None, SchedulePolicy.LARGEST_FIRST)
+
+    scheduler.close()
+    scheduler.add(make_files(big=3 * MB))
+
+    assert upload_client.streamed == []
@@ -0,0 +1,64 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import io
+
+from app.configs.app_config import AppConfig
+from app.services.output_manager.progress_renderer import ProgressRenderer
+
+
+class TerminalStream(io.StringIO):
+    def isatty(self) -> bool:
+        return True
+
+
+def test_progress_renderer_aggregates_files_into_one_summary(monkeypatch):
+    monkeypatch.setattr(AppConfig.Env, 'progress_summary_interval', 60)
+    stream = io.StringIO()
+    progress = ProgressRenderer()
+    progress.configure('Uploading', stream=stream)
+
+    progress.add_total(3, 3 * 1024)
+    for i in range(3):
+        progress.update(f'file_{i}', 512, f'file_{i}', 1024)
+    progress.finish_file('file_0')
+    progress.close()
+
+    # no summary is printed before the interval, only the final one
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    assert lines[0].startswith('Uploading  50% 1.50kB/3.00kB 1/3 files')
+
+
+def test_progress_renderer_redraws_bar_and_top_files_in_place(monkeypatch):
+    monkeypatch.setattr(AppConfig.Env, 'progress_refresh_interval', 60)
+    stream = TerminalStream()
+    progress = ProgressRenderer()
+    progress.configure('Downloading', top_files=1, stream=stream)
+
+    progress.add_total(2, 1100)
+    progress.update('small', 10, 'small', 100)
+    progress.update('large', 10, 'large', 1000)
+    progress.render()
+    first_draw = stream.getvalue()
+
+    progress.close()
+    final_draw = stream.getvalue()[len(first_draw) :]
+
+    assert first_draw.count('\n') == 1
+    assert 'Downloading |' in first_draw and '0/2 files' in first_draw
+    assert 'large |' in first_draw and 'small' not in first_draw
+    # the final draw goes back to the bar, and clears the active files
+    assert final_draw.startswith('\x1b[1A\r')
+    assert final_draw.endswith('\n')
+
+
+def test_progress_renderer_close_without_transfer_prints_nothing():
+    stream = io.StringIO()
+    progress = ProgressRenderer()
+    progress.configure('Uploading', stream=stream)
+
+    progress.close()
+
+    assert stream.getvalue() == ''
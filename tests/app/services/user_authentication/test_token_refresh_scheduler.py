@@ -0,0 +1,86 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import threading
+import time
+
+from app.configs.app_config import AppConfig
+from app.services.user_authentication.token_refresh_scheduler import TokenRefreshScheduler
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.headers = {'Authorization': 'Bearer old'}
+
+
+def wait_until(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def refresh_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'token-refresh' and thread.is_alive()]
+
+
+def test_next_delay_refreshes_before_token_expiry(mocker):
+    decode_mock = mocker.patch(
+        'app.services.user_authentication.token_manager.SrvTokenManager.decode_access_token',
+        return_value={'iat': 1000, 'exp': 1600},
+    )
+    scheduler = TokenRefreshScheduler()
+
+    assert scheduler.next_delay(now=1000) == 600 - AppConfig.Env.token_warn_need_refresh
+
+    # the short token is refreshed at half of its lifetime
+    decode_mock.return_value = {'iat': 1000, 'exp': 1060}
+    assert scheduler.next_delay(now=1000) == 30
+
+
+def test_next_delay_falls_back_to_interval_without_expiry(mocker):
+    mocker.patch(
+        'app.services.user_authentication.token_manager.SrvTokenManager.decode_access_token',
+        side_effect=ValueError('invalid token'),
+    )
+
+    assert TokenRefreshScheduler().next_delay() == AppConfig.Env.token_refresh_interval
+
+
+def test_subscribe_refreshes_token_and_publishes_headers(mocker):
+    refresh_mock = mocker.patch('app.services.user_authentication.token_manager.SrvTokenManager.refresh')
+    mocker.patch(
+        'app.services.user_authentication.token_refresh_scheduler.UserConfig',
+        return_value=mocker.Mock(access_token='new'),
+    )
+    mocker.patch.object(TokenRefreshScheduler, 'next_delay', return_value=0.01)
+    client = FakeClient()
+    scheduler = TokenRefreshScheduler()
+    scheduler.register(client)
+
+    scheduler.subscribe()
+    try:
+        assert wait_until(lambda: client.headers['Authorization'] == 'Bearer new')
+    finally:
+        scheduler.unsubscribe()
+
+    refresh_mock.assert_called_with(scheduler.azp)
+    assert wait_until(lambda: not refresh_threads())
+
+
+def test_refresh_thread_is_shared_until_last_unsubscribe(mocker):
+    mocker.patch.object(TokenRefreshScheduler, 'next_delay', return_value=60)
+    scheduler = TokenRefreshScheduler()
+
+    scheduler.subscribe()
+    scheduler.subscribe()
+    assert len(refresh_threads()) == 1
+
+    scheduler.unsubscribe()
+    assert len(refresh_threads()) == 1
+
+    scheduler.unsubscribe()
+    assert wait_until(lambda: not refresh_threads())
@@ -2,14 +2,21 @@
 #
 # Contact Indoc Systems for any questions regarding the use of this source code.
 
+import os
+import threading
+
 import pytest
 
 from app.configs.app_config import AppConfig
 from app.models.item import ItemType
+from app.utils.aggregated import batch_generator
 from app.utils.aggregated import check_item_duplication
+from app.utils.aggregated import get_file_in_folder
 from app.utils.aggregated import identify_target_folder
+from app.utils.aggregated import iter_file_in_folder
 from app.utils.aggregated import normalize_input_paths
 from app.utils.aggregated import normalize_join
+from app.utils.aggregated import pipelined_map
 from app.utils.aggregated import search_item
 from app.utils.aggregated import validate_folder_name
 from tests.conftest import decoded_token
@@ -199,3 +206,69 @@ def test_normalize_join():
     expected_result = 'project_code/folder1/folder2/test.txt'
     result = normalize_join(input_paths[0], input_paths[1])
     assert result == expected_result
+
+
+def test_pipelined_map_returns_results_in_order():
+    results = [r for group in pipelined_map(lambda x: x * 2, range(10), 3) for r in group]
+
+    assert results == [x * 2 for x in range(10)]
+
+
+def test_pipelined_map_consumes_items_lazily():
+    started = threading.Event()
+    release = threading.Event()
+
+    def func(x):
+        started.set()
+        release.wait(5)
+        return x
+
+    consumed = []
+    items = (consumed.append(x) or x for x in range(20))
+    results = pipelined_map(func, items, 2)
+
+    release.set()
+    first_group = next(results)
+    results.close()
+
+    assert started.is_set()
+    assert first_group[0] == 0
+    # only the window of items in flight is taken from the iterable
+    assert len(consumed) <= 2 + len(first_group)
+
+
+def test_pipelined_map_raises_error_of_item():
+    def func(x):
+        if x == 3:
+            raise ValueError('failed')
+        return x
+
+    with pytest.raises(ValueError):
+        [r for group in pipelined_map(func, range(5), 2) for r in group]
+
+
+def test_iter_file_in_folder_streams_all_files(tmp_path):
+    (tmp_path / 'a' / 'b').mkdir(parents=True)
+    (tmp_path / 'a' / 'b' / 'file1').write_text('1')
+    (tmp_path / 'a' / 'file2').write_text('2')
+    (tmp_path / 'file3').write_text('3')
+    os.symlink(tmp_path / 'a', tmp_path / 'link_to_folder')
+
+    files = iter_file_in_folder(str(tmp_path))
+
+    assert not isinstance(files, list)
+    expected = []
+    for path, _, names in os.walk(tmp_path):
+        expected.extend(normalize_join(path, name) for name in names)
+    assert sorted(files) == sorted(expected)
+    assert sorted(get_file_in_folder(str(tmp_path))) == sorted(expected)
+
+
+def test_iter_file_in_folder_returns_file_path():
+    assert list(iter_file_in_folder(['file1', 'file2'])) == ['file1', 'file2']
+
+
+def test_batch_generator_accepts_iterator():
+    batches = batch_generator((x for x in range(5)), batch_size=2)
+
+    assert list(batches) == [[0, 1], [2, 3], [4]]
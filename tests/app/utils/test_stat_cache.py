@@ -0,0 +1,75 @@
+# Copyright (C) 2022-2024 Indoc Systems
+#
+# Contact Indoc Systems for any questions regarding the use of this source code.
+
+import os
+
+from app.utils.aggregated import iter_file_in_folder
+from app.utils.stat_cache import StatCache
+from app.utils.stat_cache import getsize
+from app.utils.stat_cache import isdir
+from app.utils.stat_cache import isfile
+from app.utils.stat_cache import parallel_walk
+
+
+def create_tree(root):
+    folders = [root / 'a', root / 'a' / 'b', root / 'c']
+    for folder in folders:
+        folder.mkdir(parents=True)
+    files = [root / 'top.txt', root / 'a' / 'a.txt', root / 'a' / 'b' / 'b.txt', root / 'c' / 'c.txt']
+    for file in files:
+        file.write_text(file.name)
+    (root / 'link').symlink_to(root / 'a', target_is_directory=True)
+
+    return sorted(str(file) for file in files)
+
+
+def test_parallel_walk_returns_same_files_as_os_walk(tmp_path):
+    expected = create_tree(tmp_path)
+    walked = sorted(os.path.join(root, f) for root, _, files in os.walk(tmp_path) for f in files)
+
+    assert walked == expected
+    assert sorted(parallel_walk(str(tmp_path), max_workers=2)) == expected
+
+
+def test_iter_file_in_folder_uses_parallel_walk_when_stat_cache_enabled(tmp_path, mocker):
+    expected = create_tree(tmp_path)
+    StatCache().enabled = True
+    walk_mock = mocker.patch('app.utils.aggregated.parallel_walk', wraps=parallel_walk)
+
+    assert sorted(iter_file_in_folder(str(tmp_path))) == expected
+    walk_mock.assert_called_once_with(str(tmp_path))
+
+
+def test_stat_cache_reuses_the_stat_of_scanned_files(tmp_path, mocker):
+    create_tree(tmp_path)
+    StatCache().enabled = True
+    files = list(parallel_walk(str(tmp_path)))
+
+    stat_mock = mocker.patch('app.utils.stat_cache.os.stat')
+    for file in files:
+        assert getsize(file) == len(os.path.basename(file))
+        assert isfile(file)
+        assert not isdir(file)
+    stat_mock.assert_not_called()
+
+
+def test_stat_cache_reuses_folder_listing(tmp_path, mocker):
+    expected = create_tree(tmp_path)
+    StatCache().enabled = True
+    list(parallel_walk(str(tmp_path)))
+
+    scandir_mock = mocker.patch('app.utils.stat_cache.os.scandir')
+    assert sorted(parallel_walk(str(tmp_path))) == expected
+    scandir_mock.assert_not_called()
+
+
+def test_stat_cache_is_not_used_when_disabled(tmp_path):
+    file = tmp_path / 'file.txt'
+    file.write_text('abc')
+    assert getsize(str(file)) == 3
+
+    file.write_text('abcdef')
+    assert getsize(str(file)) == 6
+    assert isfile(str(file))
+    assert isdir(str(tmp_path))
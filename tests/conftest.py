@@ -4,6 +4,7 @@
 
 import time
 
+import httpx
 import pytest
 
 from app.configs.app_config import AppConfig
@@ -11,15 +12,21 @@ from app.configs.config import Settings
 from app.configs.config import get_settings
 from app.configs.user_config import UserConfig
 from app.models.singleton import Singleton
+from app.services.output_manager.progress_renderer import ProgressRenderer
 
 
 @pytest.fixture(autouse=True)
 def reset_singletons():
     Singleton._instances = {}
+    yield
+    # stop the thread drawing the progress of test
+    progress = Singleton._instances.get(ProgressRenderer)
+    if progress is not None:
+        progress.close()
 
 
 @pytest.fixture(autouse=True)
-def mock_settings(monkeypatch, mocker):
+def mock_settings(monkeypatch, mocker, tmp_path):
     monkeypatch.setattr(AppConfig.Connections, 'url_authn', 'http://service_auth')
     monkeypatch.setattr(AppConfig.Connections, 'url_bff', 'http://bff_cli')
     monkeypatch.setattr(AppConfig.Connections, 'url_dataset', 'http://url_dataset')
@@ -30,6 +37,8 @@ def mock_settings(monkeypatch, mocker):
     monkeypatch.setattr(AppConfig.Connections, 'url_keycloak_realm', 'http://url_keycloak_realm')
     monkeypatch.setattr(AppConfig.Connections, 'url_keycloak', 'http://url_keycloak')
     monkeypatch.setattr(AppConfig.Connections, 'url_portal', 'http://bff_cli')
+    monkeypatch.setattr(AppConfig.Env, 'chunk_hash_cache_path', str(tmp_path / 'chunk_hash.db'))
+    monkeypatch.setattr(AppConfig.Env, 'host_coordinator_path', str(tmp_path / 'coordinator'))
     monkeypatch.setattr(UserConfig, 'username', 'test-user')
     monkeypatch.setattr(UserConfig, 'password', 'test-password')
     monkeypatch.setattr(UserConfig, 'api_key', 'test-api-key')
@@ -95,3 +104,9 @@ def decoded_token():
 pytest_plugins = [
     'tests.fixtures.fake',
 ]
+
+
+def create_status_error(status_code: int, method: str = 'PUT', text: str = '') -> httpx.HTTPStatusError:
+    request = httpx.Request(method, 'http://test.url/presigned')
+    response = httpx.Response(status_code, request=request, text=text)
+    return httpx.HTTPStatusError('error', request=request, response=response)